@@ -0,0 +1,386 @@
+import asyncio
+import json
+import logging
+import ssl
+import time
+from base64 import b64encode
+from async_ws import read_http_head
+from restconf_cache import ResponseCache
+from metrics import RESTCONF_REQUESTS, RESTCONF_LATENCY, restconf_path
+from recording import RECORDER
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 15 # seconds
+RETRY_STATUS_CODES = [500, 502, 503, 504]
+
+class RestconfResponse:
+    """
+    HTTP response of AsyncRestconfClient
+    """
+
+    def __init__(self, status, reason, headers, body):
+        self.status_code = status
+        self.reason = reason
+        self.headers = headers
+        self.content = body
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def json(self):
+        return json.loads(self.content.decode())
+
+class AsyncRestconfClient:
+    """
+    asyncio Restconf client. Uses HTTP/1.1 keep-alive connections to the router, at most max_connections
+    requests run in parallel. Counts new connections (handshakes) and reused connections the same
+    way as restconf_client.RestconfClient.
+    """
+
+    def __init__(self, router_ip, username, password, timeout = DEFAULT_TIMEOUT, retries = 2, backoff_factor = 0.5,
+        max_connections = 2, scheme = "https", cache = None):
+        """
+        Initialize the AsyncRestconfClient object
+
+        Parameters:
+            router_ip (str): router IP address (optionally with :port)
+            username (str): router username
+            password (str): router password
+            timeout (float): request timeout in seconds
+            retries (int): number of retries of a failed request (connection error or 5xx response)
+            backoff_factor (float): delay between retries is backoff_factor * (2 ** (retry number - 1))
+            max_connections (int): maximum number of connections to the router
+            scheme (str): "https" or "http"
+            cache (ResponseCache): cache of the slowly changing responses, None means no caching
+        """
+
+        self.router_ip = router_ip
+        self.timeout = timeout[-1] if isinstance(timeout, (tuple, list)) else timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.scheme = scheme
+        self.cache = cache
+        host, _, port = router_ip.partition(":")
+        self._host = host
+        self._port = int(port) if port else (443 if scheme == "https" else 80)
+        self._auth = "Basic {}".format(b64encode("{}:{}".format(username, password).encode()).decode())
+        self._ssl = None
+        if scheme == "https":
+            self._ssl = ssl.create_default_context()
+            self._ssl.check_hostname = False
+            self._ssl.verify_mode = ssl.CERT_NONE
+        self._idle = [] # idle (reader, writer) connections
+        self._slots = asyncio.Semaphore(max_connections)
+        self._stats = {
+            "requests": 0,
+            "errors": 0,
+            "handshakes": 0,
+            "connection_gets": 0
+        }
+
+    def url(self, module_name, xpath):
+        return "{}://{}/restconf/data/{}:{}".format(self.scheme, self.router_ip, module_name, xpath)
+
+    def path(self, module_name, xpath):
+        return "/restconf/data/{}:{}".format(module_name, xpath)
+
+    async def get(self, module_name, xpath):
+        """
+        Run a restconf GET request.
+
+        Parameters:
+            module_name (str): restconf module name
+            xpath (str): xPath or other restconf parameters for the module query
+
+        Returns:
+            dict: decoded JSON response, None if the request failed
+        """
+
+        router_url = self.url(module_name, xpath)
+        ttl = self.cache.ttl(module_name, xpath) if self.cache is not None else 0
+        entry = None
+        if ttl:
+            data, entry = self.cache.lookup(router_url)
+            if data is not None:
+                logger.debug("Restconf cache hit: %s", router_url)
+                RESTCONF_REQUESTS.inc(path = restconf_path(module_name, xpath), status = "cache")
+                return data
+        logger.info("Restconf URL: {}".format(router_url))
+        self._stats["requests"] += 1
+        path = restconf_path(module_name, xpath)
+        start = time.monotonic()
+        try:
+            response = await self.request("GET", self.path(module_name, xpath), headers = ResponseCache.conditional_headers(entry))
+        except (OSError, asyncio.TimeoutError):
+            self._stats["errors"] += 1
+            RESTCONF_REQUESTS.inc(path = path, status = "error")
+            RECORDER.record("rest", p = self.path(module_name, xpath), s = "error", d = round(time.monotonic() - start, 6))
+            raise
+        finally:
+            RESTCONF_LATENCY.observe(time.monotonic() - start, path = path)
+        logger.info("Response code: {}".format(response.status_code))
+        RESTCONF_REQUESTS.inc(path = path, status = response.status_code)
+        if RECORDER.active:
+            RECORDER.record("rest", p = self.path(module_name, xpath), s = response.status_code, d = round(time.monotonic() - start, 6),
+                b = response.content.decode("utf-8", "replace"), e = response.headers.get("etag"))
+        if response.status_code == 304 and entry is not None:
+            return self.cache.revalidated(router_url, entry, ttl)
+        if response.ok:
+            data = response.json()
+            if ttl:
+                self.cache.store(router_url, data, response.headers.get("etag"), response.headers.get("last-modified"),
+                    ttl, len(response.content))
+            return data
+        self._stats["errors"] += 1
+
+    async def patch(self, module_name, xpath, data):
+        """
+        Run a restconf PATCH request (merge of the configuration). The request is not retried (as in
+        RestconfClient.patch()), the response cache is cleared when the change is accepted.
+
+        Parameters:
+            module_name (str): restconf module name
+            xpath (str): xPath of the modified node
+            data (dict): new content of the node, JSON-encoded
+
+        Returns:
+            bool: True if the router accepted the change
+        """
+
+        logger.info("Restconf PATCH URL: {}".format(self.url(module_name, xpath)))
+        self._stats["requests"] += 1
+        path = restconf_path(module_name, xpath)
+        start = time.monotonic()
+        try:
+            response = await asyncio.wait_for(self._request_once("PATCH", self.path(module_name, xpath),
+                json.dumps(data).encode(), {"Content-Type": "application/yang-data+json"}), self.timeout)
+        except (OSError, asyncio.TimeoutError):
+            self._stats["errors"] += 1
+            RESTCONF_REQUESTS.inc(path = path, status = "error")
+            raise
+        finally:
+            RESTCONF_LATENCY.observe(time.monotonic() - start, path = path)
+        logger.info("Response code: {}".format(response.status_code))
+        RESTCONF_REQUESTS.inc(path = path, status = response.status_code)
+        if response.ok:
+            if self.cache is not None:
+                self.cache.clear()
+            return True
+        self._stats["errors"] += 1
+        logger.error("Restconf PATCH failed: {} {}".format(response.status_code, response.content[:200]))
+        return False
+
+    async def stream(self, module_name, xpath, chunk_size = 16384):
+        """
+        Run a restconf GET request and iterate over the response body without loading it to memory.
+        Responses are not cached. The request is not retried, except once on a new connection
+        if a kept-alive connection was closed by the router before the response (as in request()).
+
+        Parameters:
+            module_name (str): restconf module name
+            xpath (str): xPath or other restconf parameters for the module query
+            chunk_size (int): maximum size of the body parts
+
+        Returns:
+            async generator: response body parts (bytes)
+
+        Raises:
+            ConnectionError: response status is not OK
+        """
+
+        logger.info("Restconf stream URL: {}".format(self.url(module_name, xpath)))
+        self._stats["requests"] += 1
+        path = restconf_path(module_name, xpath)
+        start = time.monotonic()
+        response_status = "error"
+        recorded = [] if RECORDER.active else None
+        request_head = self._request_head("GET", self.path(module_name, xpath), None, None)
+        async with self._slots:
+            reused = bool(self._idle)
+            reader, writer = await self._connection()
+            keep = False
+            try:
+                try:
+                    status, headers = await self._stream_head(reader, writer, request_head)
+                except OSError:
+                    writer.close()
+                    if not reused:
+                        raise
+                    # kept-alive connection was closed by the router, try once more on a new connection
+                    reader, writer = await self._connection(new = True)
+                    status, headers = await self._stream_head(reader, writer, request_head)
+                logger.info("Response code: {}".format(status[1]))
+                response_status = status[1]
+                if status[1] >= 400:
+                    raise ConnectionError("Restconf error: {} {}".format(status[1], status[2]))
+                async for chunk in self._body_chunks(reader, headers, chunk_size):
+                    if recorded is not None:
+                        recorded.append(chunk)
+                    yield chunk
+                keep = headers.get("connection", "").lower() != "close" and ("content-length" in headers
+                    or headers.get("transfer-encoding", "").lower() == "chunked")
+            except (OSError, asyncio.TimeoutError, ValueError):
+                self._stats["errors"] += 1
+                raise
+            finally:
+                RESTCONF_REQUESTS.inc(path = path, status = response_status)
+                RESTCONF_LATENCY.observe(time.monotonic() - start, path = path)
+                if recorded is not None and RECORDER.active:
+                    RECORDER.record("rest", p = self.path(module_name, xpath), s = response_status,
+                        d = round(time.monotonic() - start, 6), b = b"".join(recorded).decode("utf-8", "replace"))
+                if keep:
+                    self._idle.append((reader, writer))
+                else:
+                    writer.close()
+
+    async def _stream_head(self, reader, writer, request_head):
+        writer.write(request_head)
+        await writer.drain()
+        return await asyncio.wait_for(read_http_head(reader), self.timeout)
+
+    async def _body_chunks(self, reader, headers, chunk_size):
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size = int((await asyncio.wait_for(reader.readline(), self.timeout)).split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    await reader.readline()
+                    return
+                while size > 0:
+                    data = await asyncio.wait_for(reader.readexactly(min(size, chunk_size)), self.timeout)
+                    size -= len(data)
+                    yield data
+                await reader.readline()
+        elif "content-length" in headers:
+            remaining = int(headers["content-length"])
+            while remaining > 0:
+                data = await asyncio.wait_for(reader.readexactly(min(remaining, chunk_size)), self.timeout)
+                remaining -= len(data)
+                yield data
+        else:
+            while True:
+                data = await asyncio.wait_for(reader.read(chunk_size), self.timeout)
+                if not data:
+                    return
+                yield data
+
+    async def request(self, method, path, body = None, headers = None):
+        """
+        Send HTTP request with retries.
+
+        Parameters:
+            method (str): HTTP method
+            path (str): URL path
+            body (bytes): request body
+            headers (dict): additional request headers
+
+        Returns:
+            RestconfResponse: response
+        """
+
+        attempt = 0
+        while True:
+            try:
+                response = await asyncio.wait_for(self._request_once(method, path, body, headers), self.timeout)
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.retries:
+                    return response
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                if attempt >= self.retries:
+                    raise
+            attempt += 1
+            await asyncio.sleep(self.backoff_factor * (2 ** (attempt - 1)))
+
+    async def _request_once(self, method, path, body, headers):
+        async with self._slots:
+            reused = bool(self._idle)
+            reader, writer = await self._connection()
+            try:
+                response = await self._exchange(reader, writer, method, path, body, headers)
+            except (OSError, asyncio.IncompleteReadError, ConnectionError):
+                writer.close()
+                if not reused:
+                    raise
+                # kept-alive connection was closed by the router, try once more on a new connection
+                reader, writer = await self._connection(new = True)
+                try:
+                    response = await self._exchange(reader, writer, method, path, body, headers)
+                except BaseException:
+                    writer.close()
+                    raise
+            except BaseException:
+                writer.close()
+                raise
+            if response.headers.get("connection", "").lower() == "close":
+                writer.close()
+            else:
+                self._idle.append((reader, writer))
+            return response
+
+    async def _connection(self, new = False):
+        if not new:
+            self._stats["connection_gets"] += 1
+        while self._idle and not new:
+            reader, writer = self._idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer
+            writer.close()
+        self._stats["handshakes"] += 1
+        return await asyncio.open_connection(self._host, self._port, ssl = self._ssl)
+
+    def _request_head(self, method, path, body, headers):
+        request = ["{} {} HTTP/1.1".format(method, path),
+            "Host: {}".format(self.router_ip),
+            "Authorization: {}".format(self._auth),
+            "Accept: application/yang-data+json",
+            "Connection: keep-alive"]
+        for name, value in (headers or {}).items():
+            request.append("{}: {}".format(name, value))
+        if body is not None:
+            request.append("Content-Length: {}".format(len(body)))
+        return ("\r\n".join(request) + "\r\n\r\n").encode() + (body or b"")
+
+    async def _exchange(self, reader, writer, method, path, body, headers):
+        writer.write(self._request_head(method, path, body, headers))
+        await writer.drain()
+        status, response_headers = await read_http_head(reader)
+        if response_headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    await reader.readline()
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+            content = b"".join(chunks)
+        elif "content-length" in response_headers:
+            content = await reader.readexactly(int(response_headers["content-length"]))
+        elif method == "HEAD" or status[1] in (204, 304):
+            content = b""
+        else:
+            content = await reader.read()
+            response_headers["connection"] = "close"
+        return RestconfResponse(status[1], status[2], response_headers, content)
+
+    def stats(self):
+        """
+        Get the client counters.
+
+        Returns:
+            dict: requests, errors, handshakes (new connections) and reuses (requests over a kept-alive connection)
+        """
+
+        result = dict(self._stats)
+        result["reuses"] = max(0, result["connection_gets"] - result["handshakes"])
+        if self.cache is not None:
+            result["cache"] = self.cache.stats()
+        return result
+
+    def close(self):
+        """
+        Close the kept-alive connections.
+        """
+
+        while self._idle:
+            self._idle.pop()[1].close()
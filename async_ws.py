@@ -0,0 +1,245 @@
+import asyncio
+import hashlib
+import os
+import ssl
+import struct
+from base64 import b64encode
+from urllib.parse import urlsplit
+
+# minimal RFC 6455 websocket implementation for asyncio (text messages, ping/pong, close)
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+
+class ConnectionClosed(Exception):
+    """
+    The websocket connection was closed.
+    """
+    pass
+
+def accept_key(key):
+    """
+    Compute Sec-WebSocket-Accept value for the Sec-WebSocket-Key
+    """
+
+    return b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+
+def mask_payload(payload, mask):
+    """
+    Apply (or remove) the websocket mask to the payload.
+    """
+
+    length = len(payload)
+    if not length:
+        return payload
+    mask_stream = (mask * (length // 4 + 1))[:length]
+    return (int.from_bytes(payload, "big") ^ int.from_bytes(mask_stream, "big")).to_bytes(length, "big")
+
+def encode_frame(opcode, payload, mask = True, fin = True):
+    """
+    Create a websocket frame
+
+    Parameters:
+        opcode (int): frame opcode, for example OP_TEXT
+        payload (bytes): frame payload
+        mask (bool): mask the payload (client to server frames must be masked)
+        fin (bool): final frame of the message
+
+    Returns:
+        bytes: frame
+    """
+
+    header = bytearray([(0x80 if fin else 0) | opcode])
+    mask_bit = 0x80 if mask else 0
+    length = len(payload)
+    if length < 126:
+        header.append(mask_bit | length)
+    elif length < 65536:
+        header.append(mask_bit | 126)
+        header += struct.pack("!H", length)
+    else:
+        header.append(mask_bit | 127)
+        header += struct.pack("!Q", length)
+    if mask:
+        mask_key = os.urandom(4)
+        return bytes(header) + mask_key + mask_payload(payload, mask_key)
+    return bytes(header) + payload
+
+async def read_frame(reader):
+    """
+    Read one websocket frame
+
+    Parameters:
+        reader (asyncio.StreamReader): stream reader
+
+    Returns:
+        tuple: (fin, opcode, payload)
+    """
+
+    try:
+        head = await reader.readexactly(2)
+        fin = bool(head[0] & 0x80)
+        opcode = head[0] & 0x0F
+        masked = head[1] & 0x80
+        length = head[1] & 0x7F
+        if length == 126:
+            length = struct.unpack("!H", await reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", await reader.readexactly(8))[0]
+        if length > MAX_MESSAGE_SIZE:
+            raise ConnectionClosed("Frame too large: {}".format(length))
+        mask_key = await reader.readexactly(4) if masked else None
+        payload = await reader.readexactly(length)
+    except (asyncio.IncompleteReadError, ConnectionError) as e:
+        raise ConnectionClosed("Connection lost: {}".format(e))
+    if mask_key:
+        payload = mask_payload(payload, mask_key)
+    return fin, opcode, payload
+
+class AsyncWebSocket:
+    """
+    Websocket connection for asyncio. Client side is created by connect(), server side
+    (see the codec simulator) by wrapping an accepted connection with mask = False.
+    """
+
+    def __init__(self, reader, writer, mask = True):
+        """
+        Initialize the AsyncWebSocket object
+
+        Parameters:
+            reader (asyncio.StreamReader): stream reader
+            writer (asyncio.StreamWriter): stream writer
+            mask (bool): mask the outgoing frames (True for client side)
+        """
+
+        self._reader = reader
+        self._writer = writer
+        self._mask = mask
+        self.closed = False
+
+    @classmethod
+    async def connect(cls, url, headers = None, timeout = 10):
+        """
+        Open a websocket connection
+
+        Parameters:
+            url (str): ws:// or wss:// URL
+            headers (dict): additional HTTP headers, for example Authorization
+            timeout (float): connection timeout in seconds
+
+        Returns:
+            AsyncWebSocket: connected websocket
+        """
+
+        parts = urlsplit(url)
+        secure = parts.scheme == "wss"
+        ssl_context = None
+        if secure:
+            ssl_context = ssl.create_default_context()
+            ssl_context.check_hostname = False
+            ssl_context.verify_mode = ssl.CERT_NONE
+        port = parts.port or (443 if secure else 80)
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(parts.hostname, port, ssl = ssl_context), timeout)
+        key = b64encode(os.urandom(16)).decode()
+        request = ["GET {} HTTP/1.1".format(parts.path or "/"),
+            "Host: {}".format(parts.netloc),
+            "Upgrade: websocket",
+            "Connection: Upgrade",
+            "Sec-WebSocket-Key: {}".format(key),
+            "Sec-WebSocket-Version: 13"]
+        for name, value in (headers or {}).items():
+            request.append("{}: {}".format(name, value))
+        writer.write(("\r\n".join(request) + "\r\n\r\n").encode())
+        try:
+            status, response_headers = await asyncio.wait_for(read_http_head(reader), timeout)
+        except Exception:
+            writer.close()
+            raise
+        if status[1] != 101 or response_headers.get("sec-websocket-accept") != accept_key(key):
+            writer.close()
+            raise ConnectionError("Websocket handshake failed: {} {}".format(status[1], status[2]))
+        return cls(reader, writer)
+
+    async def send(self, message):
+        """
+        Send a text message
+        """
+
+        if self.closed:
+            raise ConnectionClosed("Websocket closed")
+        data = message.encode() if isinstance(message, str) else message
+        self._writer.write(encode_frame(OP_TEXT, data, self._mask))
+        await self._writer.drain()
+
+    async def recv(self):
+        """
+        Receive a message. Ping frames are answered, fragmented messages are assembled.
+
+        Returns:
+            str: text message
+        """
+
+        fragments = []
+        while True:
+            fin, opcode, payload = await read_frame(self._reader)
+            if opcode == OP_PING:
+                self._writer.write(encode_frame(OP_PONG, payload, self._mask))
+                continue
+            if opcode == OP_PONG:
+                continue
+            if opcode == OP_CLOSE:
+                if not self.closed:
+                    self.closed = True
+                    self._writer.write(encode_frame(OP_CLOSE, payload[:2], self._mask))
+                    self._writer.close()
+                raise ConnectionClosed("Websocket closed by peer")
+            fragments.append(payload)
+            if fin:
+                return b"".join(fragments).decode()
+
+    async def close(self, code = 1000):
+        """
+        Send close frame and close the connection.
+        """
+
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self._writer.write(encode_frame(OP_CLOSE, struct.pack("!H", code), self._mask))
+            await self._writer.drain()
+        except ConnectionError:
+            pass
+        self._writer.close()
+
+async def read_http_head(reader):
+    """
+    Read HTTP status (or request) line and headers
+
+    Returns:
+        tuple: (status line split to 3 parts, dict of lowercase header names -> values)
+    """
+
+    line = (await reader.readline()).decode("latin-1").rstrip("\r\n")
+    if not line:
+        raise ConnectionError("Connection closed")
+    parts = line.split(" ", 2)
+    while len(parts) < 3:
+        parts.append("")
+    try:
+        parts[1] = int(parts[1])
+    except ValueError:
+        pass
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode("latin-1").rstrip("\r\n")
+        if not line:
+            break
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return parts, headers
@@ -0,0 +1,235 @@
+import asyncio
+import itertools
+import json
+import logging
+import re
+import threading
+from base64 import b64encode
+from async_ws import AsyncWebSocket, ConnectionClosed, accept_key, read_http_head
+
+logger = logging.getLogger(__name__)
+
+class FakeCodec:
+    """
+    Local codec simulator. Websocket server speaking the codec's JSON-RPC dialect: each request gets a response,
+    xFeedback/Subscribe returns a feedback id and the subscribed events can be generated by emit().
+    Widget values set by Widget/SetValue are kept and returned by xGet of the widget status.
+    The server runs its own asyncio loop in a background thread, so it can be used by both
+    the threaded (codec_ws.py) and the asyncio (codec_async.py) clients.
+    """
+
+    def __init__(self, host = "127.0.0.1", port = 0, latency = 0.0, username = None, password = None):
+        """
+        Initialize the FakeCodec object
+
+        Parameters:
+            host (str): listening address
+            port (int): listening port, 0 means any free port
+            latency (float): delay [s] before each response
+            username (str): require basic authentication if set
+            password (str): password for the basic authentication
+        """
+
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self._auth = None
+        if username is not None:
+            self._auth = "Basic " + b64encode("{}:{}".format(username, password).encode()).decode()
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._started = threading.Event()
+        self._feedback_ids = itertools.count(1)
+        self._connections = set()
+        self.subscriptions = {} # feedback id -> (websocket, query path)
+        self.widgets = {} # widget id -> value
+        self.panels = {} # panel id -> panel XML
+        self.requests = {} # method -> number of requests
+
+    @property
+    def url(self):
+        return "ws://{}:{}/ws".format(self.host, self.port)
+
+    def start(self):
+        """
+        Start the server thread.
+
+        Returns:
+            str: websocket URL of the server
+        """
+
+        self._thread = threading.Thread(target = self._run, name = "fake_codec", daemon = True)
+        self._thread.start()
+        self._started.wait()
+        return self.url
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port))
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._started.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._server.close()
+            for ws in list(self._connections):
+                ws._writer.close()
+            self._loop.close()
+
+    async def _handle(self, reader, writer):
+        try:
+            status, headers = await read_http_head(reader)
+        except ConnectionError:
+            writer.close()
+            return
+        if self._auth is not None and headers.get("authorization") != self._auth:
+            writer.write(b"HTTP/1.1 401 Unauthorized\r\nContent-Length: 0\r\n\r\n")
+            writer.close()
+            return
+        if headers.get("upgrade", "").lower() != "websocket" or "sec-websocket-key" not in headers:
+            writer.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n")
+            writer.close()
+            return
+        writer.write("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            "Sec-WebSocket-Accept: {}\r\n\r\n".format(accept_key(headers["sec-websocket-key"])).encode())
+        ws = AsyncWebSocket(reader, writer, mask = False)
+        self._connections.add(ws)
+        try:
+            while True:
+                message = json.loads(await ws.recv())
+                if self.latency:
+                    asyncio.ensure_future(self._respond_later(ws, message))
+                else:
+                    await ws.send(json.dumps(self.response(ws, message)))
+        except (ConnectionClosed, ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.discard(ws)
+            for feedback_id in [fid for fid, (sub_ws, query) in self.subscriptions.items() if sub_ws is ws]:
+                del self.subscriptions[feedback_id]
+
+    async def _respond_later(self, ws, message):
+        await asyncio.sleep(self.latency)
+        try:
+            await ws.send(json.dumps(self.response(ws, message)))
+        except (ConnectionClosed, ConnectionError):
+            pass
+
+    def response(self, ws, message):
+        """
+        Create the response to the request
+
+        Parameters:
+            ws (AsyncWebSocket): connection which sent the request
+            message (dict): JSON-RPC request
+
+        Returns:
+            dict: JSON-RPC response
+        """
+
+        method = message.get("method")
+        params = message.get("params", {})
+        self.requests[method] = self.requests.get(method, 0) + 1
+        result = {"status": "OK"}
+        if method == "xFeedback/Subscribe":
+            feedback_id = next(self._feedback_ids)
+            self.subscriptions[feedback_id] = (ws, list(params.get("Query", [])))
+            result = {"Id": feedback_id}
+        elif method == "xFeedback/Unsubscribe":
+            self.subscriptions.pop(params.get("Id"), None)
+        elif method == "xCommand/UserInterface/Extensions/Widget/SetValue":
+            self.widgets[params.get("WidgetId")] = params.get("Value")
+        elif method == "xCommand/UserInterface/Extensions/Panel/Save":
+            self.panels[params.get("PanelId")] = params.get("body")
+            for widget_id in re.findall(r"<WidgetId>\s*(.*?)\s*</WidgetId>", params.get("body", "")):
+                self.widgets[widget_id] = ""
+        elif method == "xGet":
+            result = self.status(params.get("Path", []))
+            if result is None:
+                return {"jsonrpc": "2.0", "id": message.get("id"),
+                    "error": {"code": -32602, "message": "No match on Path argument"}}
+        return {"jsonrpc": "2.0", "id": message.get("id"), "result": result}
+
+    def status(self, path):
+        """
+        Status document of xGet, only the widget values and the system unit are simulated.
+        """
+
+        if path[:4] == ["Status", "UserInterface", "Extensions", "Widget"]:
+            widgets = [{"WidgetId": widget_id, "Value": value, "id": index + 1}
+                for index, (widget_id, value) in enumerate(self.widgets.items())]
+            return {"Status": {"UserInterface": {"Extensions": {"Widget": widgets}}}}
+        if path[:2] == ["Status", "SystemUnit"]:
+            return {"Status": {"SystemUnit": {"ProductId": "Cisco Webex Room Kit Mini (simulated)", "Uptime": 1000}}}
+        return None
+
+    def disconnect(self):
+        """
+        Close all client connections, simulates a network outage. Thread-safe.
+        """
+
+        def close_all():
+            for ws in list(self._connections):
+                ws._writer.close()
+        self._loop.call_soon_threadsafe(close_all)
+
+    def emit(self, path, event, count = 1):
+        """
+        Send an event to the clients subscribed to its path. Thread-safe.
+
+        Parameters:
+            path (list): event path, for example ["Event", "UserInterface", "Extensions", "Widget", "Action"]
+            event: value at the end of the path
+            count (int): number of times the event is sent
+
+        Returns:
+            concurrent.futures.Future: resolved with the number of sent messages
+        """
+
+        return asyncio.run_coroutine_threadsafe(self._emit(path, event, count), self._loop)
+
+    async def _emit(self, path, event, count):
+        body = event
+        for name in reversed(path):
+            body = {name: body}
+        sent = 0
+        for feedback_id, (ws, query) in list(self.subscriptions.items()):
+            if path[:len(query)] != query:
+                continue
+            params = dict(body)
+            params["Id"] = feedback_id
+            data = json.dumps({"jsonrpc": "2.0", "method": "xFeedback/Event", "params": params})
+            try:
+                for _ in range(count):
+                    await ws.send(data)
+                    sent += 1
+            except (ConnectionClosed, ConnectionError):
+                pass
+        return sent
+
+def widget_action(widget_id, action_type = "clicked", value = ""):
+    """
+    Path and value of a widget action event, see FakeCodec.emit()
+    """
+
+    return ["Event", "UserInterface", "Extensions", "Widget", "Action"], {"WidgetId": widget_id, "Type": action_type, "Value": value}
+
+if __name__ == "__main__":
+    import sys
+    import time
+    logging.basicConfig(level = logging.INFO)
+    codec = FakeCodec(port = int(sys.argv[1]) if len(sys.argv) > 1 else 8765)
+    logger.info("Fake codec listening on {}".format(codec.start()))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        codec.stop()
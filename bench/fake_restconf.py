@@ -0,0 +1,290 @@
+import json
+import logging
+import os
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+from base64 import b64encode
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+def self_signed_cert(directory):
+    """
+    Create a self-signed certificate for the simulator (requires openssl command).
+
+    Returns:
+        tuple: (certificate file, key file)
+    """
+
+    cert_file = os.path.join(directory, "cert.pem")
+    key_file = os.path.join(directory, "key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=localhost",
+        "-keyout", key_file, "-out", cert_file], check = True, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+    return cert_file, key_file
+
+def rib_routes(count):
+    """
+    Generate ietf-routing RIB route records
+    """
+
+    for index in range(count):
+        if index == 0:
+            yield {"destination-prefix": "0.0.0.0/0", "source-protocol": "static",
+                "next-hop": {"next-hop-address": "192.168.1.1"}}
+        elif index % 10 == 1:
+            yield {"destination-prefix": "10.{}.{}.0/24".format(index // 65536 % 256, index // 256 % 256),
+                "source-protocol": "direct", "next-hop": {"outgoing-interface": "GigabitEthernet0/0/{}".format(index % 4)}}
+        else:
+            yield {"destination-prefix": "172.{}.{}.{}/32".format(16 + index // 65536 % 16, index // 256 % 256, index % 256),
+                "source-protocol": "ietf-ospf:ospfv2", "next-hop": {"next-hop-address": "10.0.0.{}".format(index % 254 + 1)}}
+
+class FakeRestconf:
+    """
+    Local IOS-XE Restconf simulator (HTTPS with a self-signed certificate, HTTP/1.1 keep-alive).
+    Answers the queries used by the application (see router_info.py) with generated data.
+    The response latency and the payload size (number of routes and memory pools) are configurable.
+    """
+
+    def __init__(self, host = "127.0.0.1", port = 0, latency = 0.0, routes = 10, memory_pools = 2, tls = True,
+        username = "admin", password = "admin", convergence = 0.5):
+        """
+        Initialize the FakeRestconf object
+
+        Parameters:
+            host (str): listening address
+            port (int): listening port, 0 means any free port
+            latency (float): delay [s] before each response
+            routes (int): number of routes in the routing table
+            memory_pools (int): number of memory-statistic records
+            tls (bool): use HTTPS
+            username (str): basic authentication username
+            password (str): basic authentication password
+            convergence (float): delay [s] between a change of the default routes and the new RIB default route
+        """
+
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.routes = routes
+        self.memory_pools = memory_pools
+        self.tls = tls
+        self._auth = "Basic " + b64encode("{}:{}".format(username, password).encode()).decode()
+        self._server = None
+        self._tempdir = None
+        self._lock = threading.Lock()
+        self.requests = {} # path -> number of requests
+        self._started = time.monotonic() # the interface counters grow from the start
+        self.convergence = convergence
+        self.default_route = "GigabitEthernet0/0/0" # outgoing interface of the RIB default route
+        self._next_default = None # (outgoing interface, time of the change) after a PATCH of the routes
+        self.connections = 0
+
+    @property
+    def address(self):
+        """
+        Router address in the form used by the Restconf clients ("host:port")
+        """
+
+        return "{}:{}".format(self.host, self.port)
+
+    def start(self):
+        """
+        Start the server thread.
+
+        Returns:
+            str: router address
+        """
+
+        simulator = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body are written separately, avoid the delayed ACK stalls
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with simulator._lock:
+                    simulator.connections += 1
+
+            def do_GET(self):
+                simulator._handle(self)
+
+            def do_PATCH(self):
+                simulator._patch(self)
+
+            def log_message(self, format, *args):
+                logger.debug("Restconf request: " + format, *args)
+
+        self._server = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self._server.daemon_threads = True
+        if self.tls:
+            self._tempdir = tempfile.TemporaryDirectory()
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(*self_signed_cert(self._tempdir.name))
+            self._server.socket = context.wrap_socket(self._server.socket, server_side = True)
+        self.port = self._server.server_address[1]
+        threading.Thread(target = self._server.serve_forever, name = "fake_restconf", daemon = True).start()
+        return self.address
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._tempdir is not None:
+            self._tempdir.cleanup()
+            self._tempdir = None
+
+    def _handle(self, handler):
+        path = handler.path
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+        if handler.headers.get("Authorization") != self._auth:
+            self._send(handler, 401, b"")
+            return
+        if self.latency:
+            time.sleep(self.latency)
+        if "ietf-routing:routing-state" in path and "route=0.0.0.0%2F0" in path:
+            route = {"destination-prefix": "0.0.0.0/0", "source-protocol": "static",
+                "next-hop": {"outgoing-interface": self.rib_default_route()}}
+            self._send(handler, 200, json.dumps({"ietf-routing:route": [route]}).encode())
+            return
+        if "ietf-routing:routing-state" in path:
+            self._send_chunked(handler, self._rib_body())
+            return
+        data = self.data(path)
+        if data is None:
+            self._send(handler, 404, b"")
+            return
+        body = json.dumps(data).encode()
+        etag = "\"{:x}\"".format(hash(body) & 0xffffffff)
+        if handler.headers.get("If-None-Match") == etag:
+            self._send(handler, 304, b"", {"ETag": etag})
+            return
+        self._send(handler, 200, body, {"ETag": etag})
+
+    def _patch(self, handler):
+        """
+        Change of the static default routes, the route with the lowest distance becomes
+        the RIB default route after the convergence delay. Other configuration changes are accepted and ignored.
+        """
+
+        path = handler.path
+        with self._lock:
+            self.requests["PATCH " + path] = self.requests.get("PATCH " + path, 0) + 1
+        body = handler.rfile.read(int(handler.headers.get("Content-Length", 0)))
+        if handler.headers.get("Authorization") != self._auth:
+            self._send(handler, 401, b"")
+            return
+        if self.latency:
+            time.sleep(self.latency)
+        try:
+            data = json.loads(body)
+        except ValueError:
+            self._send(handler, 400, b"")
+            return
+        if "Cisco-IOS-XE-native:native/ip/route" in path:
+            for route in data.get("Cisco-IOS-XE-native:route", {}).get("ip-route-interface-forwarding-list", []):
+                if route.get("prefix") == "0.0.0.0" and route.get("fwd-list"):
+                    best = min(route["fwd-list"], key = lambda fwd: fwd.get("metric", 1))
+                    with self._lock:
+                        self.rib_default_route()
+                        self._next_default = (best["fwd"], time.monotonic() + self.convergence)
+        self._send(handler, 204, b"")
+
+    def rib_default_route(self):
+        """
+        Outgoing interface of the RIB default route, changed by a PATCH after the convergence delay
+        """
+
+        if self._next_default is not None and time.monotonic() >= self._next_default[1]:
+            self.default_route = self._next_default[0]
+            self._next_default = None
+        return self.default_route
+
+    def _send(self, handler, status, body, headers = None):
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/yang-data+json")
+        handler.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def _send_chunked(self, handler, parts):
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/yang-data+json")
+        handler.send_header("Transfer-Encoding", "chunked")
+        handler.end_headers()
+        for part in parts:
+            handler.wfile.write(b"%x\r\n%s\r\n" % (len(part), part))
+        handler.wfile.write(b"0\r\n\r\n")
+
+    def _rib_body(self, batch = 200):
+        """
+        RIB response generated in parts, so large tables are not held in memory.
+        """
+
+        yield b"{\"ietf-routing:route\": ["
+        records = []
+        for index, route in enumerate(rib_routes(self.routes)):
+            records.append(("," if index else "") + json.dumps(route))
+            if len(records) >= batch:
+                yield "".join(records).encode()
+                records = []
+        records.append("]}")
+        yield "".join(records).encode()
+
+    def data(self, path):
+        """
+        Response data for the Restconf path
+
+        Returns:
+            dict: response, None if the path is not simulated
+        """
+
+        if "Cisco-IOS-XE-memory-oper:memory-statistics" in path:
+            pools = [{"name": "Processor", "total-memory": "1000000000", "used-memory": "400000000", "free-memory": "600000000"}]
+            pools += [{"name": "pool{}".format(index), "total-memory": "1000", "used-memory": "500", "free-memory": "500"}
+                for index in range(1, self.memory_pools)]
+            return {"Cisco-IOS-XE-memory-oper:memory-statistic": pools}
+        if "Cisco-IOS-XE-process-cpu-oper:cpu-usage" in path:
+            return {"Cisco-IOS-XE-process-cpu-oper:cpu-utilization": {"five-seconds": 3, "one-minute": 4, "five-minutes": 5}}
+        if "Cisco-IOS-XE-native:native/ip/route" in path:
+            routes = [{"prefix": "10.{}.{}.0".format(index // 256 % 256, index % 256), "mask": "255.255.255.0",
+                "fwd-list": [{"fwd": "192.168.1.1"}]} for index in range(self.routes)]
+            return {"Cisco-IOS-XE-native:route": {"ip-route-interface-forwarding-list": routes}}
+        if "Cisco-IOS-XE-native:native" in path:
+            return {"Cisco-IOS-XE-native:native": {"version": "17.9", "hostname": "ir1101-sim"}}
+        if "Cisco-IOS-XE-interfaces-oper:interfaces" in path:
+            elapsed = time.monotonic() - self._started
+            interfaces = []
+            for name, bps in (("GigabitEthernet0/0/0", 8e6), ("Cellular0/1/0", 2e6), ("Loopback0", 0)):
+                octets = int(elapsed * bps / 8)
+                interfaces.append({"name": name, "oper-status": "if-oper-state-ready", "statistics": {
+                    "in-octets": str(octets), "out-octets": str(octets // 4), "in-discards": int(elapsed) // 10,
+                    "out-discards": 0, "in-errors": 0, "out-errors": 0}})
+            return {"Cisco-IOS-XE-interfaces-oper:interface": interfaces}
+        if "Cisco-IOS-XE-cellwan-oper:cellwan-oper-data" in path:
+            return {"Cisco-IOS-XE-cellwan-oper:cellwan-radio": [
+                {"cellular-interface": "Cellular0/1/0", "rssi": -67, "rsrp": -95, "rsrq": -10, "snr": 12.5}]}
+        if "Cisco-IOS-XE-device-hardware-oper:device-hardware-data" in path:
+            return {"Cisco-IOS-XE-device-hardware-oper:device-inventory": [
+                {"hw-type": "hw-type-chassis", "part-number": "IR1101-K9"}]}
+        return None
+
+if __name__ == "__main__":
+    import sys
+    logging.basicConfig(level = logging.INFO)
+    router = FakeRestconf(port = int(sys.argv[1]) if len(sys.argv) > 1 else 8443,
+        routes = int(sys.argv[2]) if len(sys.argv) > 2 else 10)
+    logger.info("Fake Restconf listening on https://{}".format(router.start()))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        router.stop()
@@ -0,0 +1,235 @@
+"""
+Startup time and memory footprint of the application, measured in separate processes against the local simulators.
+
+Usage (from the repository root):
+    python -m bench.footprint [--app codec_ws] [--duration 20] [--low-footprint] [--output footprint_report.json]
+        [--compare previous_report.json]
+
+For each run a new Python process is started:
+- "import": imports the application module and reports the import time, RSS and number of threads
+- "session": runs the application (as "python codec_ws.py") connected to the codec and router simulators.
+  Reported are the times from the process start to the codec connection, to the usable panel (event
+  subscription) and to the first router values on the panel, and the RSS and thread count sampled
+  during the session. The session includes button presses and codec reconnects.
+--low-footprint runs the application with FOOTPRINT["active"] (see config_sample.py), so the current build
+can be compared with and without it. The RSS and thread counts are read from /proc (Linux).
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import signal
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+# the application reads config.py, the sample configuration is used if it doesn't exist
+try:
+    import config
+except ImportError:
+    import config_sample as config
+    sys.modules["config"] = config
+
+from bench.fake_codec import FakeCodec, widget_action
+from bench.fake_restconf import FakeRestconf
+from bench.run_bench import git_commit, compare
+
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APPS = ["codec_ws", "codec_async"]
+SAMPLE_INTERVAL = 0.05 # seconds between the /proc samples of the session
+RECONNECTS = 3
+
+# child process: configuration overrides (JSON in argv[2]) and then the import or the run of the application
+CHILD = """
+import json, os, runpy, sys, time
+start = time.perf_counter()
+sys.path.insert(0, os.getcwd())
+try:
+    import config
+except ImportError:
+    import config_sample as config
+    sys.modules["config"] = config
+for name, value in json.loads(sys.argv[2]).items():
+    setattr(config, name, dict(getattr(config, name, {}), **value) if isinstance(value, dict) else value)
+if sys.argv[3] == "import":
+    __import__(sys.argv[1])
+    print(json.dumps({"import_s": time.perf_counter() - start, "modules": len(sys.modules)}), flush = True)
+    sys.stdin.read() # keep the process until the parent reads its status
+else:
+    runpy.run_module(sys.argv[1], run_name = "__main__")
+"""
+
+def process_status(pid = "self"):
+    """
+    Memory and threads of a process from /proc/<pid>/status
+
+    Returns:
+        dict: {"rss_kb", "peak_rss_kb", "threads"}, empty if not available
+    """
+
+    fields = {"VmRSS": "rss_kb", "VmHWM": "peak_rss_kb", "Threads": "threads"}
+    result = {}
+    try:
+        with open("/proc/{}/status".format(pid)) as status:
+            for line in status:
+                name, _, value = line.partition(":")
+                if name in fields:
+                    result[fields[name]] = int(value.split()[0])
+    except (OSError, ValueError):
+        pass
+    return result
+
+def child_command(app, overrides, mode):
+    return [sys.executable, "-c", CHILD, app, json.dumps(overrides), mode]
+
+def measure_import(app, overrides, runs):
+    """
+    Import the application module in new processes
+
+    Returns:
+        dict: best and median import time [s], RSS after the import [kB], number of loaded modules and threads
+    """
+
+    samples = []
+    for _ in range(runs):
+        process = subprocess.Popen(child_command(app, overrides, "import"), cwd = ROOT,
+            stdin = subprocess.PIPE, stdout = subprocess.PIPE, stderr = subprocess.DEVNULL, text = True)
+        # the child prints the import time and waits for the end of its input
+        line = process.stdout.readline()
+        status = process_status(process.pid)
+        process.communicate()
+        if not line:
+            raise RuntimeError("{} import failed".format(app))
+        sample = json.loads(line)
+        sample.update(status)
+        samples.append(sample)
+    times = sorted(sample["import_s"] for sample in samples)
+    return {
+        "runs": runs,
+        "import_best_s": round(times[0], 4),
+        "import_median_s": round(times[len(times) // 2], 4),
+        "modules": samples[-1]["modules"],
+        "rss_kb": min(sample.get("rss_kb", 0) for sample in samples),
+        "threads": samples[-1].get("threads")
+    }
+
+def wait_for(condition, timeout):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+def measure_session(app, overrides, duration):
+    """
+    Run the application against the simulators, press the buttons and drop the codec connection a few times
+
+    Returns:
+        dict: startup milestones [s], RSS [kB] and thread count (at the end of the session and the maximum)
+    """
+
+    codec = FakeCodec()
+    codec.start()
+    router = FakeRestconf(username = config.ROUTER_CONFIG["username"], password = config.ROUTER_CONFIG["password"])
+    router.start()
+    overrides = dict(overrides, CODEC_CONFIG = {"ip": "{}:{}".format(codec.host, codec.port), "min_reconnect_delay": 0.2},
+        TESTING = {"active": True, "router_ip": router.address})
+    samples = []
+    milestones = {}
+    started = time.monotonic()
+    process = subprocess.Popen(child_command(app, overrides, "run"), cwd = ROOT,
+        stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+
+    def sample():
+        status = process_status(process.pid)
+        if status:
+            samples.append(status)
+
+    try:
+        if not wait_for(lambda: codec.requests, 30):
+            raise RuntimeError("{} didn't connect to the codec".format(app))
+        milestones["connected_s"] = time.monotonic() - started
+        if wait_for(lambda: codec.subscriptions, 30):
+            milestones["panel_usable_s"] = time.monotonic() - started
+        codec.emit(["Event", "UserInterface", "Extensions", "Event", "PageOpened"], {"PageId": "page_rtr_info"})
+        if wait_for(lambda: codec.widgets.get("rtr_mem_usage") or codec.widgets.get("rtr_cpu_usage"), 30):
+            milestones["first_router_values_s"] = time.monotonic() - started
+        sample()
+        end = time.monotonic() + duration
+        step = 0
+        while time.monotonic() < end:
+            step += 1
+            if step % 20 == 0:
+                for widget_id in ("sh_ver", "sh_ip_ro", "rt_next"):
+                    codec.emit(*widget_action(widget_id))
+            if step % max(1, int(duration / SAMPLE_INTERVAL) // (RECONNECTS + 1)) == 0 and len(samples) > 1:
+                codec.disconnect()
+            sample()
+            time.sleep(SAMPLE_INTERVAL)
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        router.stop()
+        codec.stop()
+    result = {key: round(value, 3) for key, value in milestones.items()}
+    if samples:
+        result.update({
+            "rss_kb": samples[-1].get("rss_kb"),
+            "peak_rss_kb": max(sample.get("peak_rss_kb", 0) for sample in samples),
+            "threads": samples[-1].get("threads"),
+            "max_threads": max(sample.get("threads", 0) for sample in samples),
+        })
+    result["codec_requests"] = sum(codec.requests.values())
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description = "Startup time and memory footprint of the application")
+    parser.add_argument("--app", choices = APPS, nargs = "+", default = APPS, help = "application modules")
+    parser.add_argument("--duration", type = float, default = 20, help = "session length [s]")
+    parser.add_argument("--imports", type = int, default = 5, help = "number of the import measurements")
+    parser.add_argument("--low-footprint", action = "store_true", help = "run with FOOTPRINT[\"active\"]")
+    parser.add_argument("--output", default = "footprint_report.json", help = "report file")
+    parser.add_argument("--compare", help = "previous report to compare with")
+    args = parser.parse_args()
+
+    logging.basicConfig(level = logging.INFO)
+    # no snapshot file in the repository, the footprint mode is switched on only if requested
+    overrides = {"SNAPSHOT": {"path": None}}
+    if args.low_footprint:
+        overrides["FOOTPRINT"] = {"active": True}
+    report = {
+        "timestamp": datetime.now().isoformat(timespec = "seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {"duration": args.duration, "imports": args.imports, "low_footprint": args.low_footprint},
+        "results": {}
+    }
+    for app in args.app:
+        logger.info("{}: import".format(app))
+        report["results"][app] = {"import": measure_import(app, overrides, args.imports)}
+        logger.info("{}: session of {} s".format(app, args.duration))
+        report["results"][app]["session"] = measure_session(app, overrides, args.duration)
+    with open(args.output, "w") as report_file:
+        json.dump(report, report_file, indent = 2)
+    print(json.dumps(report["results"], indent = 2))
+    print("Report saved to {}".format(args.output))
+    if args.compare:
+        with open(args.compare) as previous_file:
+            previous = json.load(previous_file)
+        print("Comparison with {} ({}):".format(args.compare, previous.get("commit")))
+        for line in compare(previous, report):
+            print("  " + line)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""
+Replay of a recorded session (see recording.py and RECORDING in config.py) against the local simulators,
+no codec or router is needed. The application (codec_ws.py) is driven by the recorded codec events
+(button presses, page open/close), connection drops and router responses (with their latency),
+at the recorded pace or faster.
+
+Usage (from the repository root):
+    python -m bench.replay recording.jsonl.gz [--speed 10] [--session -1] [--output replay_report.json]
+
+The router responses are served on request from the recording in the recorded order per URL,
+the paths which are not in the recording are answered by the Restconf simulator. The poll intervals
+and reconnect delays of the application are not accelerated. The report compares the recorded
+and the replayed traffic and contains the UI dispatch throughput and latency.
+"""
+
+import argparse
+import json
+import logging
+import sys
+import threading
+import time
+from urllib.parse import unquote
+
+# the application reads config.py, the sample configuration is used if it doesn't exist
+try:
+    import config
+except ImportError:
+    import config_sample as config
+    sys.modules["config"] = config
+
+import urllib3
+from recording import read_recording
+from bench.fake_codec import FakeCodec
+from bench.fake_restconf import FakeRestconf
+from bench.run_bench import latency_summary, git_commit
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBE_TIMEOUT = 10 # seconds, wait for the application to subscribe to the events after (re)connect
+
+def load_session(path, index = -1):
+    """
+    Read one recording session, a recording file may contain several sessions (application runs)
+
+    Parameters:
+        path (str): recording file
+        index (int): session index, -1 is the last one
+
+    Returns:
+        list: records of the session
+    """
+
+    sessions = []
+    for record in read_recording(path):
+        if record["k"] == "start" or not sessions:
+            sessions.append([])
+        sessions[-1].append(record)
+    if not sessions:
+        raise ValueError("Recording {} is empty".format(path))
+    return sessions[index]
+
+def feedback_event(params):
+    """
+    Split the xFeedback/Event parameters to the event path and value, see FakeCodec.emit()
+
+    Returns:
+        tuple: (path, value)
+    """
+
+    body = {key: value for key, value in params.items() if key != "Id"}
+    path = []
+    while isinstance(body, dict) and len(body) == 1:
+        key, value = next(iter(body.items()))
+        if not isinstance(value, dict):
+            break
+        path.append(key)
+        body = value
+    return path, body
+
+def timeline(records):
+    """
+    Codec events and connection drops of the session relative to the first connection
+
+    Returns:
+        list: (time [s], "event", (path, value)) and (time [s], "close", None) tuples
+    """
+
+    opened = next((record["t"] for record in records if record["k"] == "open"), None)
+    if opened is None:
+        raise ValueError("No codec connection in the recording")
+    result = []
+    for record in records:
+        if record["t"] < opened:
+            continue
+        if record["k"] == "in":
+            message = json.loads(record["m"])
+            if message.get("method") == "xFeedback/Event":
+                result.append((record["t"] - opened, "event", feedback_event(message["params"])))
+        elif record["k"] == "close":
+            result.append((record["t"] - opened, "close", None))
+    return result
+
+def recorded_counts(records):
+    """
+    Number of the codec requests by method and of the router requests by path in the recording
+    """
+
+    codec = {}
+    router = {}
+    for record in records:
+        if record["k"] == "out":
+            method = json.loads(record["m"]).get("method")
+            codec[method] = codec.get(method, 0) + 1
+        elif record["k"] == "rest":
+            router[unquote(record["p"])] = router.get(unquote(record["p"]), 0) + 1
+    return codec, router
+
+class ReplayRestconf(FakeRestconf):
+    """
+    Restconf simulator which answers with the recorded responses. The responses of each URL
+    are served in the recorded order, the last one is repeated. A recorded connection error
+    closes the connection without a response.
+    """
+
+    def __init__(self, records, speed = 1.0, **kwargs):
+        """
+        Initialize the ReplayRestconf object
+
+        Parameters:
+            records (list): recording session, only the "rest" records are used
+            speed (float): the recorded latencies are divided by the speed
+            kwargs: FakeRestconf parameters
+        """
+
+        super().__init__(**kwargs)
+        self.speed = speed
+        self.responses = {} # URL path -> list of "rest" records
+        for record in records:
+            if record["k"] == "rest":
+                self.responses.setdefault(unquote(record["p"]), []).append(record)
+        self._served = {} # URL path -> number of served responses
+        self.replayed = 0
+
+    def _handle(self, handler):
+        path = unquote(handler.path)
+        responses = self.responses.get(path)
+        if responses is None or handler.headers.get("Authorization") != self._auth:
+            super()._handle(handler)
+            return
+        with self._lock:
+            self.requests[handler.path] = self.requests.get(handler.path, 0) + 1
+            served = self._served.get(path, 0)
+            self._served[path] = served + 1
+            self.replayed += 1
+        record = responses[min(served, len(responses) - 1)]
+        time.sleep(record["d"] / self.speed)
+        if record["s"] == "error":
+            handler.close_connection = True
+            return
+        if record["s"] == 304:
+            if handler.headers.get("If-None-Match"):
+                self._send(handler, 304, b"", {"ETag": record.get("e") or handler.headers.get("If-None-Match")})
+                return
+            # the client has no cached response, serve the last recorded body of the URL
+            record = next((previous for previous in reversed(responses[:served + 1]) if previous["s"] == 200), record)
+        headers = {"ETag": record["e"]} if record.get("e") else None
+        self._send(handler, record["s"] if record["s"] != 304 else 200, record.get("b", "").encode(), headers)
+
+def wait_subscribed(codec, timeout = SUBSCRIBE_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while not codec.subscriptions and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return bool(codec.subscriptions)
+
+def replay(records, speed):
+    """
+    Replay the session against the application
+
+    Parameters:
+        records (list): recording session
+        speed (float): replay speed, 1 is the recorded pace
+
+    Returns:
+        dict: replay results
+    """
+
+    import codec_ws
+    from supervisor import ConnectionSupervisor
+    from codec_rpc import ReconnectBackoff
+
+    events = timeline(records)
+    codec = FakeCodec()
+    url = codec.start()
+    router = ReplayRestconf(records, speed, username = config.ROUTER_CONFIG["username"],
+        password = config.ROUTER_CONFIG["password"])
+    router.start()
+    codec_ws.router_ip = router.address
+    codec_ws._restconf_clients.clear()
+    supervisor = ConnectionSupervisor(url, codec_ws.codec_requests, backoff = ReconnectBackoff(0.1, 1))
+    threading.Thread(target = supervisor.run, name = "replay_app", daemon = True).start()
+    emitted = 0
+    lost = 0
+    drops = 0
+    late = []
+    try:
+        if not wait_subscribed(codec):
+            raise RuntimeError("The application didn't subscribe to the codec events")
+        start = time.monotonic()
+        for offset, kind, data in events:
+            due = start + offset / speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                late.append(-delay)
+            if kind == "close":
+                codec.disconnect()
+                drops += 1
+                time.sleep(0.05)
+                continue
+            if not codec.subscriptions:
+                # reconnecting, the application doesn't get the events until it subscribes again
+                wait_subscribed(codec)
+            path, value = data
+            sent = codec.emit(path, value).result(5)
+            emitted += sent
+            lost += int(not sent)
+        wall_time = time.monotonic() - start
+        # let the last handlers finish
+        deadline = time.monotonic() + 10
+        while codec_ws.ui_dispatcher.pending() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        rpc = codec_ws.active_rpc
+        handlers = codec_ws.ui_dispatcher.stats()
+        recorded_duration = events[-1][0] if events else 0.0
+        codec_recorded, router_recorded = recorded_counts(records)
+        calls = sum(stats["calls"] for stats in handlers.values())
+        result = {
+            "recorded_duration_s": round(recorded_duration, 3),
+            "replay_wall_s": round(wall_time, 3),
+            "speedup": round(recorded_duration / wall_time, 2) if wall_time else None,
+            "schedule_lag": latency_summary(late),
+            "events": {
+                "recorded": sum(1 for event in events if event[1] == "event"),
+                "emitted": emitted,
+                "not_delivered": lost,
+                "connection_drops": drops,
+                "handled": calls,
+                "handled_per_s": round(calls / wall_time, 1) if wall_time else 0.0
+            },
+            "ui_handlers": handlers,
+            "codec_requests": {"recorded": codec_recorded, "replayed": dict(codec.requests)},
+            "router_requests": {"recorded": router_recorded,
+                "replayed": {unquote(path): count for path, count in router.requests.items()},
+                "served_from_recording": router.replayed},
+            "rpc": rpc.rpc_metrics() if rpc is not None else None,
+            "outbound": rpc.outbound_stats() if rpc is not None else None,
+            "supervisor": dict(supervisor.stats)
+        }
+    finally:
+        supervisor.stop()
+        router.stop()
+        codec.stop()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description = "Replay of a recorded codec and router session")
+    parser.add_argument("recording", help = "recording file, see RECORDING in config.py")
+    parser.add_argument("--speed", type = float, default = 1.0, help = "replay speed, 10 is ten times faster than recorded")
+    parser.add_argument("--session", type = int, default = -1, help = "session index in the recording, -1 is the last one")
+    parser.add_argument("--output", default = "replay_report.json", help = "report file")
+    args = parser.parse_args()
+
+    # the application logs every request at INFO level, the simulator has a self-signed certificate
+    logging.getLogger().setLevel(logging.WARNING)
+    urllib3.disable_warnings()
+    logger.setLevel(logging.INFO)
+
+    records = load_session(args.recording, args.session)
+    logger.info("Replaying {} records at {}x".format(len(records), args.speed))
+    report = {
+        "recording": args.recording,
+        "session": args.session,
+        "speed": args.speed,
+        "commit": git_commit(),
+        "results": replay(records, args.speed)
+    }
+    with open(args.output, "w") as report_file:
+        json.dump(report, report_file, indent = 2)
+    print(json.dumps(report["results"], indent = 2))
+    print("Report saved to {}".format(args.output))
+
+if __name__ == "__main__":
+    main()
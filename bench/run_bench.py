@@ -0,0 +1,426 @@
+"""
+Benchmarks of the codec and router communication against the local simulators.
+
+Usage (from the repository root):
+    python -m bench.run_bench [--quick] [--output bench_report.json] [--compare previous_report.json]
+
+The report is a JSON document with the environment, parameters and results of each benchmark.
+With --compare, the results are compared with a previous report.
+"""
+
+import argparse
+import collections
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+# the application reads config.py, the sample configuration is used if it doesn't exist
+try:
+    import config
+except ImportError:
+    import config_sample as config
+    sys.modules["config"] = config
+
+import urllib3
+import websocket
+import codec_ws
+import json_codec
+from widget_cache import WIDGET_SET_VALUE
+from state_snapshot import StateSnapshot
+from route_view import RouteView, iter_json_array, rib_route
+from bench.fake_codec import FakeCodec, widget_action
+from bench.fake_restconf import FakeRestconf, rib_routes
+
+logger = logging.getLogger(__name__)
+
+ROUTE_COUNTS = [10, 1000, 100000]
+
+# codec messages of the serialization microbenchmark
+SAMPLE_EVENT = json.dumps({"jsonrpc": "2.0", "method": "xFeedback/Event", "params": {"Event": {"UserInterface": {"Extensions":
+    {"Widget": {"Action": {"WidgetId": "sh_ver", "Type": "clicked", "Value": "", "id": 1}, "id": 1}, "id": 1}, "id": 1}}, "Id": 1}})
+SAMPLE_RESPONSE = json.dumps({"jsonrpc": "2.0", "id": "42", "result": {"status": "OK"}})
+SAMPLE_PARAMS = {"Path": ["Status", "UserInterface", "Extensions", "Widget"]}
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def latency_summary(values):
+    """
+    Summarize latencies [s]
+
+    Returns:
+        dict: count, average, p50, p95, p99 and maximum in milliseconds
+    """
+
+    return {
+        "count": len(values),
+        "avg_ms": round(1000 * sum(values) / len(values), 3) if values else 0.0,
+        "p50_ms": round(1000 * percentile(values, 0.5), 3),
+        "p95_ms": round(1000 * percentile(values, 0.95), 3),
+        "p99_ms": round(1000 * percentile(values, 0.99), 3),
+        "max_ms": round(1000 * max(values), 3) if values else 0.0
+    }
+
+class CodecConnection:
+    """
+    CodecRPCRegister connected to the codec over websocket-client, as in codec_ws.py
+    """
+
+    def __init__(self, url, max_rate = None):
+        self.rpc = None
+        self._connected = threading.Event()
+        self._app = websocket.WebSocketApp(url, on_open = self._on_open, on_message = self._on_message)
+        self._thread = threading.Thread(target = self._app.run_forever, name = "bench_ws", daemon = True)
+        self._max_rate = max_rate
+
+    def _on_open(self, ws):
+        self.rpc = codec_ws.CodecRPCRegister(ws, max_rate = self._max_rate)
+        self._connected.set()
+
+    def _on_message(self, ws, message):
+        self.rpc.handle_rpc_message(ws, message)
+
+    def open(self, timeout = 10):
+        self._thread.start()
+        if not self._connected.wait(timeout):
+            raise ConnectionError("Codec simulator connection timeout")
+        return self.rpc
+
+    def close(self):
+        if self.rpc is not None:
+            self.rpc.close()
+        self._app.close()
+        self._thread.join(5)
+
+def bench_rpc_round_trip(codec, count, window = 64):
+    """
+    Sequential RPC latency and pipelined RPC throughput
+    """
+
+    conn = CodecConnection(codec.url)
+    rpc = conn.open()
+    try:
+        latencies = []
+        for _ in range(count):
+            start = time.perf_counter()
+            rpc.call("xGet", {"Path": ["Status", "SystemUnit"]})
+            latencies.append(time.perf_counter() - start)
+        # pipelined requests, the window is below the pending request table size (MAX_PENDING_RPC)
+        futures = collections.deque()
+        start = time.perf_counter()
+        for _ in range(count):
+            if len(futures) >= window:
+                futures.popleft().wait()
+            futures.append(rpc.send_rpc_message("xGet", {"Path": ["Status", "SystemUnit"]}))
+        for future in futures:
+            future.wait()
+        elapsed = time.perf_counter() - start
+        result = {
+            "sequential": latency_summary(latencies),
+            "pipelined_rps": round(count / elapsed, 1),
+            "pipeline_window": window,
+            "rpc_metrics": rpc.rpc_metrics()
+        }
+    finally:
+        conn.close()
+    return result
+
+def bench_feedback_dispatch(codec, count):
+    """
+    Rate of the xFeedback/Event messages delivered to the subscription callback
+    """
+
+    conn = CodecConnection(codec.url)
+    rpc = conn.open()
+    received = []
+    done = threading.Event()
+
+    def on_event(codec_rpc, event):
+        received.append(time.perf_counter())
+        if len(received) >= count:
+            done.set()
+
+    try:
+        rpc.feedback_subscribe(["Event", "UserInterface", "Extensions"], on_event)
+        deadline = time.monotonic() + 10
+        while not codec.subscriptions and time.monotonic() < deadline:
+            time.sleep(0.01)
+        path, event = widget_action("bench_button")
+        start = time.perf_counter()
+        codec.emit(path, event, count)
+        done.wait(60)
+        elapsed = (received[-1] if received else time.perf_counter()) - start
+        result = {
+            "events": count,
+            "received": len(received),
+            "events_per_s": round(len(received) / elapsed, 1) if elapsed > 0 else 0.0
+        }
+    finally:
+        conn.close()
+    return result
+
+def per_message_us(function, count):
+    start = time.perf_counter()
+    for index in range(count):
+        function(index)
+    return round(1e6 * (time.perf_counter() - start) / count, 3)
+
+def bench_message_codec(count):
+    """
+    Serialization cost per codec message [us]: the previous implementation (message dict, json.dumps,
+    json.loads and INFO formatting of every event) against json_codec with each installed backend.
+    "stale_event" is an event of an unknown subscription, "saving" is the difference to the default backend.
+    """
+
+    legacy = {
+        "set_value_encode": lambda index: json.dumps({"jsonrpc": "2.0", "method": WIDGET_SET_VALUE,
+            "params": {"WidgetId": "mem_usage", "Value": "40 %"}, "id": str(index)}),
+        "request_encode": lambda index: json.dumps({"jsonrpc": "2.0", "method": "xGet", "params": SAMPLE_PARAMS, "id": str(index)}),
+        "event_decode": lambda index: "UI event: {}".format(json.loads(SAMPLE_EVENT)["params"]),
+        "stale_event": lambda index: json.loads(SAMPLE_EVENT)["params"]["Id"] in (),
+        "response_decode": lambda index: json.loads(SAMPLE_RESPONSE)
+    }
+    result = {"legacy": {name: per_message_us(function, count) for name, function in legacy.items()}}
+    registered = {1: None}
+    for backend in json_codec.BACKENDS:
+        json_codec.set_backend(backend)
+        current = {
+            "set_value_encode": lambda index: json_codec.encode_request(str(index), WIDGET_SET_VALUE,
+                {"WidgetId": "mem_usage", "Value": "40 %"}),
+            "request_encode": lambda index: json_codec.encode_request(str(index), "xGet", SAMPLE_PARAMS),
+            "event_decode": lambda index: any(feedback_id in registered for feedback_id in json_codec.peek(SAMPLE_EVENT)[1]) \
+                and json_codec.loads(SAMPLE_EVENT),
+            "stale_event": lambda index: any(feedback_id in () for feedback_id in json_codec.peek(SAMPLE_EVENT)[1]),
+            "response_decode": lambda index: json_codec.peek(SAMPLE_RESPONSE) and json_codec.loads(SAMPLE_RESPONSE)
+        }
+        result[backend] = {name: per_message_us(function, count) for name, function in current.items()}
+    default = json_codec.set_backend()
+    result["default_backend"] = default
+    result["saving"] = {name: round(result["legacy"][name] - result[default][name], 3) for name in legacy}
+    return result
+
+def bench_polling_cycle(codec, router, cycles):
+    """
+    Duration of the router polling cycle - the memory and CPU poll tasks as run by the poll scheduler
+    (Restconf query, history, trend rows, widget update and state snapshot) - and the time until the codec
+    acknowledged the widget updates. The query plan figures are of the version and inventory lookup,
+    the concurrent queries of the application, measured without the response cache.
+    """
+
+    conn = CodecConnection(codec.url)
+    rpc = conn.open()
+    username, password = config.ROUTER_CONFIG["username"], config.ROUTER_CONFIG["password"]
+    codec_ws._restconf_clients.clear()
+    saved_snapshot = codec_ws.snapshot
+    snapshot_directory = tempfile.TemporaryDirectory()
+    codec_ws.snapshot = StateSnapshot(os.path.join(snapshot_directory.name, "state_snapshot.json"), saved_snapshot.interval)
+    codec_ws.active_rpc = rpc
+    try:
+        cycle_times = []
+        ack_times = []
+        for _ in range(cycles):
+            # widget values change in every cycle, the cache would suppress unchanged values
+            rpc.widgets.invalidate()
+            start = time.perf_counter()
+            codec_ws.poll_memory(router.address, username, password)
+            codec_ws.poll_cpu(router.address, username, password)
+            cycle_times.append(time.perf_counter() - start)
+            while rpc.rpc_metrics()["in_flight"] and time.perf_counter() - start < 10:
+                time.sleep(0.0005)
+            ack_times.append(time.perf_counter() - start)
+        client = codec_ws.restconf_client(router.address, username, password)
+        wall_times = []
+        summed_times = []
+        for _ in range(cycles):
+            if client.cache is not None:
+                client.cache.clear()
+            plan = codec_ws.VERSION_PLAN.run(client)
+            wall_times.append(plan.wall_time)
+            summed_times.append(plan.summed_time)
+        result = {
+            "cycle": latency_summary(cycle_times),
+            "until_acknowledged": latency_summary(ack_times),
+            # concurrent router queries: wall time of the plan against the sum of the query times
+            "version_plan": {
+                "wall": latency_summary(wall_times),
+                "summed": latency_summary(summed_times)
+            },
+            "restconf": client.stats()
+        }
+        client.close()
+    finally:
+        codec_ws.active_rpc = None
+        codec_ws.snapshot = saved_snapshot
+        snapshot_directory.cleanup()
+        codec_ws._restconf_clients.clear()
+        conn.close()
+    return result
+
+def bench_route_render(router, route_count, page_size = 10):
+    """
+    Rendering of the first and the last page of the routing table: parsing only (in-memory document)
+    and end-to-end from the Restconf simulator
+    """
+
+    document = json.dumps({"ietf-routing:route": list(rib_routes(route_count))})
+    chunks = [document[index:index + 16384] for index in range(0, len(document), 16384)]
+    view = RouteView(page_size)
+    start = time.perf_counter()
+    tracemalloc.start()
+    view.render(rib_route(route) for route in iter_json_array(chunks, "ietf-routing:route"))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    parse_time = time.perf_counter() - start
+    del document, chunks
+
+    username, password = config.ROUTER_CONFIG["username"], config.ROUTER_CONFIG["password"]
+    codec_ws._restconf_clients.clear()
+    router.routes = route_count
+    try:
+        view = RouteView(page_size)
+        start = time.perf_counter()
+        page, status = view.render(codec_ws.get_routes(router.address, username, password))
+        first_page_time = time.perf_counter() - start
+        view.page = view.pages - 1
+        start = time.perf_counter()
+        view.render(codec_ws.get_routes(router.address, username, password))
+        last_page_time = time.perf_counter() - start
+    finally:
+        for client in codec_ws._restconf_clients.values():
+            client.close()
+        codec_ws._restconf_clients.clear()
+    return {
+        "routes": route_count,
+        "status": status,
+        "parse_render_ms": round(1000 * parse_time, 3),
+        "parse_render_peak_kb": round(peak / 1024, 1),
+        "routes_per_s": round(route_count / parse_time, 1) if parse_time > 0 else 0.0,
+        "end_to_end_first_page_ms": round(1000 * first_page_time, 3),
+        "end_to_end_last_page_ms": round(1000 * last_page_time, 3)
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output = True, text = True,
+            cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip()
+    except OSError:
+        return None
+
+def run(args):
+    """
+    Run the benchmarks
+
+    Returns:
+        dict: report
+    """
+
+    rpc_count = 200 if args.quick else 2000
+    event_count = 500 if args.quick else 5000
+    cycles = 10 if args.quick else 50
+    message_count = 5000 if args.quick else 50000
+    route_counts = [count for count in args.routes if count <= 1000] if args.quick else args.routes
+    report = {
+        "timestamp": datetime.now().isoformat(timespec = "seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {
+            "rpc_count": rpc_count,
+            "event_count": event_count,
+            "polling_cycles": cycles,
+            "codec_messages": message_count,
+            "codec_latency": args.codec_latency,
+            "router_latency": args.router_latency,
+            "route_counts": route_counts
+        },
+        "results": {}
+    }
+    codec = FakeCodec(latency = args.codec_latency)
+    codec.start()
+    router = FakeRestconf(latency = args.router_latency, username = config.ROUTER_CONFIG["username"],
+        password = config.ROUTER_CONFIG["password"])
+    router.start()
+    try:
+        results = report["results"]
+        logger.info("RPC round trip, {} requests".format(rpc_count))
+        results["rpc_round_trip"] = bench_rpc_round_trip(codec, rpc_count)
+        logger.info("Feedback dispatch, {} events".format(event_count))
+        results["feedback_dispatch"] = bench_feedback_dispatch(codec, event_count)
+        logger.info("Message serialization, {} messages".format(message_count))
+        results["message_codec"] = bench_message_codec(message_count)
+        logger.info("Polling cycle, {} cycles".format(cycles))
+        results["polling_cycle"] = bench_polling_cycle(codec, router, cycles)
+        for route_count in route_counts:
+            logger.info("Route rendering, {} routes".format(route_count))
+            results["route_render_{}".format(route_count)] = bench_route_render(router, route_count)
+    finally:
+        router.stop()
+        codec.stop()
+    return report
+
+def flatten(data, prefix = ""):
+    result = {}
+    for key, value in data.items():
+        name = "{}.{}".format(prefix, key) if prefix else key
+        if isinstance(value, dict):
+            result.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            result[name] = value
+    return result
+
+def compare(previous, current):
+    """
+    Compare the numeric results of two reports
+
+    Returns:
+        list: lines "name: previous -> current (change %)"
+    """
+
+    old = flatten(previous.get("results", {}))
+    new = flatten(current.get("results", {}))
+    lines = []
+    for name in sorted(set(old) & set(new)):
+        change = "{:+.1f}%".format(100 * (new[name] - old[name]) / old[name]) if old[name] else "n/a"
+        lines.append("{}: {} -> {} ({})".format(name, old[name], new[name], change))
+    return lines
+
+def main():
+    parser = argparse.ArgumentParser(description = "Codec and router communication benchmarks")
+    parser.add_argument("--quick", action = "store_true", help = "fewer iterations, routing tables up to 1000 routes")
+    parser.add_argument("--output", default = "bench_report.json", help = "report file")
+    parser.add_argument("--compare", help = "previous report to compare with")
+    parser.add_argument("--codec-latency", type = float, default = 0.0, help = "simulated codec response latency [s]")
+    parser.add_argument("--router-latency", type = float, default = 0.0, help = "simulated Restconf response latency [s]")
+    parser.add_argument("--routes", type = int, nargs = "+", default = ROUTE_COUNTS, help = "routing table sizes")
+    args = parser.parse_args()
+
+    # the application logs every request at INFO level, the simulator has a self-signed certificate
+    logging.getLogger().setLevel(logging.WARNING)
+    urllib3.disable_warnings()
+    logger.setLevel(logging.INFO)
+
+    report = run(args)
+    with open(args.output, "w") as report_file:
+        json.dump(report, report_file, indent = 2)
+    print(json.dumps(report["results"], indent = 2))
+    print("Report saved to {}".format(args.output))
+    if args.compare:
+        with open(args.compare) as previous_file:
+            previous = json.load(previous_file)
+        print("Comparison with {} ({}):".format(args.compare, previous.get("commit")))
+        for line in compare(previous, report):
+            print("  " + line)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,692 @@
+import sys
+import time
+START_TIME = time.monotonic() # application start, see first_paint
+import logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s  [%(levelname)7s]  [%(module)s.%(name)s.%(funcName)s]:%(lineno)s %(message)s",
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+
+import asyncio
+import signal
+from base64 import b64encode
+import config
+from config import CODEC_CONFIG, ROUTER_CONFIG, TESTING
+from codec_ui import ROUTER_PANEL, ROUTER_PANEL_ID, ROUTER_INFO_PAGE, BUTTON_COLORS, LINK_WIDGETS, LINK_RADIO_WIDGET
+from codec_ui import WAN_PATH_WIDGET
+from codec_rpc import RPCError, RPCTimeoutError, DEFAULT_RPC_TIMEOUT, MAX_PENDING_RPC
+from codec_rpc import FeedbackRegistration, feedback_capacity, MAX_FEEDBACK_REGISTRATIONS
+from codec_rpc import AsyncOutboundQueue, PRIORITY_INTERACTIVE, PRIORITY_NORMAL, MAX_OUTBOUND_QUEUE
+from codec_rpc import ReconnectBackoff, MIN_RECONNECT_DELAY, MAX_RECONNECT_DELAY, STABLE_CONNECTION
+from rpc_register import RPCRegister
+from widget_cache import WidgetStateCache, PanelRegistry, status_widgets
+import metrics
+from router_info import get_default_gateway_linux, format_router_version
+from router_info import MEMORY_QUERY, CPU_QUERY, ROUTES_QUERY, RIB_QUERY, VERSION_QUERY, INVENTORY_QUERY, QUERY_TTL
+from metric_history import MetricHistory
+from state_snapshot import StateSnapshot, FirstPaint, DEFAULT_SNAPSHOT_INTERVAL
+from route_view import RouteView, JSONArrayStream, rib_route, native_route, DEFAULT_PAGE_SIZE
+from ui_dispatch import AsyncUIDispatcher, MAX_UI_PENDING
+from poll_scheduler import PollScheduler, DEFAULT_JITTER, DEFAULT_LATENCY_THRESHOLD, DEFAULT_CPU_THRESHOLD
+from restconf_cache import ResponseCache
+from async_ws import AsyncWebSocket, ConnectionClosed
+from async_restconf import AsyncRestconfClient, DEFAULT_TIMEOUT
+from query_plan import QueryPlan, DEFAULT_DEADLINE
+from link_monitor import LinkMonitor, link_plan, DEFAULT_INTERFACES, DEFAULT_INTERVAL, DEFAULT_HIDDEN_INTERVAL
+from wan_switch import wan_switch_config
+from footprint import FOOTPRINT_MONITOR, footprint_limits
+from profiling import PROFILER
+from recording import RECORDER, DEFAULT_RECORDING_PATH
+import panel_status
+
+# asyncio version of codec_ws.py - single thread, the same panel behaviour. Start with: python codec_async.py
+
+logger = logging.getLogger(__name__)
+
+UI_CONFIG = getattr(config, "UI", {})
+POLLING = getattr(config, "POLLING", {})
+HISTORY = getattr(config, "HISTORY", {})
+SNAPSHOT = getattr(config, "SNAPSHOT", {})
+PROFILING = getattr(config, "PROFILING", {})
+RECORDING = getattr(config, "RECORDING", {})
+LINK_MONITOR = getattr(config, "LINK_MONITOR", {})
+WAN_SWITCH = getattr(config, "WAN_SWITCH", {})
+FOOTPRINT = getattr(config, "FOOTPRINT", {})
+
+# queue, table and connection pool sizes, smaller in the low-footprint mode, see footprint.py
+LIMITS = footprint_limits(FOOTPRINT)
+
+# independent router queries run concurrently, see query_plan.py
+VERSION_PLAN = QueryPlan("version", {"version": VERSION_QUERY, "inventory": INVENTORY_QUERY},
+    deadline = ROUTER_CONFIG.get("query_deadline", DEFAULT_DEADLINE))
+LINK_PLAN = link_plan(LINK_MONITOR, deadline = ROUTER_CONFIG.get("query_deadline", DEFAULT_DEADLINE))
+
+class RouterState:
+    """
+    Router state of the single codec app, created by main(): polling, metric histories, link monitor,
+    WAN path switchover, state snapshot and router identity. The multi-codec version (multi_codec.py)
+    keeps its state per router (RouterHub) and per codec (CodecTenant) instead.
+    """
+
+    def __init__(self, restconf):
+        """
+        Initialize the RouterState object, the state snapshot is loaded
+
+        Parameters:
+            restconf (AsyncRestconfClient): router client
+        """
+
+        self.restconf = restconf
+        self.scheduler = PollScheduler(jitter = POLLING.get("jitter", DEFAULT_JITTER),
+            latency_threshold = POLLING.get("latency_threshold", DEFAULT_LATENCY_THRESHOLD),
+            cpu_threshold = POLLING.get("cpu_threshold", DEFAULT_CPU_THRESHOLD))
+        # router CPU and memory utilization history, see panel_status.trend_values()
+        self.cpu_history = MetricHistory("cpu", directory = HISTORY.get("directory"))
+        self.memory_history = MetricHistory("memory", directory = HISTORY.get("directory"))
+        # WAN interface throughput and LTE signal, see codec_ws.start_link_monitor()
+        self.link_monitor = LinkMonitor(LINK_MONITOR.get("interfaces", DEFAULT_INTERFACES)[:len(LINK_WIDGETS)])
+        # WAN path switchover with the history of the convergence times, see codec_ws.wan_path_switch()
+        self.wan_switch = wan_switch_config(WAN_SWITCH)
+        self.snapshot = StateSnapshot(SNAPSHOT.get("path"), SNAPSHOT.get("interval", DEFAULT_SNAPSHOT_INTERVAL))
+        self.first_paint = FirstPaint(START_TIME)
+        self.boot_state = self.snapshot.load() # state snapshot loaded on startup
+        self.saved_panels = PanelRegistry() # panels saved to the codec, kept across reconnects
+        self.saved_panels.load(self.boot_state.get("panels", {}))
+        self.router_identity = None # router hostname, model and version, see refresh_router_identity()
+
+    def set_identity(self, identity):
+        self.router_identity = identity
+
+    def page_event(self, event):
+        """
+        Handle panel page open/close event. The router is polled faster while the Router Info page is open.
+        """
+
+        visible = panel_status.page_visible(event)
+        if visible is not None:
+            self.scheduler.set_visible(visible)
+
+    def save_snapshot(self, codec_rpc = None, force = False):
+        """
+        Write the state snapshot (rate-limited), see panel_status.save_snapshot()
+        """
+
+        panel_status.save_snapshot(self.snapshot, codec_rpc, self.router_identity, self.saved_panels, force = force)
+
+    def close(self):
+        self.restconf.close()
+        self.cpu_history.close()
+        self.memory_history.close()
+
+class AsyncCodecRPC(RPCRegister):
+    """
+    asyncio version of codec_ws.CodecRPCRegister. Uses the same message register, priorities
+    and callback model (see rpc_register.py), callbacks can be plain functions or coroutine functions.
+    """
+
+    def __init__(self, ws, rpc_timeout = DEFAULT_RPC_TIMEOUT, max_pending = MAX_PENDING_RPC, max_rate = None,
+        max_queue = MAX_OUTBOUND_QUEUE, max_feedback = MAX_FEEDBACK_REGISTRATIONS):
+        """
+        Initialize the AsyncCodecRPC object
+
+        Parameters:
+            ws (AsyncWebSocket): websocket connection
+            rpc_timeout (float): default timeout of the RPC requests in seconds
+            max_pending (int): maximum number of in-flight RPC requests
+            max_rate (float): maximum number of messages per second sent to the codec, None means no limit
+            max_queue (int): maximum outbound queue depth, see OutboundQueue
+            max_feedback (int): maximum number of feedback subscriptions
+        """
+
+        super().__init__(rpc_timeout, max_pending, max_feedback)
+        self._ws = ws
+        self._outbound = AsyncOutboundQueue(self._send, max_rate = max_rate, max_queue = max_queue, on_error = self._send_failed)
+        self.widgets = WidgetStateCache(self)
+
+    async def _send(self, data):
+        RECORDER.record("out", m = data)
+        await self._ws.send(data)
+
+    async def call(self, method, params, timeout = None, priority = PRIORITY_NORMAL):
+        """
+        Send message to the codec and wait for the response.
+
+        Returns:
+            dict: result part of the response
+
+        Raises:
+            RPCTimeoutError: no response before the timeout
+            RPCError: codec responded with an error
+        """
+
+        future = self.send_rpc_message(method, params, timeout = timeout, priority = priority)
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), future.deadline - time.monotonic())
+        except asyncio.TimeoutError:
+            self.expire_requests()
+            raise RPCTimeoutError("No response to {} #{}".format(method, future.msg_id), future.msg_id)
+
+    async def feedback_subscribe(self, params, callback):
+        """
+        Set callback for codec feedback, called in the form: callback(codec_rpc, reponse_parameters)
+
+        Parameters:
+            params (list): xPath for which we want to receive a feedback
+            callback: callback function or coroutine function
+        """
+
+        feedback_capacity(len(self._feedback_register), self.max_feedback)
+        response = await self.call("xFeedback/Subscribe", {"Query": params})
+        logger.info("Feedback register response: {}".format(response))
+        self._feedback_register[response["Id"]] = FeedbackRegistration(callback, params)
+
+    async def feedback_subscribe_all(self, subscriptions):
+        """
+        Subscribe for multiple feedbacks in one round trip, the requests are sent concurrently.
+
+        Parameters:
+            subscriptions (list): (xPath, callback) tuples, see feedback_subscribe()
+
+        Returns:
+            int: number of successful subscriptions
+        """
+
+        results = await asyncio.gather(*[self.feedback_subscribe(params, callback) for params, callback in subscriptions],
+            return_exceptions = True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error("Feedback subscribe failed: {}".format(result))
+        return len([result for result in results if not isinstance(result, Exception)])
+
+    def _run_callback(self, callback, *args):
+        try:
+            result = callback(self, *args)
+            if asyncio.iscoroutine(result):
+                asyncio.ensure_future(result)
+        except Exception as e:
+            logger.error("RPC callback exception: {}".format(e))
+
+    async def run(self):
+        """
+        Run the receiver, writer and request expiration tasks until the connection is closed.
+        """
+
+        tasks = [asyncio.ensure_future(self._reader()), asyncio.ensure_future(self._outbound.run()),
+            asyncio.ensure_future(self._expiry())]
+        try:
+            done, pending = await asyncio.wait(tasks, return_when = asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions = True)
+            self.drain_requests()
+
+    async def _reader(self):
+        while True:
+            self.handle_message(await self._ws.recv())
+
+    async def _expiry(self):
+        while True:
+            await asyncio.sleep(1)
+            self.expire_requests()
+
+class AsyncUIHandlers:
+    """
+    UI button handlers running as tasks, see AsyncUIDispatcher. While a handler runs, repeated actions
+    on its widget are dropped or coalesced like in codec_ws.py.
+    """
+
+    def __init__(self, restconf, page_handler, switch, page_size = DEFAULT_PAGE_SIZE, max_pending = MAX_UI_PENDING,
+        on_identity = None):
+        """
+        Initialize the AsyncUIHandlers object
+
+        Parameters:
+            restconf (AsyncRestconfClient): router client
+            page_handler: function called with the panel page open/close event, for example RouterState.page_event()
+            switch (WanSwitch): WAN path switchover of the router
+            page_size (int): number of routes on a page of the routing table
+            max_pending (int): maximum number of running handlers
+            on_identity: function called with the router identity shown by the Show Version button,
+                for example RouterState.set_identity()
+        """
+
+        self.restconf = restconf
+        self.page_handler = page_handler
+        self.wan_switch = switch
+        self.on_identity = on_identity
+        self.route_view = RouteView(page_size)
+        self._route_lock = asyncio.Lock()
+        self.dispatcher = AsyncUIDispatcher(max_pending = max_pending)
+        self.dispatcher.register("sh_ver", "clicked", self.show_version)
+        self.dispatcher.register("sh_ip_ro", "clicked", self.show_ip_route)
+        self.dispatcher.register("rt_prev", "clicked", self.route_page)
+        self.dispatcher.register("rt_next", "clicked", self.route_page)
+        self.dispatcher.register("rt_filter", "released", self.route_filter, coalesce = True)
+        self.dispatcher.register("rt_prefix", "clicked", self.route_prefix_input)
+        self.dispatcher.register("rt_prefix", "text_input", self.route_prefix, coalesce = True)
+        self.dispatcher.register(WAN_PATH_WIDGET, "released", self.wan_path_switch, coalesce = True)
+
+    def ui_event(self, codec_rpc, event):
+        """
+        Handle Event/UserInterface/Extensions event. The function is set as a callback for xFeedback/Subscribe.
+        """
+
+        logger.debug("UI event: %s", event)
+        try:
+            extensions = event["Event"]["UserInterface"]["Extensions"]
+            if "Event" in extensions:
+                self.page_handler(extensions["Event"])
+                return
+            action = extensions["Widget"]["Action"]
+        except KeyError:
+            logger.info("Action not found in Event")
+            return
+        self.dispatcher.dispatch(codec_rpc, action)
+
+    def text_input_event(self, codec_rpc, event):
+        """
+        Handle Event/UserInterface/Message/TextInput/Response event. The response is handled
+        as a "text_input" action of the widget which opened the text input (FeedbackId).
+        """
+
+        logger.debug("Text input event: %s", event)
+        try:
+            response = event["Event"]["UserInterface"]["Message"]["TextInput"]["Response"]
+            action = {"WidgetId": response["FeedbackId"], "Type": "text_input", "Value": response.get("Text", "")}
+        except KeyError:
+            logger.info("Response not found in Event")
+            return
+        self.dispatcher.dispatch(codec_rpc, action)
+
+    def pending(self):
+        return self.dispatcher.pending()
+
+    def stats(self):
+        return self.dispatcher.stats()
+
+    async def show_version(self, codec_rpc, action):
+        identity = await get_router_version(self.restconf)
+        if self.on_identity is not None:
+            self.on_identity(identity)
+        codec_rpc.widgets.set_value("show_result_1", identity, flush = True, priority = PRIORITY_INTERACTIVE)
+
+    async def show_routes(self, codec_rpc):
+        """
+        Display current page of the routing table. The operational RIB is streamed and parsed as it arrives,
+        the configured static routes are used if the RIB is not available.
+        """
+
+        async with self._route_lock:
+            view = self.route_view
+            view.begin()
+            parser = JSONArrayStream("ietf-routing:route")
+            started = False
+            stream = self.restconf.stream(*RIB_QUERY)
+            try:
+                # read the body to the end, so the connection can be reused
+                async for chunk in stream:
+                    for route in parser.feed(chunk):
+                        started = True
+                        view.add(rib_route(route))
+            except (OSError, asyncio.TimeoutError, ValueError) as e:
+                if started:
+                    raise
+                logger.info("Operational RIB not available, using static routes: {}".format(e))
+                routing_res = await self.restconf.get(*ROUTES_QUERY)
+                for route in routing_res["Cisco-IOS-XE-native:route"]["ip-route-interface-forwarding-list"]:
+                    view.add(native_route(route))
+            finally:
+                await stream.aclose()
+            page, status = view.result()
+        codec_rpc.widgets.set_value("show_result_1", page, priority = PRIORITY_INTERACTIVE)
+        codec_rpc.widgets.set_value("rt_page", status, flush = True, priority = PRIORITY_INTERACTIVE)
+
+    async def show_ip_route(self, codec_rpc, action):
+        self.route_view.page = 0
+        await self.show_routes(codec_rpc)
+
+    async def route_page(self, codec_rpc, action):
+        if action["WidgetId"] == "rt_prev":
+            self.route_view.prev_page()
+        else:
+            self.route_view.next_page()
+        await self.show_routes(codec_rpc)
+
+    async def route_filter(self, codec_rpc, action):
+        self.route_view.set_filter(kind = action.get("Value"))
+        await self.show_routes(codec_rpc)
+
+    async def route_prefix_input(self, codec_rpc, action):
+        codec_rpc.send_rpc_message("xCommand/UserInterface/Message/TextInput/Display",
+            {"FeedbackId": "rt_prefix", "Title": "Route filter", "Text": "Prefix or address, empty to show all",
+            "InputText": str(self.route_view.route_filter.prefix or ""), "SubmitText": "Filter"}, priority = PRIORITY_INTERACTIVE)
+
+    async def route_prefix(self, codec_rpc, action):
+        self.route_view.set_filter(prefix = action.get("Value", ""))
+        await self.show_routes(codec_rpc)
+
+    async def wan_path_switch(self, codec_rpc, action):
+        """
+        WAN path selection handler, see codec_ws.wan_path_switch()
+        """
+
+        path = action.get("Value")
+        if panel_status.show_wan_switching(codec_rpc, self.wan_switch, path):
+            result = await self.wan_switch.switch_async(self.restconf, path)
+            panel_status.show_wan_result(codec_rpc, self.wan_switch, result)
+
+async def get_router_version(restconf):
+    """
+    Get the router hostname, model and version formatted to a string. The queries run concurrently
+    under the plan deadline, see codec_ws.get_router_version().
+    """
+
+    result = await VERSION_PLAN.run_async(restconf)
+    if result.get("version") is None:
+        raise ValueError("Router version not available: {}".format(result.stats()))
+    return format_router_version(result.get("version"), result.get("inventory"))
+
+async def refresh_router_identity(codec_rpc, state):
+    """
+    Get the router identity for the state snapshot, replace the stale one on the panel, see codec_ws.refresh_router_identity()
+
+    Parameters:
+        codec_rpc (AsyncCodecRPC): codec connection
+        state (RouterState): router state, the stale identity comes from its boot snapshot
+    """
+
+    stale = state.boot_state.get("router")
+    try:
+        state.router_identity = await get_router_version(state.restconf)
+    except (OSError, asyncio.TimeoutError, KeyError, ValueError) as e:
+        logger.error("Router identity exception: {}".format(e))
+        return
+    if stale is not None and state.router_identity != stale:
+        logger.info("Router identity changed: {} -> {}".format(stale, state.router_identity))
+        if codec_rpc.widgets.values(["show_result_1"]).get("show_result_1") == stale:
+            codec_rpc.widgets.set_value("show_result_1", state.router_identity, flush = True)
+    state.save_snapshot(codec_rpc)
+
+async def show_router_panel(codec_rpc):
+    """
+    Pop-up the router control panel on the codec's touch interface.
+    """
+
+    await asyncio.sleep(2) # safety delay after deployment
+    logger.info("Show router panel")
+    codec_rpc.send_rpc_message("xCommand/UserInterface/Extensions/Panel/Open",
+        {"PanelId": "router", "PageId": ROUTER_INFO_PAGE})
+
+async def periodic_router_info(codec_rpc, state):
+    """
+    Poll the router and send the information to the codec's touch panel, each metric at its own interval
+    (see POLLING in config.py). Runs until cancelled.
+
+    Parameters:
+        codec_rpc (AsyncCodecRPC): codec connection
+        state (RouterState): router client, poll scheduler and metric histories
+    """
+
+    restconf = state.restconf
+    cpu_history, memory_history = state.cpu_history, state.memory_history
+
+    async def poll_memory():
+        mem_stat = await restconf.get(*MEMORY_QUERY)
+        values = panel_status.memory_values(mem_stat.get("Cisco-IOS-XE-memory-oper:memory-statistic") if mem_stat else None,
+            memory_history)
+        panel_status.show_status(codec_rpc, values, cpu_history, memory_history, HISTORY, state.first_paint)
+        state.save_snapshot(codec_rpc)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Restconf client stats: %s", restconf.stats())
+
+    async def poll_cpu():
+        cpu_stat = await restconf.get(*CPU_QUERY)
+        cpu_info = cpu_stat.get("Cisco-IOS-XE-process-cpu-oper:cpu-utilization") if cpu_stat else None
+        if cpu_info:
+            state.scheduler.report_load(cpu_info["five-seconds"])
+        panel_status.show_status(codec_rpc, panel_status.cpu_values(cpu_info, cpu_history), cpu_history, memory_history,
+            HISTORY, state.first_paint)
+        state.save_snapshot(codec_rpc)
+
+    async def poll_link():
+        link = await LINK_PLAN.run_async(restconf)
+        state.link_monitor.update(link.get("interfaces"), link.get("radio"))
+        panel_status.set_values(codec_rpc, state.link_monitor.widget_values(LINK_WIDGETS, LINK_RADIO_WIDGET), flush = True)
+
+    memory = POLLING.get("memory", {})
+    cpu = POLLING.get("cpu", {})
+    state.scheduler.add("memory", poll_memory, memory.get("visible", 10), memory.get("hidden", 60))
+    state.scheduler.add("cpu", poll_cpu, cpu.get("visible", 10), cpu.get("hidden"))
+    state.scheduler.add("link", poll_link, LINK_MONITOR.get("visible", DEFAULT_INTERVAL),
+        LINK_MONITOR.get("hidden", DEFAULT_HIDDEN_INTERVAL))
+    logger.info("Starting perodic router info, ip: {}".format(restconf.router_ip))
+    await state.scheduler.run_async()
+
+async def panel_color_cycle(codec_rpc, scheduler, ui_handlers, interval = 5):
+    """
+    Periodically change the color of the panel button and check the process footprint.
+    The color change is shed near the memory budget, see footprint.py.
+    """
+
+    color_index = 0
+    while True:
+        if not FOOTPRINT_MONITOR.check():
+            codec_rpc.widgets.update_panel(ROUTER_PANEL_ID, "Color", BUTTON_COLORS[color_index], flush = True)
+            color_index = (color_index + 1) % len(BUTTON_COLORS)
+        if logger.isEnabledFor(logging.DEBUG):
+            # the statistics are collected only for the debug log
+            logger.debug("RPC metrics: %s, outbound queue: %s, widget cache: %s, UI handlers: %s, polling: %s, footprint: %s",
+                codec_rpc.rpc_metrics(), codec_rpc.outbound_stats(), codec_rpc.widgets.stats(),
+                ui_handlers.stats(), scheduler.stats(), FOOTPRINT_MONITOR.stats())
+        await asyncio.sleep(interval)
+
+async def setup_router_panel(codec_rpc, registry, panel = ROUTER_PANEL, panel_id = ROUTER_PANEL_ID):
+    """
+    Send a panel definition to the codec and pop it up, unless the codec already has it,
+    see codec_ws.setup_router_panel(). The registry (PanelRegistry) of the saved panels is per codec.
+
+    Returns:
+        bool: True if the panel was saved
+    """
+
+    try:
+        widgets = status_widgets(await asyncio.wrap_future(codec_rpc.widgets.resync()))
+    except RPCError as e:
+        logger.error("Widget state read failed: {}".format(e))
+        widgets = []
+    if not registry.needs_save(panel_id, panel, widgets):
+        logger.info("Router panel unchanged, not saved")
+        return False
+    logger.info("Setup router panel")
+    await codec_rpc.call("xCommand/UserInterface/Extensions/Panel/Save", {"PanelId": panel_id, "body": panel})
+    registry.saved(panel_id, panel)
+    codec_rpc.widgets.resync()
+    return True
+
+async def codec_session(ws, state, ui_handlers, opened_at = None, outage = None):
+    """
+    Communication with the codec over one websocket connection. Returns when the connection is closed.
+    Workflow:
+    1. push panel specification file to the codec (unless it already has it) and pop it up
+    2. subscribe for UI events
+    3. start router polling and panel button color change tasks
+
+    Parameters:
+        ws (AsyncWebSocket): websocket connection
+        state (RouterState): router client and state
+        ui_handlers (AsyncUIHandlers): UI button handlers
+        opened_at (float): time.monotonic() when the connection was established
+        outage (float): time [s] since the previous connection was closed, None for the first connection
+    """
+
+    codec_rpc = AsyncCodecRPC(ws, rpc_timeout = CODEC_CONFIG.get("rpc_timeout", DEFAULT_RPC_TIMEOUT),
+        max_pending = LIMITS["max_pending_rpc"], max_rate = CODEC_CONFIG.get("max_rate"),
+        max_queue = LIMITS["max_outbound_queue"], max_feedback = LIMITS["max_feedback"])
+    runner = asyncio.ensure_future(codec_rpc.run())
+    metrics.QUEUE_DEPTH.set_function(lambda: {
+        ("outbound",): codec_rpc.outbound_stats()["depth"],
+        ("rpc_pending",): codec_rpc.rpc_metrics()["in_flight"],
+        ("ui_handlers",): ui_handlers.pending()
+    })
+    metrics.OLDEST_PENDING.set_function(lambda: codec_rpc.rpc_metrics()["oldest_pending_age"])
+    PROFILER.track("rpc_pending", lambda: len(codec_rpc._msg_register))
+    PROFILER.track("feedback_callbacks", lambda: len(codec_rpc._feedback_register))
+    PROFILER.track("widget_cache", lambda: len(codec_rpc.widgets.values()))
+    tasks = []
+    try:
+        saved = await setup_router_panel(codec_rpc, state.saved_panels)
+        if saved:
+            state.save_snapshot(codec_rpc, force = True)
+            tasks.append(asyncio.ensure_future(show_router_panel(codec_rpc)))
+        if outage is None:
+            # first connection after startup
+            if state.boot_state:
+                panel_status.show_snapshot(codec_rpc, state.boot_state, state.first_paint)
+            tasks.append(asyncio.ensure_future(refresh_router_identity(codec_rpc, state)))
+        await codec_rpc.feedback_subscribe_all([
+            (["Event", "UserInterface", "Extensions"], ui_handlers.ui_event),
+            (["Event", "UserInterface", "Message", "TextInput", "Response"], ui_handlers.text_input_event)
+        ])
+        if opened_at is not None:
+            ready = time.monotonic() - opened_at
+            metrics.PANEL_READY.observe(ready, panel = "saved" if saved else "resumed")
+            logger.info("Panel usable {:.3f} s after connect (panel {}){}".format(ready, "saved" if saved else "resumed",
+                ", {:.1f} s after disconnect".format(outage + ready) if outage is not None else ""))
+        tasks.append(asyncio.ensure_future(periodic_router_info(codec_rpc, state)))
+        tasks.append(asyncio.ensure_future(panel_color_cycle(codec_rpc, state.scheduler, ui_handlers)))
+        await runner
+    finally:
+        for task in tasks + [runner]:
+            task.cancel()
+        await asyncio.gather(*tasks, runner, return_exceptions = True)
+        state.save_snapshot(codec_rpc, force = True)
+
+def restconf_client(router_ip, router_config = ROUTER_CONFIG):
+    """
+    Create the router client
+
+    Parameters:
+        router_ip (str): router IP address
+        router_config (dict): credentials and client parameters, see ROUTER_CONFIG in config.py
+
+    Returns:
+        AsyncRestconfClient: client object
+    """
+
+    return AsyncRestconfClient(router_ip, router_config["username"], router_config["password"],
+        timeout = router_config.get("timeout", DEFAULT_TIMEOUT), retries = router_config.get("retries", 2),
+        backoff_factor = router_config.get("backoff_factor", 0.5), max_connections = min(2, LIMITS["query_workers"]),
+        cache = ResponseCache(QUERY_TTL, LIMITS["cache_entries"], LIMITS["cache_bytes"]) if router_config.get("cache", True) else None)
+
+async def keep_connection(codec_config, session, stop, name = None):
+    """
+    Connect to the codec and keep the connection until stop is set, reconnect with an exponential backoff.
+
+    Parameters:
+        codec_config (dict): codec address, credentials and reconnect delays, see CODEC_CONFIG in config.py
+        session: coroutine function called as session(ws, opened_at, outage) for each connection,
+            it should return when the connection is closed, see codec_session()
+        stop (asyncio.Event): stop request
+        name (str): codec name in the logs
+    """
+
+    prefix = "[{}] ".format(name) if name else ""
+    auth = b64encode("{}:{}".format(codec_config['username'], codec_config['password']).encode()).decode()
+    http_header = {
+        "Authorization": "Basic {}".format(auth)
+    }
+    url = "ws://{}/ws".format(codec_config['ip'])
+    backoff = ReconnectBackoff(codec_config.get("min_reconnect_delay", MIN_RECONNECT_DELAY),
+        codec_config.get("max_reconnect_delay", MAX_RECONNECT_DELAY))
+    closed_at = None
+    while not stop.is_set():
+        try:
+            ws = await AsyncWebSocket.connect(url, headers = http_header)
+            opened_at = time.monotonic()
+            outage = opened_at - closed_at if closed_at is not None else None
+            metrics.CODEC_CONNECTIONS.inc(result = "open")
+            RECORDER.record("open")
+            logger.info("{}Opened connection{}".format(prefix, ", outage {:.1f} s".format(outage) if outage is not None else ""))
+            task = asyncio.ensure_future(session(ws, opened_at, outage))
+            stopper = asyncio.ensure_future(stop.wait())
+            await asyncio.wait([task, stopper], return_when = asyncio.FIRST_COMPLETED)
+            RECORDER.record("close")
+            stopper.cancel()
+            task.cancel()
+            results = await asyncio.gather(task, return_exceptions = True)
+            if isinstance(results[0], Exception):
+                logger.error("{}Codec session exception: {}".format(prefix, results[0]))
+            await ws.close()
+            closed_at = time.monotonic()
+            metrics.CODEC_CONNECTIONS.inc(result = "closed")
+            logger.info("{}### closed ### after {:.1f} s".format(prefix, closed_at - opened_at))
+            if closed_at - opened_at >= STABLE_CONNECTION:
+                backoff.reset()
+        except (OSError, ConnectionClosed, asyncio.TimeoutError, RPCError) as e:
+            metrics.CODEC_CONNECTIONS.inc(result = "failed")
+            logger.error("{}Codec connection exception: {}".format(prefix, e))
+        if not stop.is_set():
+            delay = backoff.next_delay()
+            logger.info("{}Reconnecting in {:.1f} s".format(prefix, delay))
+            try:
+                await asyncio.wait_for(stop.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+def start_profiling(loop):
+    """
+    Profile the asyncio loop thread on SIGUSR1 (on/off) or from the start if PROFILING["active"] is set,
+    see profiling.py
+    """
+
+    profile = lambda: PROFILER.toggle(thread_wide = True, call_later = loop.call_later)
+    loop.add_signal_handler(signal.SIGUSR1, profile)
+    if PROFILER.configure(PROFILING):
+        profile()
+
+async def main():
+    """
+    Connect to the codec and keep the connection, reconnect with an exponential backoff.
+    Stops on SIGINT/SIGTERM.
+    """
+
+    if TESTING["active"]:
+        router_ip = TESTING["router_ip"]
+    else:
+        router_ip = get_default_gateway_linux()
+    logger.info("Router IP: {}".format(router_ip))
+    if FOOTPRINT_MONITOR.configure(FOOTPRINT):
+        logger.info("Low-footprint mode, limits: {}".format(LIMITS))
+    metrics_config = getattr(config, "METRICS", {"active": False})
+    if metrics_config.get("active"):
+        metrics.MetricsServer(host = metrics_config.get("host", metrics.DEFAULT_METRICS_HOST),
+            port = metrics_config.get("port", metrics.DEFAULT_METRICS_PORT)).start()
+    state = RouterState(restconf_client(router_ip))
+    ui_handlers = AsyncUIHandlers(state.restconf, state.page_event, state.wan_switch,
+        page_size = UI_CONFIG.get("route_page_size", DEFAULT_PAGE_SIZE), max_pending = LIMITS["ui_pending"],
+        on_identity = state.set_identity)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_event_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    start_profiling(loop)
+    if RECORDING.get("active"):
+        RECORDER.start(RECORDING.get("path", DEFAULT_RECORDING_PATH))
+
+    async def session(ws, opened_at, outage):
+        await codec_session(ws, state, ui_handlers, opened_at, outage)
+
+    await keep_connection(CODEC_CONFIG, session, stop)
+    PROFILER.stop()
+    RECORDER.stop()
+    state.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,505 @@
+import asyncio
+import logging
+import threading
+import _thread
+import itertools
+import queue
+import random
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from metrics import RPC_REQUESTS, RPC_LATENCY, OUTBOUND_WAIT
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RPC_TIMEOUT = 30 # seconds
+MAX_PENDING_RPC = 256
+MAX_FEEDBACK_REGISTRATIONS = 32 # feedback subscriptions per connection
+MIN_RECONNECT_DELAY = 1 # seconds
+MAX_RECONNECT_DELAY = 60 # seconds
+STABLE_CONNECTION = 30 # seconds, the reconnect backoff is reset after a connection lasted this long
+
+class RPCError(Exception):
+    """
+    Codec responded with an error or the request could not be completed.
+    """
+
+    def __init__(self, message, msg_id = None, error = None):
+        super().__init__(message)
+        self.msg_id = msg_id
+        self.error = error
+
+class RPCTimeoutError(RPCError):
+    """
+    Codec did not respond before the request deadline.
+    """
+    pass
+
+class RPCFuture(Future):
+    """
+    Result of an RPC request. Resolved with the "result" part of the codec response,
+    or with RPCError / RPCTimeoutError exception.
+    """
+
+    def __init__(self, msg_id, method, deadline):
+        super().__init__()
+        self.msg_id = msg_id
+        self.method = method
+        self.deadline = deadline
+
+    def wait(self, timeout = None):
+        """
+        Wait for the response.
+
+        Parameters:
+            timeout (float): maximum wait time in seconds, if None, wait until the request deadline
+
+        Returns:
+            dict: result of the RPC request
+        """
+
+        if timeout is None:
+            timeout = max(0, self.deadline - time.monotonic())
+        try:
+            return self.result(timeout)
+        except FutureTimeoutError:
+            raise RPCTimeoutError("No response to {} #{}".format(self.method, self.msg_id), self.msg_id)
+
+class PendingRequest:
+    """
+    Record of an in-flight request in PendingRequests. The records use slots,
+    the table holds up to max_pending of them for the lifetime of the connection.
+    """
+
+    __slots__ = ("future", "callback", "sent")
+
+    def __init__(self, future, callback, sent):
+        self.future = future
+        self.callback = callback
+        self.sent = sent
+
+class FeedbackRegistration:
+    """
+    Record of a feedback subscription: the event callback and the subscribed xPath
+    """
+
+    __slots__ = ("callback", "query")
+
+    def __init__(self, callback, query = None):
+        self.callback = callback
+        self.query = query
+
+def feedback_capacity(registrations, max_registrations = MAX_FEEDBACK_REGISTRATIONS):
+    """
+    Check the limit of the feedback subscriptions before a new xFeedback/Subscribe
+
+    Parameters:
+        registrations (int): number of the subscriptions of the connection (also the ones waiting for the response)
+        max_registrations (int): limit
+
+    Raises:
+        RPCError: the limit is reached
+    """
+
+    if registrations >= max_registrations:
+        raise RPCError("Too many feedback subscriptions ({})".format(registrations))
+
+class PendingRequests:
+    """
+    Table of the in-flight RPC requests. Each request has a deadline, the expired requests
+    are removed by expire(). The table size is limited, if it's full, the oldest request is evicted.
+    """
+
+    def __init__(self, max_pending = MAX_PENDING_RPC):
+        """
+        Initialize the PendingRequests object
+
+        Parameters:
+            max_pending (int): maximum number of the in-flight requests
+        """
+
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._pending = OrderedDict() # msg_id -> PendingRequest
+        self._sequence = 0
+        self.stats = {
+            "sent": 0,
+            "completed": 0,
+            "errors": 0,
+            "timeouts": 0,
+            "evicted": 0
+        }
+
+    def add(self, method, callback, timeout = DEFAULT_RPC_TIMEOUT):
+        """
+        Register a new request. The message id is unique for the lifetime of the table.
+        The message body is not kept, the method identifies the request in the logs and metrics.
+
+        Parameters:
+            method (str): RPC method
+            callback: callback function, see CodecRPCRegister.send_rpc_message()
+            timeout (float): request timeout in seconds
+
+        Returns:
+            tuple: (RPCFuture, list of evicted PendingRequest records)
+        """
+
+        evicted = []
+        now = time.monotonic()
+        with self._lock:
+            self._sequence += 1
+            msg_id = str(self._sequence)
+            future = RPCFuture(msg_id, method, now + timeout)
+            while len(self._pending) >= self.max_pending:
+                evicted.append(self._pending.popitem(last = False)[1])
+                self.stats["evicted"] += 1
+                RPC_REQUESTS.inc(method = evicted[-1].future.method, result = "evicted")
+            self._pending[msg_id] = PendingRequest(future, callback, now)
+            self.stats["sent"] += 1
+        return future, evicted
+
+    def pop(self, msg_id):
+        """
+        Remove the request from the table.
+
+        Parameters:
+            msg_id (str): message id
+
+        Returns:
+            PendingRequest: request record, None if the request is not in the table
+        """
+
+        with self._lock:
+            return self._pending.pop(msg_id, None)
+
+    def expire(self, now = None):
+        """
+        Remove the requests with an expired deadline.
+
+        Returns:
+            list: removed request records
+        """
+
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            expired_ids = [msg_id for msg_id, reg in self._pending.items() if reg.future.deadline <= now]
+            expired = [self._pending.pop(msg_id) for msg_id in expired_ids]
+            self.stats["timeouts"] += len(expired)
+        for reg in expired:
+            RPC_REQUESTS.inc(method = reg.future.method, result = "timeout")
+        return expired
+
+    def count_result(self, reg, error = False):
+        """
+        Count the completed request and record its round trip time.
+
+        Parameters:
+            reg (PendingRequest): request record returned by pop()
+            error (bool): the request failed
+        """
+
+        with self._lock:
+            self.stats["errors" if error else "completed"] += 1
+        method = reg.future.method
+        RPC_REQUESTS.inc(method = method, result = "error" if error else "ok")
+        RPC_LATENCY.observe(time.monotonic() - reg.sent, method = method)
+
+    def drain(self):
+        """
+        Remove all requests from the table, for example when the connection was closed.
+
+        Returns:
+            list: removed request records
+        """
+
+        with self._lock:
+            drained = list(self._pending.values())
+            self._pending.clear()
+        return drained
+
+    def __len__(self):
+        return len(self._pending)
+
+    def __contains__(self, msg_id):
+        return msg_id in self._pending
+
+    def oldest_age(self):
+        """
+        Get the age of the oldest in-flight request.
+
+        Returns:
+            float: age in seconds, 0 if there is no in-flight request
+        """
+
+        with self._lock:
+            for reg in self._pending.values():
+                return time.monotonic() - reg.sent
+        return 0.0
+
+    def metrics(self):
+        """
+        Get the in-flight request metrics.
+
+        Returns:
+            dict: request counters, "in_flight" number of requests and "oldest_pending_age" in seconds
+        """
+
+        result = dict(self.stats)
+        result["in_flight"] = len(self._pending)
+        result["oldest_pending_age"] = round(self.oldest_age(), 3)
+        return result
+
+    def __repr__(self):
+        with self._lock:
+            return repr({msg_id: reg.future.method for msg_id, reg in self._pending.items()})
+
+# outbound message priorities, lower number is sent first
+PRIORITY_INTERACTIVE = 0 # responses to user actions
+PRIORITY_NORMAL = 1 # panel setup, subscriptions, ...
+PRIORITY_PERIODIC = 2 # periodic widget updates
+MAX_OUTBOUND_QUEUE = 128
+OUTBOUND_HARD_LIMIT = 2 # multiple of max_queue, above it all messages are dropped regardless of the priority
+
+class OutboundQueue:
+    """
+    Single writer of the outbound websocket messages. Messages are queued by priority
+    and sent by one thread, optionally limited to a maximum rate (messages per second).
+    """
+
+    def __init__(self, send, max_rate = None, burst = 5, max_queue = MAX_OUTBOUND_QUEUE, on_error = None):
+        """
+        Initialize the OutboundQueue object
+
+        Parameters:
+            send: function which sends the message, for example websocket.send
+            max_rate (float): maximum number of messages per second, None means no limit
+            burst (int): number of messages which can be sent at once before the rate limit applies
+            max_queue (int): maximum queue depth, periodic messages are dropped if the queue is full,
+                the other ones if the depth reaches OUTBOUND_HARD_LIMIT * max_queue
+            on_error: callback function called if the message can't be sent,
+                called in the form: on_error(tag, exception)
+        """
+
+        self._send = send
+        self.max_rate = max_rate
+        self.burst = burst
+        self.max_queue = max_queue
+        self._on_error = on_error
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._tokens = burst
+        self._last_refill = time.monotonic()
+        self._running = False
+        self._lock = threading.Lock()
+        self._stats = {
+            "queued": 0,
+            "sent": 0,
+            "dropped": 0,
+            "errors": 0,
+            "max_depth": 0,
+            "wait_total": 0.0,
+            "wait_max": 0.0
+        }
+
+    def start(self):
+        """
+        Start the writer thread.
+        """
+
+        if not self._running:
+            self._running = True
+            _thread.start_new_thread(self._writer_loop, ())
+
+    def stop(self):
+        """
+        Stop the writer thread. Messages which are still in the queue are not sent.
+        """
+
+        self._running = False
+        self._queue.put((-1, next(self._sequence), 0, None, None))
+
+    def put(self, data, priority = PRIORITY_NORMAL, tag = None):
+        """
+        Queue a message.
+
+        Parameters:
+            data (str): message
+            priority (int): PRIORITY_INTERACTIVE, PRIORITY_NORMAL or PRIORITY_PERIODIC
+            tag: message identification passed to on_error callback, for example message id
+
+        Returns:
+            bool: False if the message was dropped
+        """
+
+        depth = self._queue.qsize()
+        with self._lock:
+            if depth >= self.max_queue and (priority >= PRIORITY_PERIODIC or depth >= OUTBOUND_HARD_LIMIT * self.max_queue):
+                self._stats["dropped"] += 1
+                return False
+            self._stats["queued"] += 1
+            self._stats["max_depth"] = max(self._stats["max_depth"], depth + 1)
+        self._queue.put_nowait((priority, next(self._sequence), time.monotonic(), data, tag))
+        return True
+
+    def _token_delay(self):
+        """
+        Take a token of the rate limit if one is available.
+
+        Returns:
+            float: time [s] to wait before trying again, 0 if the message can be sent now
+        """
+
+        if not self.max_rate:
+            return 0
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.max_rate)
+        self._last_refill = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) / self.max_rate
+
+    def _take_token(self):
+        """
+        Wait until the rate limit allows to send a message.
+        """
+
+        delay = self._token_delay()
+        while delay:
+            time.sleep(delay)
+            delay = self._token_delay()
+
+    def _count_sent(self, waited):
+        with self._lock:
+            self._stats["sent"] += 1
+            self._stats["wait_total"] += waited
+            self._stats["wait_max"] = max(self._stats["wait_max"], waited)
+        OUTBOUND_WAIT.observe(waited)
+
+    def _send_error(self, tag, error):
+        with self._lock:
+            self._stats["errors"] += 1
+        logger.error("Outbound send exception: {}".format(error))
+        if self._on_error is not None:
+            try:
+                self._on_error(tag, error)
+            except Exception as e:
+                logger.error("Outbound error callback exception: {}".format(e))
+
+    def _writer_loop(self):
+        while self._running:
+            priority, seq, queued, data, tag = self._queue.get()
+            if data is None:
+                continue
+            self._take_token()
+            if not self._running:
+                break
+            waited = time.monotonic() - queued
+            try:
+                self._send(data)
+            except Exception as e:
+                self._send_error(tag, e)
+                continue
+            self._count_sent(waited)
+
+    def stats(self):
+        """
+        Get the queue statistics.
+
+        Returns:
+            dict: message counters, current and maximum queue depth, average and maximum
+                time spent in the queue in seconds
+        """
+
+        with self._lock:
+            result = dict(self._stats)
+        wait_total = result.pop("wait_total")
+        result["depth"] = self._queue.qsize()
+        result["wait_avg"] = round(wait_total / result["sent"], 4) if result["sent"] else 0.0
+        result["wait_max"] = round(result["wait_max"], 4)
+        return result
+
+class AsyncOutboundQueue(OutboundQueue):
+    """
+    asyncio version of OutboundQueue, the messages are sent by the run() task. The same priorities,
+    queue limits, rate limit and statistics.
+    """
+
+    def __init__(self, send, **kwargs):
+        """
+        Initialize the AsyncOutboundQueue object
+
+        Parameters:
+            send: coroutine function which sends the message, for example AsyncWebSocket.send
+            kwargs: see OutboundQueue
+        """
+
+        super().__init__(send, **kwargs)
+        self._queue = asyncio.PriorityQueue()
+
+    async def run(self):
+        """
+        Send the queued messages until cancelled. A send error ends the task, the connection is not usable.
+
+        Raises:
+            Exception: send exception, the message is reported to on_error first
+        """
+
+        while True:
+            priority, seq, queued, data, tag = await self._queue.get()
+            if data is None:
+                continue
+            delay = self._token_delay()
+            while delay:
+                await asyncio.sleep(delay)
+                delay = self._token_delay()
+            waited = time.monotonic() - queued
+            try:
+                await self._send(data)
+            except Exception as e:
+                self._send_error(tag, e)
+                raise
+            self._count_sent(waited)
+
+class ReconnectBackoff:
+    """
+    Exponential backoff of the reconnect attempts with a random jitter, so that a flapping link
+    is not hammered and multiple clients do not reconnect at the same moment.
+    """
+
+    def __init__(self, initial = MIN_RECONNECT_DELAY, maximum = MAX_RECONNECT_DELAY, factor = 2, jitter = 0.2):
+        """
+        Initialize the ReconnectBackoff object
+
+        Parameters:
+            initial (float): delay [s] before the first reconnect
+            maximum (float): maximum delay [s]
+            factor (float): delay multiplier after each failed attempt
+            jitter (float): random variation of the delay, fraction of the delay
+        """
+
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self.attempts = 0
+
+    def next_delay(self):
+        """
+        Get the delay before the next attempt and increase the following one.
+
+        Returns:
+            float: delay in seconds
+        """
+
+        delay = min(self.maximum, self.initial * self.factor ** min(self.attempts, 32))
+        self.attempts += 1
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def reset(self):
+        """
+        Connection is stable, start again from the initial delay.
+        """
+
+        self.attempts = 0
@@ -1,3 +1,24 @@
+# colors of the panel button, changed periodically
+BUTTON_COLORS = ["#40E0D0", "#FFBF00", "#DE3163"]
+
+# id of the panel in ROUTER_PANEL
+ROUTER_PANEL_ID = "router_mgmt"
+
+# page with the router CPU and memory usage, the router is polled faster while it's open
+ROUTER_INFO_PAGE = "page_rtr_info"
+
+# router status widgets kept in the state snapshot and shown as stale values on startup
+STATUS_WIDGETS = ["rtr_cpu_usage", "rtr_mem_usage", "rtr_cpu_trend", "rtr_mem_trend", "rtr_peaks", "rtr_update"]
+
+# link quality rows of the Router Info page: one per monitored interface and the LTE signal, see link_monitor.py
+LINK_WIDGETS = ["rtr_link_1", "rtr_link_2"]
+LINK_RADIO_WIDGET = "rtr_lte"
+
+# WAN path selection of the Router Control page, the GroupButton keys are the paths of WAN_SWITCH in config.py, see wan_switch.py
+WAN_PATH_WIDGET = "wan_path"
+WAN_RESULT_WIDGET = "wan_switch_result"
+WAN_HISTORY_WIDGET = "wan_switch_history"
+
 # definition of the codec touch screen control panel
 # see https://roomos.cisco.com/docs/UiExtensions.md
 ROUTER_PANEL = """
@@ -34,6 +55,86 @@ ROUTER_PANEL = """
           <Options>size=4;fontSize=small;align=left</Options>
         </Widget>
       </Row>
+      <Row>
+        <Name>Routes</Name>
+        <Widget>
+          <WidgetId>rt_filter</WidgetId>
+          <Type>GroupButton</Type>
+          <Options>size=4</Options>
+          <ValueSpace>
+            <Value>
+              <Key>all</Key>
+              <Name>all</Name>
+            </Value>
+            <Value>
+              <Key>default</Key>
+              <Name>default</Name>
+            </Value>
+            <Value>
+              <Key>connected</Key>
+              <Name>connected</Name>
+            </Value>
+            <Value>
+              <Key>static</Key>
+              <Name>static</Name>
+            </Value>
+          </ValueSpace>
+        </Widget>
+        <Widget>
+          <WidgetId>rt_prev</WidgetId>
+          <Name>&lt;</Name>
+          <Type>Button</Type>
+          <Options>size=1</Options>
+        </Widget>
+        <Widget>
+          <WidgetId>rt_prefix</WidgetId>
+          <Name>prefix</Name>
+          <Type>Button</Type>
+          <Options>size=2</Options>
+        </Widget>
+        <Widget>
+          <WidgetId>rt_next</WidgetId>
+          <Name>&gt;</Name>
+          <Type>Button</Type>
+          <Options>size=1</Options>
+        </Widget>
+        <Widget>
+          <WidgetId>rt_page</WidgetId>
+          <Name>Text</Name>
+          <Type>Text</Type>
+          <Options>size=4;fontSize=small;align=center</Options>
+        </Widget>
+      </Row>
+      <Row>
+        <Name>WAN Path</Name>
+        <Widget>
+          <WidgetId>wan_path</WidgetId>
+          <Type>GroupButton</Type>
+          <Options>size=4</Options>
+          <ValueSpace>
+            <Value>
+              <Key>ethernet</Key>
+              <Name>Ethernet</Name>
+            </Value>
+            <Value>
+              <Key>lte</Key>
+              <Name>LTE</Name>
+            </Value>
+          </ValueSpace>
+        </Widget>
+        <Widget>
+          <WidgetId>wan_switch_result</WidgetId>
+          <Name>Text</Name>
+          <Type>Text</Type>
+          <Options>size=4;fontSize=small;align=left</Options>
+        </Widget>
+        <Widget>
+          <WidgetId>wan_switch_history</WidgetId>
+          <Name>Text</Name>
+          <Type>Text</Type>
+          <Options>size=4;fontSize=small;align=left</Options>
+        </Widget>
+      </Row>
       <PageId>page_rtr_control</PageId>
       <Options>hideRowNames=1</Options>
     </Page>
@@ -57,6 +158,60 @@ ROUTER_PANEL = """
           <Options>size=4;fontSize=normal;align=left</Options>
         </Widget>
       </Row>
+      <Row>
+        <Name>CPU Trend</Name>
+        <Widget>
+          <WidgetId>rtr_cpu_trend</WidgetId>
+          <Name>Text</Name>
+          <Type>Text</Type>
+          <Options>size=4;fontSize=normal;align=left</Options>
+        </Widget>
+      </Row>
+      <Row>
+        <Name>Memory Trend</Name>
+        <Widget>
+          <WidgetId>rtr_mem_trend</WidgetId>
+          <Name>Text</Name>
+          <Type>Text</Type>
+          <Options>size=4;fontSize=normal;align=left</Options>
+        </Widget>
+      </Row>
+      <Row>
+        <Name>Peak CPU/Mem</Name>
+        <Widget>
+          <WidgetId>rtr_peaks</WidgetId>
+          <Name>Text</Name>
+          <Type>Text</Type>
+          <Options>size=4;fontSize=normal;align=left</Options>
+        </Widget>
+      </Row>
+      <Row>
+        <Name>WAN 1</Name>
+        <Widget>
+          <WidgetId>rtr_link_1</WidgetId>
+          <Name>Text</Name>
+          <Type>Text</Type>
+          <Options>size=4;fontSize=small;align=left</Options>
+        </Widget>
+      </Row>
+      <Row>
+        <Name>WAN 2</Name>
+        <Widget>
+          <WidgetId>rtr_link_2</WidgetId>
+          <Name>Text</Name>
+          <Type>Text</Type>
+          <Options>size=4;fontSize=small;align=left</Options>
+        </Widget>
+      </Row>
+      <Row>
+        <Name>LTE Signal</Name>
+        <Widget>
+          <WidgetId>rtr_lte</WidgetId>
+          <Name>Text</Name>
+          <Type>Text</Type>
+          <Options>size=4;fontSize=small;align=left</Options>
+        </Widget>
+      </Row>
       <Row>
         <Name>Last Update</Name>
         <Widget>
@@ -1,4 +1,6 @@
 import sys
+import time
+START_TIME = time.monotonic() # application start, see first_paint
 import logging
 logging.basicConfig(
     level=logging.INFO,
@@ -10,61 +12,156 @@ logging.basicConfig(
 )
 
 import websocket
-import _thread
-import time
-import rel
 from base64 import b64encode
 import ssl
-import json
 import signal
+import threading
+import config
 from config import CODEC_CONFIG, ROUTER_CONFIG, TESTING
-from codec_ui import ROUTER_PANEL
-import socket, struct
-from datetime import datetime
-import requests
+from codec_ui import ROUTER_PANEL, ROUTER_PANEL_ID, ROUTER_INFO_PAGE, BUTTON_COLORS, LINK_WIDGETS, LINK_RADIO_WIDGET
+from codec_ui import WAN_PATH_WIDGET
+from codec_rpc import RPCError, RPCTimeoutError, DEFAULT_RPC_TIMEOUT, MAX_PENDING_RPC
+from codec_rpc import FeedbackRegistration, feedback_capacity, MAX_FEEDBACK_REGISTRATIONS, MAX_OUTBOUND_QUEUE
+from codec_rpc import OutboundQueue, PRIORITY_INTERACTIVE, PRIORITY_NORMAL
+from codec_rpc import ReconnectBackoff, MIN_RECONNECT_DELAY, MAX_RECONNECT_DELAY, STABLE_CONNECTION
+from rpc_register import RPCRegister
+from widget_cache import WidgetStateCache, PanelRegistry, status_widgets
+from supervisor import ConnectionSupervisor
+from state_snapshot import StateSnapshot, FirstPaint, DEFAULT_SNAPSHOT_INTERVAL
+from ui_dispatch import UIDispatcher, DEFAULT_UI_WORKERS
+from profiling import PROFILER
+from recording import RECORDER, DEFAULT_RECORDING_PATH
+import json_codec
+import metrics
+from poll_scheduler import PollScheduler, DEFAULT_JITTER, DEFAULT_LATENCY_THRESHOLD, DEFAULT_CPU_THRESHOLD
+from router_info import get_default_gateway_linux, format_router_version
+from router_info import MEMORY_QUERY, CPU_QUERY, ROUTES_QUERY, RIB_QUERY, VERSION_QUERY, INVENTORY_QUERY, QUERY_TTL
+from metric_history import MetricHistory
+from route_view import RouteView, DEFAULT_PAGE_SIZE, iter_json_array, rib_route, native_route
+from restconf_cache import ResponseCache
+from query_plan import QueryPlan, DEFAULT_DEADLINE, set_max_workers
+from link_monitor import LinkMonitor, link_plan, DEFAULT_INTERFACES, DEFAULT_INTERVAL, DEFAULT_HIDDEN_INTERVAL
+from wan_switch import wan_switch_config
+from footprint import FOOTPRINT_MONITOR, footprint_limits
+import panel_status
 
 router_ip = None # see TESTING in config.py and codec_requests()
+active_rpc = None # CodecRPCRegister of the current codec connection, None while disconnected
+router_identity = None # router hostname, model and version, see refresh_router_identity()
+boot_state = {} # state snapshot loaded on startup
 
 logger = logging.getLogger(__name__)
 
-BUTTON_COLORS = ["#40E0D0", "#FFBF00", "#DE3163"]
+# optional configuration, see config_sample.py
+TELEMETRY = getattr(config, "TELEMETRY", {"active": False})
+UI_CONFIG = getattr(config, "UI", {})
+METRICS = getattr(config, "METRICS", {"active": False})
+POLLING = getattr(config, "POLLING", {})
+HISTORY = getattr(config, "HISTORY", {})
+SNAPSHOT = getattr(config, "SNAPSHOT", {})
+PROFILING = getattr(config, "PROFILING", {})
+RECORDING = getattr(config, "RECORDING", {})
+LINK_MONITOR = getattr(config, "LINK_MONITOR", {})
+WAN_SWITCH = getattr(config, "WAN_SWITCH", {})
+FOOTPRINT = getattr(config, "FOOTPRINT", {})
+
+# queue, table and thread pool sizes, smaller in the low-footprint mode, see footprint.py
+LIMITS = footprint_limits(FOOTPRINT)
+set_max_workers(LIMITS["query_workers"])
+
+# independent router queries run concurrently, see query_plan.py
+VERSION_PLAN = QueryPlan("version", {"version": VERSION_QUERY, "inventory": INVENTORY_QUERY},
+    deadline = ROUTER_CONFIG.get("query_deadline", DEFAULT_DEADLINE))
+LINK_PLAN = link_plan(LINK_MONITOR, deadline = ROUTER_CONFIG.get("query_deadline", DEFAULT_DEADLINE))
+
+_restconf_clients = {} # (router_ip, username) -> RestconfClient, see restconf_client()
+_saved_panels = PanelRegistry() # panels saved to the codec, kept across reconnects
+_telemetry_started = False
+snapshot = StateSnapshot(SNAPSHOT.get("path"), SNAPSHOT.get("interval", DEFAULT_SNAPSHOT_INTERVAL))
+first_paint = FirstPaint(START_TIME)
+
+# routing table page shown on the panel, see show_routes()
+route_view = RouteView(UI_CONFIG.get("route_page_size", DEFAULT_PAGE_SIZE))
+route_view_lock = threading.Lock()
+
+# WAN interface throughput and LTE signal, see start_link_monitor()
+link_monitor = LinkMonitor(LINK_MONITOR.get("interfaces", DEFAULT_INTERFACES)[:len(LINK_WIDGETS)])
 
-MAX_MSG_SEQUENCE = 4096
-class CodecRPCRegister:
+# WAN path switchover with the history of the convergence times, see wan_path_switch()
+wan_switch = wan_switch_config(WAN_SWITCH)
+
+# router CPU and memory utilization history, see panel_status.trend_values()
+cpu_history = MetricHistory("cpu", directory = HISTORY.get("directory"))
+memory_history = MetricHistory("memory", directory = HISTORY.get("directory"))
+
+class CodecRPCRegister(RPCRegister):
     """
     Communicate with Cisco codec via websocket
     See the guide: https://www.cisco.com/c/dam/en/us/td/docs/telepresence/endpoint/api/collaboration-endpoint-software-api-transport.pdf
     Latest version can be found here: https://www.cisco.com/c/en/us/support/collaboration-endpoints/spark-room-kit-series/products-command-reference-list.html
+    The message register and dispatch are shared with codec_async.py, see rpc_register.py.
     """
     
-    def __init__(self, ws):
+    def __init__(self, ws, rpc_timeout = DEFAULT_RPC_TIMEOUT, max_pending = MAX_PENDING_RPC, max_rate = None,
+        max_queue = MAX_OUTBOUND_QUEUE, max_feedback = MAX_FEEDBACK_REGISTRATIONS):
         """
-        Initialize the CodecRPCRegister object
+        Initialize the CodecRPCRegister object. All outbound messages are sent by a single writer thread
+        from a priority queue.
         
         Parameters:
             ws: websocket object
+            rpc_timeout (float): default timeout of the RPC requests in seconds
+            max_pending (int): maximum number of in-flight RPC requests
+            max_rate (float): maximum number of messages per second sent to the codec, None means no limit
+            max_queue (int): maximum outbound queue depth, see OutboundQueue
+            max_feedback (int): maximum number of feedback subscriptions
         """
         
+        super().__init__(rpc_timeout, max_pending, max_feedback)
         ws.on_message = self.handle_rpc_message
         self._ws = ws
-        self._msg_sequence = 1
-        self._msg_register = {}
-        self._feedback_register = {}
-        self._feedback_callbacks_temp = {}
+        self._feedback_callbacks_temp = {} # message id of xFeedback/Subscribe -> FeedbackRegistration
+        self._outbound = OutboundQueue(self._send, max_rate = max_rate, max_queue = max_queue, on_error = self._send_failed)
+        self._outbound.start()
+        self.widgets = WidgetStateCache(self) # use for widget values and panel attributes, sends only changes
+        
+    def _send(self, data):
+        RECORDER.record("out", m = data)
+        self._ws.send(data)
+        
+    def close(self):
+        """
+        Stop the outbound message writer. The in-flight requests are completed with RPCError,
+        so nobody waits for a response from a closed connection.
+        """
+        
+        self._outbound.stop()
+        self.drain_requests()
         
-    def send_rpc_message(self, method, params, callback = None):
+    def call(self, method, params, timeout = None, priority = PRIORITY_NORMAL):
         """
-        Send message to the codec via websocket
+        Send message to the codec and wait for the response. Do not call it from a callback
+        function, the callbacks are called by the websocket receive thread which handles the response.
         
         Parameters:
-            method (str): operation and object xPath (for example: "xCommand/UserInterface/Extensions/Widget/SetValue")
+            method (str): operation and object xPath (for example: "xGet")
             params (dict): parameters
-            callback (function): callback function to be called after the response is received,
-                the function is called in the form: callback(codec_rpc, message_id, message_result)
+            timeout (float): response timeout in seconds, default is rpc_timeout
+            
+        Returns:
+            dict: result part of the response
+            
+        Raises:
+            RPCTimeoutError: no response before the timeout
+            RPCError: codec responded with an error
         """
         
-        msg = self.create_rpc_message(method, params, callback)
-        self._ws.send(json.dumps(msg))
+        future = self.send_rpc_message(method, params, timeout = timeout, priority = priority)
+        try:
+            return future.wait()
+        except RPCTimeoutError:
+            self.expire_requests()
+            raise
         
     def _feedback_registered(self, codec_rpc, msg_id, response):
         """
@@ -81,11 +178,12 @@ class CodecRPCRegister:
         logger.info("Feedback register response: {}".format(response))
         try:
             callback_reg = codec_rpc._feedback_callbacks_temp.pop(msg_id)
-            codec_rpc._feedback_register[response["Id"]] = {
-                "callback": callback_reg["callback"]
-            }
+            if isinstance(response, RPCError):
+                logger.error("Feedback subscribe failed: {}".format(response))
+                return
+            codec_rpc._feedback_register[response["Id"]] = callback_reg
         except KeyError:
-            logger.error("Feedback callback {} not registered".format(response['id']))
+            logger.error("Feedback callback {} not registered".format(msg_id))
                 
     def feedback_subscribe(self, params, callback):
         """
@@ -95,97 +193,77 @@ class CodecRPCRegister:
         Parameters:
             params (str): xPath for which we want to receive a feedback
             callback: callback function, it's called in the form: callback(codec_rpc, reponse_parameters)
+            
+        Returns:
+            RPCFuture: future resolved with the subscribe response, None if the request couldn't be created
         """
         
         try:
-            msg = self.create_rpc_message("xFeedback/Subscribe", {"Query": params}, self._feedback_registered)
-            self._feedback_callbacks_temp[msg["id"]] = {
-                "callback": callback
-            }
-            self._ws.send(json.dumps(msg))
+            feedback_capacity(len(self._feedback_register) + len(self._feedback_callbacks_temp), self.max_feedback)
+            data, future = self._create_rpc_request("xFeedback/Subscribe", {"Query": params}, self._feedback_registered)
+            self._feedback_callbacks_temp[future.msg_id] = FeedbackRegistration(callback, params)
+            return self._queue_message(data, future, PRIORITY_NORMAL)
         except Exception as e:
             logger.error("Feedback subscribe exception: {}".format(e))
+            
+    def feedback_subscribe_all(self, subscriptions, timeout = None):
+        """
+        Subscribe for multiple feedbacks in one round trip - all requests are sent before waiting for the responses.
+        
+        Parameters:
+            subscriptions (list): (xPath, callback) tuples, see feedback_subscribe()
+            timeout (float): maximum wait time for each response, default is rpc_timeout
+            
+        Returns:
+            int: number of successful subscriptions
+        """
+        
+        futures = [self.feedback_subscribe(params, callback) for params, callback in subscriptions]
+        subscribed = 0
+        for future in futures:
+            if future is None:
+                continue
+            try:
+                future.wait(timeout)
+                subscribed += 1
+            except RPCError as e:
+                logger.error("Feedback subscribe failed: {}".format(e))
+        return subscribed
         
-    def create_rpc_message(self, method, params, callback):
+    def create_rpc_message(self, method, params, callback, timeout = None):
         """
         Create a codec RPC message and register a callback function for handling the response.
         Each RPC message has its own id and the callback is associated with the id.
+        Expired requests are removed from the register and their callbacks receive RPCTimeoutError.
         
         Parameters:
             method (str): operation and object xPath (for example: "xCommand/UserInterface/Extensions/Widget/SetValue")
             params (str): parameters
             callback: callback function
+            timeout (float): response timeout in seconds, default is rpc_timeout
         """
         
-        self._msg_sequence += 1
-        if self._msg_sequence > MAX_MSG_SEQUENCE:
-            self._msg_sequence = 1
-        rpc_message = {
+        future = self._create_rpc_request(method, params, callback, timeout)[1]
+        return {
             "jsonrpc": "2.0",
-            "id": str(self._msg_sequence),
             "method": method,
-            "params": params
+            "params": params,
+            "id": future.msg_id
         }
-        try:
-            a = self._msg_register[rpc_message["id"]]
-            logger.error("Message id {} already registered".format(rpc_message['id']))
-        except KeyError:
-            self._msg_register[rpc_message["id"]] = {
-                "message": rpc_message,
-                "callback": callback
-            }
-            return rpc_message
-            
+        
     def handle_rpc_message(self, ws, message):
         """
-        Handle the RPC message. Based on the RPC message id, the callback function is called.
-        There are two possible callbacks:
-        1. asynchronous event associated with feedback registration, the callback is called in the form of
-            callback(codec_rpc, message_parameters)
-        2. response to the previous RPC request, the callback is called in the form of
-            callback(codec_rpc, message_id, parameters). In this case the callback is removed from
-            the pool of callback functions - each message id is handled only once.
+        Handle the RPC message, the callback of the websocket receive thread, see RPCRegister.handle_message().
+        The expired requests are removed after each response.
         
         Parameters:
             ws: websocket object
             message (str): JSON representation of the RPC response
         """
         
-        message = json.loads(message)
-        logger.info("RPC message: {}".format(message))
-        if message.get("method") == "xFeedback/Event":
-            logger.debug("Feedback event: {}".format(message['params']))
-            self._feedback_register[message["params"]["Id"]]["callback"](self, message["params"])
-        else:
-            try:
-                msg_reg = self._msg_register.pop(message["id"])
-                logger.info("Handling reponse {}, RPC register: {}".format(message['id'], self._msg_register))
-                if msg_reg["callback"] is not None:
-                    try:
-                        msg_reg["callback"](self, message["id"], message["result"])
-                    except Exception as e:
-                        logger.error("RPC callback exception: {}".format(e))
-            except KeyError:
-                logger.error("Message id {} already handled".format(message['id']))
+        if self.handle_message(message) == json_codec.RESPONSE:
+            self.expire_requests()
 
-def on_message(ws, message):
-    """
-    Dummy function from the example
-    """
-    logger.info(message)
-
-def on_error(ws, error):
-    """
-    Dummy function from the example
-    """
-    logger.info(error)
-
-def on_close(ws, close_status_code, close_msg):
-    """
-    Dummy function from the example
-    """
-    logger.info("### closed ###")
-    
 def codec_status(msg_id, status):
     """
     Dummy function
@@ -195,82 +273,215 @@ def codec_status(msg_id, status):
 def ui_event(codec_rpc, event):
     """
     Handle Event/UserInterface/Extensions event. The function is set as a callback for xFeedback/Subscribe.
+    The widget actions are passed to ui_dispatcher, so the handlers do not block the websocket receive thread.
     """
-    logger.info("UI event: {}".format(event))
+    logger.debug("UI event: %s", event)
     # {'Event': {'UserInterface': {'Extensions': {'Widget': {'Action': {'Type': 'pressed', 'Value': '2', 'WidgetId': 'widget_1', 'id': 1}, 'id': 1}, 'id': 1}, 'id': 1}}, 'Id': 0}
     try:
-        action = event["Event"]["UserInterface"]["Extensions"]["Widget"]["Action"]
-        if action["Type"] == "clicked":
-            try:
-                if action["WidgetId"] == "sh_ver":
-                    sh_ver_res = get_router_version(router_ip, ROUTER_CONFIG["username"], ROUTER_CONFIG["password"])
-                    codec_rpc.send_rpc_message("xCommand/UserInterface/Extensions/Widget/SetValue",
-                        {"WidgetId": "show_result_1", "Value": sh_ver_res})
-                elif action["WidgetId"] == "sh_ip_ro":
-                    routing = get_routing_table(router_ip, ROUTER_CONFIG["username"], ROUTER_CONFIG["password"])
-                    route_list = []
-                    for route_rec in routing:
-                        fwd_list = route_rec['fwd-list']
-                        next_hops = []
-                        for fwd in fwd_list:
-                            next_hops.append(fwd["fwd"])
-                        next_str = ",".join(next_hops)
-                        res = "{}/{} -> {}".format(route_rec['prefix'], route_rec['mask'], next_str)
-                        route_list.append(res)
-                    codec_rpc.send_rpc_message("xCommand/UserInterface/Extensions/Widget/SetValue",
-                        {"WidgetId": "show_result_1", "Value": "\n".join(route_list)})
-            except Exception as e:
-                logger.info("UI execute exception: {}".format(e))
-                
+        extensions = event["Event"]["UserInterface"]["Extensions"]
+        if "Event" in extensions:
+            page_event(extensions["Event"])
+            return
+        action = extensions["Widget"]["Action"]
+        ui_dispatcher.dispatch(codec_rpc, action)
     except KeyError:
         logger.info("Action not found in Event")
+        
+def page_event(event):
+    """
+    Handle panel page open/close event. The router is polled faster while the Router Info page is open.
+    """
+    visible = panel_status.page_visible(event)
+    if visible is not None:
+        poll_scheduler.set_visible(visible)
+        
+def text_input_event(codec_rpc, event):
+    """
+    Handle Event/UserInterface/Message/TextInput/Response event. The response is passed to ui_dispatcher
+    as a "text_input" action of the widget which opened the text input (FeedbackId).
+    """
+    logger.debug("Text input event: %s", event)
+    try:
+        response = event["Event"]["UserInterface"]["Message"]["TextInput"]["Response"]
+        ui_dispatcher.dispatch(codec_rpc, {"WidgetId": response["FeedbackId"], "Type": "text_input", "Value": response.get("Text", "")})
+    except KeyError:
+        logger.info("Response not found in Event")
+        
+def show_version(codec_rpc, action):
+    """
+    "show version" button handler. Display router hostname, HW and SW version.
+    """
+    
+    global router_identity
+    
+    sh_ver_res = get_router_version(router_ip, ROUTER_CONFIG["username"], ROUTER_CONFIG["password"])
+    router_identity = sh_ver_res
+    codec_rpc.widgets.set_value("show_result_1", sh_ver_res, flush = True, priority = PRIORITY_INTERACTIVE)
+    
+def show_routes(codec_rpc):
+    """
+    Display current page of the routing table, see route_view.
+    """
+    
+    with route_view_lock:
+        page, status = route_view.render(get_routes(router_ip, ROUTER_CONFIG["username"], ROUTER_CONFIG["password"]))
+    codec_rpc.widgets.set_value("show_result_1", page, priority = PRIORITY_INTERACTIVE)
+    codec_rpc.widgets.set_value("rt_page", status, flush = True, priority = PRIORITY_INTERACTIVE)
+    
+def show_ip_route(codec_rpc, action):
+    """
+    "show ip route" button handler. Display the first page of router's routing table.
+    """
+    
+    with route_view_lock:
+        route_view.page = 0
+    show_routes(codec_rpc)
+    
+def route_page(codec_rpc, action):
+    """
+    "<" and ">" button handler. Display previous or next page of the routing table.
+    """
+    
+    with route_view_lock:
+        if action["WidgetId"] == "rt_prev":
+            route_view.prev_page()
+        else:
+            route_view.next_page()
+    show_routes(codec_rpc)
+    
+def route_filter(codec_rpc, action):
+    """
+    Route type selection handler (all, default, connected, static).
+    """
+    
+    with route_view_lock:
+        route_view.set_filter(kind = action.get("Value"))
+    show_routes(codec_rpc)
+    
+def route_prefix_input(codec_rpc, action):
+    """
+    "prefix" button handler. Ask for the prefix filter, the answer is handled by route_prefix().
+    """
+    
+    codec_rpc.send_rpc_message("xCommand/UserInterface/Message/TextInput/Display",
+        {"FeedbackId": "rt_prefix", "Title": "Route filter", "Text": "Prefix or address, empty to show all",
+        "InputText": str(route_view.route_filter.prefix or ""), "SubmitText": "Filter"}, priority = PRIORITY_INTERACTIVE)
+    
+def route_prefix(codec_rpc, action):
+    """
+    Prefix filter text input handler.
+    """
+    
+    with route_view_lock:
+        route_view.set_filter(prefix = action.get("Value", ""))
+    show_routes(codec_rpc)
+    
+def wan_path_switch(codec_rpc, action):
+    """
+    WAN path selection handler (Ethernet, LTE). Change the default route and show how long it took
+    until the router used the new path, see wan_switch.py.
+    """
+    
+    path = action.get("Value")
+    if panel_status.show_wan_switching(codec_rpc, wan_switch, path):
+        result = wan_switch.switch(restconf_client(router_ip, ROUTER_CONFIG["username"], ROUTER_CONFIG["password"]), path)
+        panel_status.show_wan_result(codec_rpc, wan_switch, result)
+    
+ui_dispatcher = UIDispatcher(max_workers = LIMITS.get("ui_workers", UI_CONFIG.get("workers", DEFAULT_UI_WORKERS)),
+    max_pending = LIMITS["ui_pending"])
+poll_scheduler = PollScheduler(jitter = POLLING.get("jitter", DEFAULT_JITTER),
+    latency_threshold = POLLING.get("latency_threshold", DEFAULT_LATENCY_THRESHOLD),
+    cpu_threshold = POLLING.get("cpu_threshold", DEFAULT_CPU_THRESHOLD))
+ui_dispatcher.register("sh_ver", "clicked", show_version)
+ui_dispatcher.register("sh_ip_ro", "clicked", show_ip_route)
+ui_dispatcher.register("rt_prev", "clicked", route_page)
+ui_dispatcher.register("rt_next", "clicked", route_page)
+ui_dispatcher.register("rt_filter", "released", route_filter, coalesce = True)
+ui_dispatcher.register("rt_prefix", "clicked", route_prefix_input)
+ui_dispatcher.register("rt_prefix", "text_input", route_prefix, coalesce = True)
+ui_dispatcher.register(WAN_PATH_WIDGET, "released", wan_path_switch, coalesce = True)
 
-def codec_requests(ws, interval = 10):
+def codec_requests(connection, interval = 5):
     """
-    Thread for communication with the codec. Started after the websocket connection is established.
+    Session with the codec, called by ConnectionSupervisor in its worker thread after each websocket connect.
     Workflow:
-    1. push panel specification file to the codec (create or update it)
-    2. start a router polling thread
-    3. run an infinite loop which can for example talk to codec or do other things
-    """
+    1. read the widget state and push the panel specification file to the codec, unless the codec already has it
+    2. subscribe for the UI events
+    3. start the router polling (once, the polling thread is reused after a reconnect)
+    4. run a loop which can for example talk to codec or do other things, until the connection is closed
     
-    global router_ip
+    Parameters:
+        connection (supervisor.Connection): websocket connection
+        interval (float): period of the loop
+    """
     
-    rpc_reg = CodecRPCRegister(ws)
+    global router_ip, active_rpc
     
-    setup_router_panel(rpc_reg, ROUTER_PANEL)
+    rpc_reg = CodecRPCRegister(connection.ws, rpc_timeout = CODEC_CONFIG.get("rpc_timeout", DEFAULT_RPC_TIMEOUT),
+        max_pending = LIMITS["max_pending_rpc"], max_rate = CODEC_CONFIG.get("max_rate"),
+        max_queue = LIMITS["max_outbound_queue"], max_feedback = LIMITS["max_feedback"])
+    connection.rpc = rpc_reg
+    metrics.QUEUE_DEPTH.set_function(lambda: {
+        ("outbound",): rpc_reg.outbound_stats()["depth"],
+        ("rpc_pending",): rpc_reg.rpc_metrics()["in_flight"],
+        ("ui_handlers",): ui_dispatcher.pending()
+    })
+    metrics.OLDEST_PENDING.set_function(lambda: rpc_reg.rpc_metrics()["oldest_pending_age"])
+    PROFILER.track("rpc_pending", lambda: len(rpc_reg._msg_register))
+    PROFILER.track("feedback_callbacks", lambda: len(rpc_reg._feedback_register))
+    PROFILER.track("widget_cache", lambda: len(rpc_reg.widgets.values()))
     
-    # test_req = {'jsonrpc': '2.0', 'id': 101, 'method': 'xGet', 'params': {'Path': ['Status', 'SystemUnit']}}
     try:
-        rpc_reg.feedback_subscribe(["Event", "UserInterface", "Extensions"], ui_event)
-    except Exception as e:
-        logger.error("Subscribe exception: {}".format(e))    
+        saved = setup_router_panel(rpc_reg, ROUTER_PANEL)
+        if connection.number == 1 and boot_state:
+            panel_status.show_snapshot(rpc_reg, boot_state, first_paint)
+        # test_req = {'jsonrpc': '2.0', 'id': 101, 'method': 'xGet', 'params': {'Path': ['Status', 'SystemUnit']}}
+        rpc_reg.feedback_subscribe_all([
+            (["Event", "UserInterface", "Extensions"], ui_event),
+            (["Event", "UserInterface", "Message", "TextInput", "Response"], text_input_event)
+        ])
+        active_rpc = rpc_reg
+        ready = time.monotonic() - connection.opened_at
+        metrics.PANEL_READY.observe(ready, panel = "saved" if saved else "resumed")
+        logger.info("Panel usable {:.3f} s after connect #{} (panel {}){}".format(ready, connection.number,
+            "saved" if saved else "resumed",
+            ", {:.1f} s after disconnect".format(connection.outage + ready) if connection.outage is not None else ""))
         
-    # see config.py - if not testing, the router_ip is a default gateway of the docker
-    if TESTING["active"]:
-        router_ip = TESTING["router_ip"]
-    else:
-        router_ip = get_default_gateway_linux()
+        # see config.py - if not testing, the router_ip is a default gateway of the docker
+        if router_ip is None:
+            router_ip = TESTING["router_ip"] if TESTING["active"] else get_default_gateway_linux()
+        if connection.number == 1:
+            ui_dispatcher.submit("router_identity", refresh_router_identity, rpc_reg, boot_state.get("router"))
+        start_router_info(router_ip, ROUTER_CONFIG["username"], ROUTER_CONFIG["password"])
 
-    _thread.start_new_thread(periodic_router_info, (rpc_reg, router_ip, ROUTER_CONFIG["username"], ROUTER_CONFIG["password"]))      
-
-    color_index = 0
-    while True:
-        # logger.info("Codec request: {}".format(dir(ws)))
-        try:
-            # place periodic updates towards codec (e.g. router status) here
-            # another option is a periodic query of codec status, registration request, etc.
-            pass
-            # rpc_reg.send_rpc_message("xGet", {"Path": ["Status", "SystemUnit"]}, codec_status)
-            # panel button color cycle
-            color = BUTTON_COLORS[color_index]
-            rpc_reg.send_rpc_message("xCommand/UserInterface/Extensions/Panel/Update", {"PanelId": "router_mgmt", "Color": color})
-            color_index += 1
-            if color_index >= len(BUTTON_COLORS):
-                color_index = 0
-        except Exception as e:
-            logger.error("RPC exception: {}".format(e))          
-        time.sleep(interval)
+        color_index = 0
+        while not connection.closed.is_set():
+            # logger.info("Codec request: {}".format(dir(ws)))
+            try:
+                # place periodic updates towards codec (e.g. router status) here
+                # another option is a periodic query of codec status, registration request, etc.
+                pass
+                # rpc_reg.send_rpc_message("xGet", {"Path": ["Status", "SystemUnit"]}, codec_status)
+                # panel button color cycle, shed near the memory budget
+                if not FOOTPRINT_MONITOR.check():
+                    color = BUTTON_COLORS[color_index]
+                    rpc_reg.widgets.update_panel(ROUTER_PANEL_ID, "Color", color, flush = True)
+                    color_index += 1
+                    if color_index >= len(BUTTON_COLORS):
+                        color_index = 0
+                if logger.isEnabledFor(logging.DEBUG):
+                    # the statistics are collected only for the debug log
+                    logger.debug("RPC metrics: %s, outbound queue: %s, widget cache: %s, UI handlers: %s, polling: %s, footprint: %s",
+                        rpc_reg.rpc_metrics(), rpc_reg.outbound_stats(), rpc_reg.widgets.stats(), ui_dispatcher.stats(),
+                        poll_scheduler.stats(), FOOTPRINT_MONITOR.stats())
+            except Exception as e:
+                logger.error("RPC exception: {}".format(e))          
+            connection.closed.wait(interval)
+    finally:
+        if active_rpc is rpc_reg:
+            save_snapshot(force = True)
+            active_rpc = None
+        rpc_reg.close()
         
 def show_router_panel(codec_rpc, *args):
     """
@@ -284,133 +495,260 @@ def show_router_panel(codec_rpc, *args):
         logger.info("Show router panel")
         time.sleep(2) # safety delay after deployment
         codec_rpc.send_rpc_message("xCommand/UserInterface/Extensions/Panel/Open",
-            {"PanelId": "router", "PageId": "page_rtr_info"})
+            {"PanelId": "router", "PageId": ROUTER_INFO_PAGE})
     except Exception as e:
         logger.error("Panel show exception: {}".format(e))
                 
-def setup_router_panel(codec_rpc, panel = ROUTER_PANEL):
+def setup_router_panel(codec_rpc, panel = ROUTER_PANEL, panel_id = ROUTER_PANEL_ID):
     """
-    Send a panel definition to the codec and pop it up.
+    Send a panel definition to the codec and pop it up. The panel is not sent if the codec already has it -
+    the panel content didn't change since the last Panel/Save and all its widgets are present on the codec.
+    The widget values read from the codec are used as the known widget state.
     
     Parameters:
         codec_rpc: CodecRPCRegister object for communication with the codec
         panel (str): XML definition of the panel, see codec_ui.py
+        panel_id (str): panel id
+        
+    Returns:
+        bool: True if the panel was saved
     """
     
+    try:
+        widgets = status_widgets(codec_rpc.widgets.resync().wait())
+    except RPCError as e:
+        logger.error("Widget state read failed: {}".format(e))
+        widgets = []
+    if not _saved_panels.needs_save(panel_id, panel, widgets):
+        logger.info("Router panel unchanged, not saved")
+        return False
     try:
         logger.info("Setup router panel")
-        codec_rpc.send_rpc_message("xCommand/UserInterface/Extensions/Panel/Save",
-            {"PanelId": "router_mgmt", "body": ROUTER_PANEL}, show_router_panel)
+        codec_rpc.call("xCommand/UserInterface/Extensions/Panel/Save", {"PanelId": panel_id, "body": panel})
+        _saved_panels.saved(panel_id, panel)
+        save_snapshot(force = True)
+        codec_rpc.widgets.resync()
+        ui_dispatcher.submit("show_panel", show_router_panel, codec_rpc)
     except Exception as e:
+        _saved_panels.forget(panel_id)
         logger.error("Panel setup exception: {}".format(e))
+    return True
         
-def periodic_router_info(codec_rpc, router_ip, username, password, interval = 10):
+def refresh_router_identity(codec_rpc, stale = None):
     """
-    Inifinite loop which periodically polls the router and sends the information to the codec's touch panel.
+    Get the router hostname, model and version for the state snapshot. If the panel still shows
+    the stale identity from the snapshot, it's replaced.
     
     Parameters:
         codec_rpc: CodecRPCRegister object for communication with the codec
+        stale (str): router identity shown from the snapshot
+    """
+    
+    global router_identity
+    
+    try:
+        router_identity = get_router_version(router_ip, ROUTER_CONFIG["username"], ROUTER_CONFIG["password"])
+    except Exception as e:
+        logger.error("Router identity exception: {}".format(e))
+        return
+    if stale is not None and router_identity != stale:
+        logger.info("Router identity changed: {} -> {}".format(stale, router_identity))
+        if codec_rpc.widgets.values(["show_result_1"]).get("show_result_1") == stale:
+            codec_rpc.widgets.set_value("show_result_1", router_identity, flush = True)
+    save_snapshot()
+    
+def save_snapshot(force = False):
+    """
+    Write the state snapshot: router status widgets, router identity and panel hashes. Rate-limited,
+    see SNAPSHOT in config.py.
+    
+    Parameters:
+        force (bool): write now regardless of the interval
+    """
+    
+    panel_status.save_snapshot(snapshot, active_rpc, router_identity, _saved_panels, force = force)
+        
+def start_router_info(router_ip, username, password):
+    """
+    Start sending the router information to the codec's touch panel - telemetry if configured, otherwise polling.
+    Started only once, after a reconnect the updates go to the new connection (active_rpc).
+    
+    Parameters:
         router_ip (str): router IP address
         username (str): router username
         password (str): router password
     """
     
-    logger.info("Starting perodic router info, ip: {}, interval: {}".format(router_ip, interval))
-    while True:
-        try:
-            mem_usage = get_memory_usage(router_ip, username, password)
-            codec_rpc.send_rpc_message("xCommand/UserInterface/Extensions/Widget/SetValue",
-                {"WidgetId": "rtr_mem_usage", "Value": mem_usage})
-            cpu_usage = get_cpu_usage(router_ip, username, password)
-            codec_rpc.send_rpc_message("xCommand/UserInterface/Extensions/Widget/SetValue",
-                {"WidgetId": "rtr_cpu_usage", "Value": cpu_usage})
-            now = datetime.now().isoformat()[:-7]
-            codec_rpc.send_rpc_message("xCommand/UserInterface/Extensions/Widget/SetValue",
-                {"WidgetId": "rtr_update", "Value": now})
-        except Exception as e:
-            logger.error("Periodic router exception: {}".format(e))
-            
-        time.sleep(interval)       
-                
-def on_open(ws):
+    global _telemetry_started
+    
+    if not TELEMETRY.get("active"):
+        periodic_router_info(router_ip, username, password)
+    elif not _telemetry_started:
+        _telemetry_started = True
+        start_router_telemetry(router_ip, username, password)
+    start_link_monitor(router_ip, username, password)
+        
+def poll_memory(router_ip, username, password):
     """
-    Called after successful websocket connection. Starts the codec_requests() thread.
+    Poll task of the router memory usage: query the router, add the sample to the history and update
+    the usage, trend and peak rows of the current connection, see periodic_router_info()
     
     Parameters:
-        ws: websocket object
+        router_ip (str): router IP address
+        username (str): router username
+        password (str): router password
     """
     
-    logger.info("Opened connection")
-    try:
-        logger.info("Start my loop")
-        _thread.start_new_thread(codec_requests, (ws, 5))
-    except Exception as e:
-        logger.error("Thread pool exception: {}".format(e))
+    codec_rpc = active_rpc
+    if codec_rpc is None:
+        return
+    mem_stat = restconf_query(router_ip, username, password, *MEMORY_QUERY)
+    values = panel_status.memory_values(mem_stat.get("Cisco-IOS-XE-memory-oper:memory-statistic") if mem_stat else None,
+        memory_history)
+    panel_status.show_status(codec_rpc, values, cpu_history, memory_history, HISTORY, first_paint)
+    save_snapshot()
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Restconf client stats: %s", restconf_client(router_ip, username, password).stats())
         
-def get_default_gateway_linux():
-    """Read the default gateway directly from /proc.
-    source: https://stackoverflow.com/questions/2761829/python-get-default-gateway-for-a-local-interface-ip-address-in-linux
+def poll_cpu(router_ip, username, password):
+    """
+    Poll task of the router CPU usage, see poll_memory(). The CPU usage is also reported to the poll scheduler
+    (backoff of the polling when the router is busy).
     
-    Returns:
-        str: IP address of the default gateway
+    Parameters:
+        router_ip (str): router IP address
+        username (str): router username
+        password (str): router password
     """
     
-    with open("/proc/net/route") as fh:
-        for line in fh:
-            fields = line.strip().split()
-            if fields[1] != '00000000' or not int(fields[3], 16) & 2:
-                # If not default route or not RTF_GATEWAY, skip it
-                continue
-
-            return socket.inet_ntoa(struct.pack("<L", int(fields[2], 16)))
-            
-def restconf_query(router_ip, username, password, module_name, xpath):
+    codec_rpc = active_rpc
+    if codec_rpc is None:
+        return
+    cpu_stat = restconf_query(router_ip, username, password, *CPU_QUERY)
+    cpu_info = cpu_stat.get("Cisco-IOS-XE-process-cpu-oper:cpu-utilization") if cpu_stat else None
+    if cpu_info:
+        poll_scheduler.report_load(cpu_info["five-seconds"])
+    panel_status.show_status(codec_rpc, panel_status.cpu_values(cpu_info, cpu_history), cpu_history, memory_history,
+        HISTORY, first_paint)
+    save_snapshot()
+        
+def periodic_router_info(router_ip, username, password):
     """
-    Run a restconf GET request.
+    Poll the router and send the information to the codec's touch panel. Each metric has its own interval,
+    see POLLING in config.py. The router is polled faster while the Router Info page is open on the codec
+    and slower when the router is busy. The polling runs in the poll scheduler thread, it's started
+    only once. While the codec is disconnected, the router is not polled.
     
     Parameters:
         router_ip (str): router IP address
         username (str): router username
         password (str): router password
-        module_name (str): restconf module name
-        xpath (str): xPath or other restconf parameters for the module query
     """
     
-    router_url = "https://{}/restconf/data/{}:{}".format(router_ip, module_name, xpath)
-    logger.info("Restconf URL: {}".format(router_url))
-    headers = {
-        "Accept": "application/yang-data+json"
-    }
-    auth = (username, password)
-    rf_res = requests.get(router_url, headers = headers, auth = auth, verify = False)
-    logger.info("Response code: {}".format(rf_res.status_code))
-    
-    if rf_res.ok:
-        return rf_res.json()
-
-def get_memory_usage(router_ip, username, password):
+    memory = POLLING.get("memory", {})
+    cpu = POLLING.get("cpu", {})
+    poll_scheduler.add("memory", lambda: poll_memory(router_ip, username, password), memory.get("visible", 10), memory.get("hidden", 60))
+    poll_scheduler.add("cpu", lambda: poll_cpu(router_ip, username, password), cpu.get("visible", 10), cpu.get("hidden"))
+    if poll_scheduler.start():
+        logger.info("Starting perodic router info, ip: {}".format(router_ip))
+                
+def start_link_monitor(router_ip, username, password):
     """
-    Get IOS-XE memory usage and format it to a string.
+    Poll the WAN interface counters and the LTE signal and show the link quality rows of the Router Info page,
+    see LINK_MONITOR in config.py. The interfaces and the signal are queried concurrently, the rates are computed
+    from the counters of the previous poll. Runs in the poll scheduler also if the telemetry is active.
     
     Parameters:
         router_ip (str): router IP address
         username (str): router username
         password (str): router password
+    """
+    
+    def poll_link():
+        codec_rpc = active_rpc
+        if codec_rpc is None:
+            return
+        link = LINK_PLAN.run(restconf_client(router_ip, username, password))
+        link_monitor.update(link.get("interfaces"), link.get("radio"))
+        panel_status.set_values(codec_rpc, link_monitor.widget_values(LINK_WIDGETS, LINK_RADIO_WIDGET), flush = True)
         
-    Returns:
-        string: formatted result
+    poll_scheduler.add("link", poll_link, LINK_MONITOR.get("visible", DEFAULT_INTERVAL),
+        LINK_MONITOR.get("hidden", DEFAULT_HIDDEN_INTERVAL))
+    poll_scheduler.start()
+                
+def start_router_telemetry(router_ip, username, password):
     """
+    Subscribe to the router telemetry (YANG-push) and send the updates to the codec's touch panel
+    of the current connection. If the subscription fails or the telemetry session is lost,
+    periodic_router_info() polls the router until the subscription is re-established.
+    The subscription is retried with an exponential backoff.
     
-    mem_stat = restconf_query(router_ip, username, password, "Cisco-IOS-XE-memory-oper", "memory-statistics/memory-statistic")
-    if mem_stat:
-        for mem in mem_stat['Cisco-IOS-XE-memory-oper:memory-statistic']:
-            if mem["name"].lower() == "processor":
-                usage = "used: {}, free: {}".format(mem["used-memory"], mem["free-memory"])
-                return usage
-
-def get_cpu_usage(router_ip, username, password):
+    Parameters:
+        router_ip (str): router IP address
+        username (str): router username
+        password (str): router password
+    """
+    
+    import telemetry
+    
+    backoff = ReconnectBackoff(telemetry.RETRY_DELAY, telemetry.MAX_RETRY_DELAY)
+    subscribed_at = None
+    
+    def telemetry_update(name, data):
+        if name == "memory":
+            values = panel_status.memory_values(data.get("memory-statistic"), memory_history)
+        elif name == "cpu":
+            values = panel_status.cpu_values(data.get("cpu-utilization"), cpu_history)
+        else:
+            return
+        codec_rpc = active_rpc
+        if codec_rpc is None:
+            return
+        panel_status.show_status(codec_rpc, values, cpu_history, memory_history, HISTORY, first_paint)
+        save_snapshot()
+        
+    def telemetry_failed(error):
+        if subscribed_at is not None and time.monotonic() - subscribed_at >= STABLE_CONNECTION:
+            backoff.reset()
+        delay = backoff.next_delay()
+        logger.error("Telemetry failed: {}, polling the router, subscription retry in {:.1f} s".format(error, delay))
+        periodic_router_info(router_ip, username, password)
+        retry = threading.Timer(delay, subscribe)
+        retry.daemon = True
+        retry.start()
+        
+    def subscribe():
+        nonlocal subscribed_at
+        
+        if TELEMETRY.get("source") == "local":
+            connect = lambda *args: telemetry.LocalTelemetryPublisher()
+        else:
+            connect = telemetry.NcclientSession
+        source = telemetry.NetconfYangPush(router_ip, username, password, port = TELEMETRY.get("port", 830),
+            period = TELEMETRY.get("period", 1000), on_change = TELEMETRY.get("on_change", False), connect = connect)
+        # the polled metrics come from the telemetry, the polling is added again by telemetry_failed()
+        poll_scheduler.remove("memory")
+        poll_scheduler.remove("cpu")
+        try:
+            logger.info("Starting router telemetry, ip: {}, source: {}".format(router_ip, TELEMETRY.get("source", "netconf")))
+            source.start(receiver, on_error = telemetry_failed)
+        except ImportError as e:
+            logger.error("TELEMETRY is active but ncclient is not installed ({}), polling the router".format(e))
+            periodic_router_info(router_ip, username, password)
+            return
+        except Exception as e:
+            telemetry_failed(e)
+            return
+        subscribed_at = time.monotonic()
+    
+    receiver = telemetry.TelemetryReceiver(telemetry_update)
+    subscribe()
+                
+def restconf_client(router_ip, username, password):
     """
-    Get IOS-XE CPU usage and format it to a string.
+    Get a shared Restconf client for the router. The client keeps its connection to the router open,
+    so the periodic queries do not need a new TCP/TLS handshake. Slowly changing data (version, inventory,
+    routes) are cached, see QUERY_TTL in router_info.py.
     
     Parameters:
         router_ip (str): router IP address
@@ -418,15 +756,38 @@ def get_cpu_usage(router_ip, username, password):
         password (str): router password
         
     Returns:
-        string: formatted result
+        RestconfClient: client object
     """
+    
+    # requests is imported on the first router query, it's not needed for the panel setup
+    from restconf_client import RestconfClient, DEFAULT_TIMEOUT, DEFAULT_RETRIES, DEFAULT_BACKOFF_FACTOR
+    
+    key = (router_ip, username)
+    client = _restconf_clients.get(key)
+    if client is None:
+        client = RestconfClient(router_ip, username, password,
+            timeout = ROUTER_CONFIG.get("timeout", DEFAULT_TIMEOUT),
+            retries = ROUTER_CONFIG.get("retries", DEFAULT_RETRIES),
+            backoff_factor = ROUTER_CONFIG.get("backoff_factor", DEFAULT_BACKOFF_FACTOR),
+            pool_maxsize = LIMITS["query_workers"], # concurrent queries of the query plans
+            cache = ResponseCache(QUERY_TTL, LIMITS["cache_entries"], LIMITS["cache_bytes"]) if ROUTER_CONFIG.get("cache", True) else None)
+        client = _restconf_clients.setdefault(key, client)
+    return client
+            
+def restconf_query(router_ip, username, password, module_name, xpath):
+    """
+    Run a restconf GET request.
+    
+    Parameters:
+        router_ip (str): router IP address
+        username (str): router username
+        password (str): router password
+        module_name (str): restconf module name
+        xpath (str): xPath or other restconf parameters for the module query
+    """
+    
+    return restconf_client(router_ip, username, password).get(module_name, xpath)
 
-    cpu_stat = restconf_query(router_ip, username, password, "Cisco-IOS-XE-process-cpu-oper", "cpu-usage/cpu-utilization?fields=five-seconds;one-minute;five-minutes")
-    cpu_info = cpu_stat.get("Cisco-IOS-XE-process-cpu-oper:cpu-utilization")
-    if cpu_info:
-        usage = "5s: {:2d}%, 1m: {:2d}%, 5m: {:2d}%".format(cpu_info["five-seconds"], cpu_info["one-minute"], cpu_info["five-minutes"])
-        return usage
-        
 def get_routing_table(router_ip, username, password):
     """
     Get IOS-XE routing table.
@@ -440,13 +801,43 @@ def get_routing_table(router_ip, username, password):
         list: list of IP routes
     """
 
-    routing_res = restconf_query(router_ip, username, password, "Cisco-IOS-XE-native", "native/ip/route")
+    routing_res = restconf_query(router_ip, username, password, *ROUTES_QUERY)
     routing_data = routing_res["Cisco-IOS-XE-native:route"]["ip-route-interface-forwarding-list"]
     return routing_data
     
+def get_routes(router_ip, username, password):
+    """
+    Iterate over IOS-XE routing table. The routes are streamed from the operational RIB (ietf-routing),
+    so the whole table is never held in memory. If the RIB is not available, the configured static routes
+    are used instead.
+    
+    Parameters:
+        router_ip (str): router IP address
+        username (str): router username
+        password (str): router password
+        
+    Returns:
+        generator: normalized routes, see route_view.rib_route()
+    """
+    
+    started = False
+    try:
+        for route in iter_json_array(restconf_client(router_ip, username, password).stream(*RIB_QUERY), "ietf-routing:route"):
+            started = True
+            yield rib_route(route)
+        return
+    except Exception as e:
+        if started:
+            raise
+        logger.info("Operational RIB not available, using static routes: {}".format(e))
+    for route in get_routing_table(router_ip, username, password):
+        yield native_route(route)
+    
 def get_router_version(router_ip, username, password):
     """
     Get IOS-XE router hostname, IOS version and hardware model and format it to a string.
+    The version and inventory are queried concurrently, if the inventory doesn't arrive
+    before the deadline, the hardware model is "unknown".
     
     Parameters:
         router_ip (str): router IP address
@@ -455,23 +846,50 @@ def get_router_version(router_ip, username, password):
         
     Returns:
         string: formatted result
+        
+    Raises:
+        ValueError: the version is not available
     """
 
-    ios_info_res = restconf_query(router_ip, username, password, "Cisco-IOS-XE-native", "native?fields=version;hostname")
-    ios_info = ios_info_res["Cisco-IOS-XE-native:native"]
-    hw_info_res = restconf_query(router_ip, username, password, "Cisco-IOS-XE-device-hardware-oper", "device-hardware-data/device-hardware/device-inventory?fields=hw-type;part-number")
-    hw_info = hw_info_res["Cisco-IOS-XE-device-hardware-oper:device-inventory"]
-    model = "unknown"
-    for module in hw_info:
-        if module["hw-type"] == "hw-type-chassis":
-            model = module["part-number"]
-    result = "{}, hw: {}, sw: {}".format(ios_info["hostname"], model, ios_info["version"])
-    return result
+    result = VERSION_PLAN.run(restconf_client(router_ip, username, password))
+    if result.get("version") is None:
+        raise ValueError("Router version not available: {}".format(result.stats()))
+    return format_router_version(result.get("version"), result.get("inventory"))
+
+def profiling_switch():
+    """
+    Start the thread which switches the profiling on and off. The SIGUSR1 handler runs in the main thread,
+    which is also the websocket receive thread and may be inside a profiled section holding the profiler lock,
+    so the handler only sets the event and the profiling is started or stopped (results written) by this thread.
+
+    Returns:
+        threading.Event: event to be set by the signal handler
+    """
+
+    toggle = threading.Event()
+
+    def run():
+        while True:
+            toggle.wait()
+            toggle.clear()
+            PROFILER.toggle()
+
+    threading.Thread(target = run, name = "profiling_switch", daemon = True).start()
+    return toggle
             
 if __name__ == "__main__":
-    # just for testing & logging
-    router_ip = get_default_gateway_linux()
+    # see config.py - if not testing, the router_ip is a default gateway of the docker
+    router_ip = TESTING["router_ip"] if TESTING["active"] else get_default_gateway_linux()
     logger.info("Router IP: {}".format(router_ip))
+    boot_state = snapshot.load()
+    _saved_panels.load(boot_state.get("panels", {}))
+    
+    if FOOTPRINT_MONITOR.configure(FOOTPRINT):
+        logger.info("Low-footprint mode, limits: {}".format(LIMITS))
+    
+    if METRICS.get("active"):
+        metrics.MetricsServer(host = METRICS.get("host", metrics.DEFAULT_METRICS_HOST),
+            port = METRICS.get("port", metrics.DEFAULT_METRICS_PORT)).start()
     
     websocket.enableTrace(True)
     auth = b64encode("{}:{}".format(CODEC_CONFIG['username'], CODEC_CONFIG['password']).encode()).decode()
@@ -488,17 +906,24 @@ if __name__ == "__main__":
     # result = json.loads(ws.recv())
     
     # start a websocket connection. SSL didn't work in Python 3.5. Later versions are OK, so "wss:" is possible.
-    wsapp = websocket.WebSocketApp("ws://{}/ws".format(CODEC_CONFIG['ip']),
-        header=http_header,
-        on_open=on_open,
-        on_message=on_message,
-        on_error=on_error,
-        on_close=on_close)
-
-    # SSL version of the websocket start
-    # wsapp.run_forever(dispatcher=rel, sslopt={"cert_reqs": ssl.CERT_NONE})  # Set dispatcher to automatic reconnection
+    # SSL version: "wss://..." URL and run_options = {"sslopt": {"cert_reqs": ssl.CERT_NONE}}
+    supervisor = ConnectionSupervisor("ws://{}/ws".format(CODEC_CONFIG['ip']), codec_requests, header = http_header,
+        backoff = ReconnectBackoff(CODEC_CONFIG.get("min_reconnect_delay", MIN_RECONNECT_DELAY),
+            CODEC_CONFIG.get("max_reconnect_delay", MAX_RECONNECT_DELAY)))
+    signal.signal(signal.SIGTERM, lambda signum, frame: supervisor.stop())
+    # profiling on/off: kill -USR1 <pid>, see PROFILING in config.py
+    profiling_toggle = profiling_switch()
+    signal.signal(signal.SIGUSR1, lambda signum, frame: profiling_toggle.set())
+    if PROFILER.configure(PROFILING):
+        PROFILER.start()
+    if RECORDING.get("active"):
+        RECORDER.start(RECORDING.get("path", DEFAULT_RECORDING_PATH))
 
-    # connect and maintain websocket connection
-    wsapp.run_forever(dispatcher=rel)  # Set dispatcher to automatic reconnection
-    rel.signal(2, rel.abort)  # Keyboard Interrupt
-    rel.dispatch()
+    # connect and maintain websocket connection, reconnect with an exponential backoff
+    try:
+        supervisor.run()
+    except KeyboardInterrupt:
+        supervisor.stop()
+    PROFILER.stop()
+    RECORDER.stop()
+    save_snapshot(force = True)
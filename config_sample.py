@@ -1,17 +1,147 @@
 # connection to the codec
 # IP address can be determined from CDP by a restconf query to the router
+# optional: "rpc_timeout" - codec response timeout [s], "max_rate" - maximum messages per second sent to the codec,
+# "min_reconnect_delay", "max_reconnect_delay" - limits [s] of the exponential backoff of the reconnects
 CODEC_CONFIG = {
     "ip": "192.168.1.10",
     "username": "roomcontrol",
-    "password": "roomcontrol123"
+    "password": "roomcontrol123",
+    "rpc_timeout": 30,
+    "max_rate": 10,
+    "min_reconnect_delay": 1,
+    "max_reconnect_delay": 60
 }
 # router access information. The IP address is either a default gateway, or
 # if TESTING["active"] is True, it's set to TESTING["router_ip"]
+# optional Restconf client parameters: "timeout" - seconds or (connect, read) tuple,
+# "retries" - number of retries of a failed request, "backoff_factor" - delay multiplier between the retries,
+# "cache" - cache slowly changing responses (version, inventory, routes), see QUERY_TTL in router_info.py
 ROUTER_CONFIG = {
     "username": "admin",
-    "password": "admin"
+    "password": "admin",
+    "timeout": (5, 15),
+    "retries": 2,
+    "backoff_factor": 0.5,
+    "cache": True,
+    # maximum time [s] of the concurrent router queries (for example version and inventory),
+    # the results which arrive later are not shown
+    "query_deadline": 5
 }
+# optional multi-codec mode (python multi_codec.py): one process serves several codecs, each router
+# is polled once and the results are sent to all its codecs. The codec items which are not given
+# are taken from CODEC_CONFIG, the router items from ROUTER_CONFIG. "router" is a key of ROUTERS,
+# default is the first router. Without ROUTERS, the router is the default gateway (or TESTING["router_ip"]).
+# A router can have its own "link_monitor" and "wan_switch" items, see LINK_MONITOR and WAN_SWITCH
+# (give each router its own "history_path").
+# ROUTERS = {
+#     "site_a": {"ip": "10.62.8.34"}
+# }
+# CODECS = [
+#     {"name": "room_1", "ip": "192.168.1.10", "router": "site_a"},
+#     {"name": "room_2", "ip": "192.168.1.11", "router": "site_a"}
+# ]
 TESTING = {
     "active": False,
     "router_ip": "10.62.8.34"
 }
+# optional router telemetry (YANG-push over NETCONF, requires ncclient - optional in requirements.txt - and "netconf-yang"
+# on the router) instead of periodic Restconf polling. "period" is in centiseconds, "on_change" requests on-change updates,
+# "source": "local" uses a local stand-in NETCONF session with synthetic data instead of the router.
+# While the subscription fails or the session is lost, the router is polled and the subscription is retried.
+TELEMETRY = {
+    "active": False,
+    "port": 830,
+    "period": 1000,
+    "on_change": False
+}
+# codec user interface, "workers" - number of threads running the button handlers,
+# "route_page_size" - number of routes on a page of the routing table
+UI = {
+    "workers": 2,
+    "route_page_size": 10
+}
+# router polling intervals [s] of each metric while the Router Info page is visible / hidden (None - not polled),
+# "jitter" - random variation of the intervals, the polling slows down if the Restconf latency [s]
+# or the router CPU [%] exceed "latency_threshold" or "cpu_threshold"
+POLLING = {
+    "memory": {"visible": 10, "hidden": 60},
+    "cpu": {"visible": 5, "hidden": None},
+    "jitter": 0.1,
+    "latency_threshold": 2.0,
+    "cpu_threshold": 70
+}
+# link quality rows of the Router Info page: throughput, drop and error rates of the "interfaces"
+# (one row each, up to two) and the LTE signal if "cellular" is True (requires an LTE modem),
+# "visible", "hidden" - poll intervals [s] as in POLLING
+LINK_MONITOR = {
+    "interfaces": ["GigabitEthernet0/0/0", "Cellular0/1/0"],
+    "cellular": True,
+    "visible": 5,
+    "hidden": 60
+}
+# WAN path switchover from the Router Control page. Each path has a static default route
+# "ip route 0.0.0.0 0.0.0.0 <fwd> <distance>", the selected path gets "preferred_distance", the others
+# "backup_distance" (floating routes). "fwd" - outgoing interface or next hop of the route, "next_hop" - optional
+# next hop address shown in the RIB, the path keys are the values of the WAN Path buttons (see codec_ui.py).
+# After the change the RIB default route is polled every "probe_interval" [s] until it uses the new path,
+# at most "timeout" [s]. The switchover times are kept in "history_path" (JSON lines), None - memory only.
+WAN_SWITCH = {
+    "paths": {
+        "ethernet": {"fwd": "GigabitEthernet0/0/0", "label": "Ethernet"},
+        "lte": {"fwd": "Cellular0/1/0", "label": "LTE"}
+    },
+    "preferred_distance": 1,
+    "backup_distance": 10,
+    "probe_interval": 0.1,
+    "timeout": 30,
+    "history_path": None
+}
+# history of the router CPU and memory utilization shown as trend and peak rows on the panel,
+# "directory" - keep the history in memory-mapped files (mount a volume to keep it over container restarts),
+# None - memory only, "trend_window", "peak_window" - time windows [s] of the trend and peak rows
+HISTORY = {
+    "directory": None,
+    "trend_window": 3600,
+    "peak_window": 86400
+}
+# snapshot of the last known router status, router identity and panel hash, shown on the panel (as stale values)
+# right after startup, "path" - snapshot file (None disables it), "interval" - minimum time [s] between the writes
+SNAPSHOT = {
+    "path": "state_snapshot.json",
+    "interval": 60
+}
+# optional runtime profiling (cProfile of the hot paths, tracemalloc diff), switched on and off
+# by "kill -USR1 <pid>" or started with the application if "active" is True. Results are written to
+# a new subdirectory of "directory", the last "keep" results are kept. The profiling stops after
+# "max_duration" seconds, "sample_every": n profiles every n-th call of a hot path (lower overhead),
+# "memory": False disables tracemalloc
+PROFILING = {
+    "active": False,
+    "directory": "profiles",
+    "keep": 10,
+    "max_duration": 120,
+    "sample_every": 1,
+    "memory": True
+}
+# optional capture of the codec websocket messages and the Restconf requests and responses
+# for a replay without the devices: python -m bench.replay recording.jsonl.gz
+RECORDING = {
+    "active": False,
+    "path": "recording.jsonl.gz"
+}
+# low-footprint mode for the small IOx resource profiles: smaller queues, tables and thread pools (see LOW_FOOTPRINT_LIMITS
+# in footprint.py, "limits" overrides them) and a "memory_budget" [MB] of the resident memory. The memory and threads are checked
+# every "check_interval" [s], above "shed_ratio" of the budget the panel button color change and the trend rows are paused.
+# Without "active", the memory budget applies only if it's set.
+FOOTPRINT = {
+    "active": False,
+    "memory_budget": 64,
+    "shed_ratio": 0.9,
+    "check_interval": 10
+}
+# Prometheus metrics endpoint http://<host>:<port>/metrics, use host "0.0.0.0" to make it available outside the container
+METRICS = {
+    "active": False,
+    "host": "127.0.0.1",
+    "port": 9100
+}
@@ -0,0 +1,193 @@
+import gc
+import logging
+import threading
+import time
+from codec_rpc import MAX_PENDING_RPC, MAX_OUTBOUND_QUEUE, MAX_FEEDBACK_REGISTRATIONS
+from ui_dispatch import MAX_UI_PENDING
+from restconf_cache import DEFAULT_CACHE_ENTRIES, DEFAULT_CACHE_BYTES
+from query_plan import MAX_WORKERS
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MEMORY_BUDGET = 64 # MB, resident memory of the process
+DEFAULT_SHED_RATIO = 0.9 # fraction of the budget at which the optional work is shed
+SHED_HYSTERESIS = 0.05 # the optional work is resumed below (shed ratio - hysteresis) of the budget
+DEFAULT_CHECK_INTERVAL = 10 # seconds
+
+# sizes of the queues, tables and thread pools
+DEFAULT_LIMITS = {
+    "max_pending_rpc": MAX_PENDING_RPC,
+    "max_outbound_queue": MAX_OUTBOUND_QUEUE,
+    "max_feedback": MAX_FEEDBACK_REGISTRATIONS,
+    # the UI workers are set by UI["workers"] in config.py
+    "ui_pending": MAX_UI_PENDING,
+    "cache_entries": DEFAULT_CACHE_ENTRIES,
+    "cache_bytes": DEFAULT_CACHE_BYTES,
+    "query_workers": MAX_WORKERS
+}
+# low-footprint mode, enough for one panel and the router polling
+LOW_FOOTPRINT_LIMITS = {
+    "max_pending_rpc": 32,
+    "max_outbound_queue": 32,
+    "max_feedback": 8,
+    "ui_workers": 1,
+    "ui_pending": 4,
+    "cache_entries": 8,
+    "cache_bytes": 256 * 1024,
+    "query_workers": 2
+}
+
+# shown in the trend and peak rows while the optional work is shed
+TREND_PAUSED = "paused (memory budget)"
+
+RESIDENT_MEMORY = REGISTRY.gauge("process_resident_memory_bytes", "Resident memory of the process")
+MEMORY_BUDGET = REGISTRY.gauge("footprint_memory_budget_bytes", "Memory budget of the process, see FOOTPRINT in config.py")
+SHEDDING = REGISTRY.gauge("footprint_shedding", "1 while the optional work (button color cycle, trend rows) is shed")
+
+def footprint_limits(options):
+    """
+    Sizes of the queues, tables and thread pools of the configuration
+
+    Parameters:
+        options (dict): FOOTPRINT in config.py
+
+    Returns:
+        dict: DEFAULT_LIMITS, or LOW_FOOTPRINT_LIMITS if "active", updated by "limits"
+    """
+
+    limits = dict(LOW_FOOTPRINT_LIMITS if options.get("active") else DEFAULT_LIMITS)
+    limits.update(options.get("limits", {}))
+    return limits
+
+def process_status():
+    """
+    Resident memory and threads of the process from /proc/self/status
+
+    Returns:
+        dict: "rss" [bytes], "peak_rss" [bytes] and "threads", the memory items are missing if /proc is not available
+    """
+
+    fields = {"VmRSS": "rss", "VmHWM": "peak_rss", "Threads": "threads"}
+    status = {}
+    try:
+        with open("/proc/self/status") as status_file:
+            for line in status_file:
+                name, _, value = line.partition(":")
+                if name in fields:
+                    value = int(value.split()[0])
+                    status[fields[name]] = value * 1024 if name != "Threads" else value
+    except (OSError, ValueError) as e:
+        logger.debug("Process status not available: {}".format(e))
+    status.setdefault("threads", threading.active_count())
+    return status
+
+class FootprintMonitor:
+    """
+    Self-check of the process footprint: resident memory and thread count. When the memory nears
+    the budget, the optional work (button color cycle, trend and peak rows) is shed until the memory
+    drops again. The check is rate-limited, it can be called from the periodic loop of each connection.
+    """
+
+    def __init__(self, memory_budget = DEFAULT_MEMORY_BUDGET, shed_ratio = DEFAULT_SHED_RATIO,
+        check_interval = DEFAULT_CHECK_INTERVAL):
+        """
+        Initialize the FootprintMonitor object
+
+        Parameters:
+            memory_budget (float): memory budget [MB], None means no budget (the footprint is only reported)
+            shed_ratio (float): fraction of the budget at which the optional work is shed
+            check_interval (float): minimum time [s] between the checks
+        """
+
+        self.memory_budget = memory_budget
+        self.shed_ratio = shed_ratio
+        self.check_interval = check_interval
+        self.shedding = False
+        self.status = {}
+        self._checked = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "checks": 0,
+            "shed": 0,
+            "peak_threads": 0
+        }
+
+    def configure(self, options):
+        """
+        Set the parameters from FOOTPRINT in config.py. Without the low-footprint mode,
+        the memory budget applies only if it's configured.
+
+        Returns:
+            bool: True if the low-footprint mode is active
+        """
+
+        self.memory_budget = options.get("memory_budget", DEFAULT_MEMORY_BUDGET if options.get("active") else None)
+        self.shed_ratio = options.get("shed_ratio", DEFAULT_SHED_RATIO)
+        self.check_interval = options.get("check_interval", DEFAULT_CHECK_INTERVAL)
+        if self.memory_budget:
+            MEMORY_BUDGET.set(self.memory_budget * 1024 * 1024)
+        return bool(options.get("active"))
+
+    def check(self, force = False):
+        """
+        Read the process status and start or stop shedding the optional work
+
+        Parameters:
+            force (bool): check now regardless of the interval
+
+        Returns:
+            bool: True if the optional work is shed
+        """
+
+        now = time.monotonic()
+        with self._lock:
+            if not force and self._checked is not None and now - self._checked < self.check_interval:
+                return self.shedding
+            self._checked = now
+        status = process_status()
+        rss = status.get("rss")
+        with self._lock:
+            self.status = status
+            self._stats["checks"] += 1
+            self._stats["peak_threads"] = max(self._stats["peak_threads"], status["threads"])
+            if rss is not None:
+                RESIDENT_MEMORY.set(rss)
+            if rss is None or not self.memory_budget:
+                return self.shedding
+            usage = rss / (self.memory_budget * 1024 * 1024)
+            was_shedding = self.shedding
+            if usage >= self.shed_ratio:
+                self.shedding = True
+            elif usage < self.shed_ratio - SHED_HYSTERESIS:
+                self.shedding = False
+            SHEDDING.set(int(self.shedding))
+            if self.shedding and not was_shedding:
+                self._stats["shed"] += 1
+        if self.shedding and not was_shedding:
+            logger.warning("Memory {:.1f} MB of {} MB budget, {} threads, shedding optional work".format(rss / 1048576,
+                self.memory_budget, status["threads"]))
+            # release the garbage cycles now rather than at the next automatic collection
+            gc.collect()
+        elif was_shedding and not self.shedding:
+            logger.info("Memory {:.1f} MB of {} MB budget, optional work resumed".format(rss / 1048576, self.memory_budget))
+        else:
+            logger.debug("Memory %.1f MB, %d threads", rss / 1048576, status["threads"])
+        return self.shedding
+
+    def stats(self):
+        """
+        Get the footprint statistics.
+
+        Returns:
+            dict: number of checks and shedding periods, current "rss" [bytes], "threads" and "peak_threads"
+        """
+
+        with self._lock:
+            result = dict(self._stats)
+            result.update(self.status)
+            result["shedding"] = self.shedding
+        return result
+
+# shared footprint monitor of the application
+FOOTPRINT_MONITOR = FootprintMonitor()
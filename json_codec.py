@@ -0,0 +1,148 @@
+import json
+import logging
+import re
+from widget_cache import WIDGET_SET_VALUE
+
+logger = logging.getLogger(__name__)
+
+# optional fast JSON backends, the standard library is used if none of them is installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+MAX_TEMPLATES = 64 # number of methods with a pre-serialized request header
+MAX_WIDGET_TEMPLATES = 256 # number of widgets with a pre-serialized SetValue header
+
+FEEDBACK_EVENT = '"xFeedback/Event"'
+
+# message kinds, see peek()
+EVENT = "event"
+RESPONSE = "response"
+
+_EVENT_RE = re.compile(r'"method"\s*:\s*"xFeedback/Event"')
+_FEEDBACK_ID_RE = re.compile(r'"Id"\s*:\s*(\d+)')
+_MSG_ID_RE = re.compile(r'"id"\s*:\s*"?([^",}\s]+)')
+
+def _orjson_dumps(data):
+    # websocket text frames, the codec doesn't accept binary ones
+    return orjson.dumps(data).decode()
+
+def _ujson_dumps(data):
+    return ujson.dumps(data, ensure_ascii = False, escape_forward_slashes = False)
+
+# compact encoder created once, json.dumps() with arguments creates a new encoder for each call
+_json_encoder = json.JSONEncoder(ensure_ascii = False, separators = (",", ":"))
+
+BACKENDS = {"json": (json.loads, _json_encoder.encode)}
+if ujson is not None:
+    BACKENDS["ujson"] = (ujson.loads, _ujson_dumps)
+if orjson is not None:
+    BACKENDS["orjson"] = (orjson.loads, _orjson_dumps)
+
+BACKEND = None
+loads = None
+dumps = None
+
+def set_backend(name = None):
+    """
+    Select the JSON backend of the codec messages
+
+    Parameters:
+        name (str): "orjson", "ujson" or "json", None means the fastest installed one
+
+    Returns:
+        str: selected backend name
+    """
+
+    global BACKEND, loads, dumps
+    if name is None:
+        name = next(backend for backend in ("orjson", "ujson", "json") if backend in BACKENDS)
+    elif name not in BACKENDS:
+        logger.warning("JSON backend {} not installed, using the standard json module".format(name))
+        name = "json"
+    BACKEND = name
+    loads, dumps = BACKENDS[name]
+    _templates.clear()
+    _set_value.clear()
+    return name
+
+class MessageTemplate:
+    """
+    RPC request with the constant part ("jsonrpc" and "method") serialized once.
+    Only the parameters and the message id are serialized for each message.
+    """
+
+    def __init__(self, method):
+        self.method = method
+        self._head = '{"jsonrpc":"2.0","method":' + dumps(method) + ',"params":'
+
+    def render(self, msg_id, params):
+        """
+        Serialize the request
+
+        Parameters:
+            msg_id (str): message id
+            params (dict): request parameters
+
+        Returns:
+            str: JSON message
+        """
+
+        return self._head + dumps(params) + ',"id":' + dumps(msg_id) + "}"
+
+_templates = {} # method -> MessageTemplate
+_set_value = {} # widget id -> serialized Widget/SetValue message up to the value
+
+def encode_request(msg_id, method, params):
+    """
+    Serialize an RPC request. Widget/SetValue, the most frequent message, has the widget id
+    pre-serialized too, only the value is serialized.
+
+    Parameters:
+        msg_id (str): message id
+        method (str): RPC method
+        params (dict): request parameters
+
+    Returns:
+        str: JSON message
+    """
+
+    if method == WIDGET_SET_VALUE and len(params) == 2 and "Value" in params:
+        widget_id = params.get("WidgetId")
+        head = _set_value.get(widget_id)
+        if head is None and isinstance(widget_id, str):
+            head = '{"jsonrpc":"2.0","method":' + dumps(method) + ',"params":{"WidgetId":' + dumps(widget_id) + ',"Value":'
+            if len(_set_value) < MAX_WIDGET_TEMPLATES:
+                _set_value[widget_id] = head
+        if head is not None:
+            return head + dumps(params["Value"]) + '},"id":' + dumps(msg_id) + "}"
+    template = _templates.get(method)
+    if template is None:
+        template = MessageTemplate(method)
+        if len(_templates) < MAX_TEMPLATES:
+            _templates[method] = template
+    return template.render(msg_id, params)
+
+def peek(message):
+    """
+    Classify a codec message without decoding it. Used to drop the messages nobody waits for
+    (events of an old subscription, responses to expired requests) before json decoding.
+
+    Parameters:
+        message (str): JSON message from the codec
+
+    Returns:
+        tuple: (EVENT, feedback id candidates) or (RESPONSE, message id candidates). The candidates
+            contain all matching keys of the message, the top-level one is among them.
+    """
+
+    if FEEDBACK_EVENT in message and _EVENT_RE.search(message):
+        return EVENT, [int(feedback_id) for feedback_id in _FEEDBACK_ID_RE.findall(message)]
+    return RESPONSE, _MSG_ID_RE.findall(message)
+
+set_backend()
@@ -0,0 +1,216 @@
+import logging
+import time
+from query_plan import QueryPlan, DEFAULT_DEADLINE
+from router_info import LINK_INTERFACES_QUERY, LINK_RADIO_QUERY
+
+logger = logging.getLogger(__name__)
+
+# monitored interfaces of the IR1101: Ethernet WAN and the LTE modem, see LINK_MONITOR in config.py
+DEFAULT_INTERFACES = ["GigabitEthernet0/0/0", "Cellular0/1/0"]
+DEFAULT_INTERVAL = 5 # seconds, while the Router Info page is visible
+DEFAULT_HIDDEN_INTERVAL = 60 # seconds, keeps the counter baseline so the first visible sample has rates
+
+# interface counters (statistics leaf, width in bits) in the order of the stored samples
+COUNTERS = (
+    ("in-octets", 64),
+    ("out-octets", 64),
+    ("in-discards", 32),
+    ("out-discards", 32),
+    ("in-errors", 32),
+    ("out-errors", 32)
+)
+OPER_UP = "if-oper-state-ready"
+
+# short interface names shown on the panel
+SHORT_NAMES = (
+    ("TenGigabitEthernet", "Te"),
+    ("GigabitEthernet", "Gi"),
+    ("FastEthernet", "Fa"),
+    ("Cellular", "Cell"),
+    ("Tunnel", "Tu"),
+    ("Vlan", "Vl")
+)
+
+def counter_delta(previous, current, bits = 64):
+    """
+    Increment of a counter between two samples. A counter which went down either wrapped around
+    (the previous value was in the upper half of the range) or was cleared (router reload, clear counters).
+
+    Parameters:
+        previous (int): previous value
+        current (int): current value
+        bits (int): counter width
+
+    Returns:
+        int: increment
+    """
+
+    if current >= previous:
+        return current - previous
+    modulus = 1 << bits
+    wrapped = current + modulus - previous
+    if wrapped <= modulus // 2:
+        return wrapped
+    return current
+
+def short_name(interface):
+    for prefix, short in SHORT_NAMES:
+        if interface.startswith(prefix):
+            return short + interface[len(prefix):]
+    return interface
+
+def format_rate(value):
+    """
+    Format a rate with a k/M/G suffix, for example 1234567 -> "1.2M"
+    """
+
+    for limit, suffix in ((1e9, "G"), (1e6, "M"), (1e3, "k")):
+        if value >= limit:
+            return "{:.1f}{}".format(value / limit, suffix)
+    return "{:.0f}".format(value)
+
+def format_link(interface, figures):
+    """
+    Format the interface figures to a string, for example "Gi0/0/0 up, rx 1.2M tx 340.0k bps, drop 0/s, err 0/s"
+
+    Parameters:
+        interface (str): interface name
+        figures (dict): see LinkMonitor.update()
+
+    Returns:
+        string: formatted result
+    """
+
+    if figures is None:
+        return "{}: no data".format(short_name(interface))
+    state = "{} {}".format(short_name(interface), "up" if figures["up"] else "down")
+    if figures.get("rx_bps") is None:
+        return "{}, measuring".format(state)
+    return "{}, rx {} tx {} bps, drop {:.3g}/s, err {:.3g}/s".format(state, format_rate(figures["rx_bps"]),
+        format_rate(figures["tx_bps"]), figures["drops"], figures["errors"])
+
+def format_radio(radio):
+    """
+    Format the LTE signal to a string, for example "Cell0/1/0 RSSI -67 dBm, RSRP -95 dBm, RSRQ -10 dB, SNR 12.5 dB"
+
+    Parameters:
+        radio (dict): cellwan-radio record, None if not available
+
+    Returns:
+        string: formatted result
+    """
+
+    if not radio:
+        return "no cellular data"
+    items = []
+    for leaf, label, unit in (("rssi", "RSSI", "dBm"), ("rsrp", "RSRP", "dBm"), ("rsrq", "RSRQ", "dB"), ("snr", "SNR", "dB")):
+        if radio.get(leaf) is not None:
+            items.append("{} {:g} {}".format(label, float(radio[leaf]), unit))
+    return "{} {}".format(short_name(radio.get("cellular-interface", "")), ", ".join(items) or "no signal").strip()
+
+def link_plan(options, deadline = DEFAULT_DEADLINE):
+    """
+    Concurrent query plan of the interface counters and the LTE signal
+
+    Parameters:
+        options (dict): LINK_MONITOR in config.py
+        deadline (float): maximum wall time [s] of the plan
+
+    Returns:
+        QueryPlan: "link" plan
+    """
+
+    queries = {"interfaces": LINK_INTERFACES_QUERY}
+    if options.get("cellular", True):
+        queries["radio"] = LINK_RADIO_QUERY
+    return QueryPlan("link", queries, deadline)
+
+class LinkMonitor:
+    """
+    Link quality of the router WAN interfaces: throughput, drop and error rates computed from the deltas
+    of the interface counters between two polls, and the LTE signal. Only the counters of the monitored
+    interfaces from the previous poll are kept, the responses are not stored.
+    """
+
+    def __init__(self, interfaces = DEFAULT_INTERFACES):
+        """
+        Initialize the LinkMonitor object
+
+        Parameters:
+            interfaces (list): names of the monitored interfaces, one panel row each
+        """
+
+        self.interfaces = list(interfaces)
+        self._previous = {} # interface name -> (sample time, counter values in the COUNTERS order)
+        self.figures = {} # interface name -> figures of the last poll, see update()
+        self.radio = None # cellwan-radio record of the last poll
+
+    def update(self, interfaces_res, radio_res = None, now = None):
+        """
+        Compute the interface figures from a new sample
+
+        Parameters:
+            interfaces_res (dict): response to LINK_INTERFACES_QUERY, None if not available
+            radio_res (dict): response to LINK_RADIO_QUERY, None if not available
+            now (float): sample time (time.monotonic()), default is now
+
+        Returns:
+            dict: interface name -> {"up", "rx_bps", "tx_bps", "drops", "errors"} (rates are None on the first sample),
+                None if the interface is not in the response
+        """
+
+        if now is None:
+            now = time.monotonic()
+        records = {}
+        for record in (interfaces_res or {}).get("Cisco-IOS-XE-interfaces-oper:interface", []):
+            if record.get("name") in self.interfaces:
+                records[record["name"]] = record
+        figures = {}
+        for name in self.interfaces:
+            record = records.get(name)
+            if record is None:
+                figures[name] = None
+                if interfaces_res is not None:
+                    # interface removed or renamed, start again when it's back
+                    self._previous.pop(name, None)
+                continue
+            statistics = record.get("statistics", {})
+            try:
+                counters = tuple(int(statistics.get(leaf, 0)) for leaf, bits in COUNTERS)
+            except (TypeError, ValueError) as e:
+                logger.warning("Invalid counters of {}: {}".format(name, e))
+                figures[name] = None
+                continue
+            result = {"up": record.get("oper-status") == OPER_UP, "rx_bps": None, "tx_bps": None, "drops": None, "errors": None}
+            previous = self._previous.get(name)
+            if previous is not None and now > previous[0]:
+                elapsed = now - previous[0]
+                deltas = [counter_delta(old, new, bits) for old, new, (leaf, bits) in zip(previous[1], counters, COUNTERS)]
+                result["rx_bps"] = 8 * deltas[0] / elapsed
+                result["tx_bps"] = 8 * deltas[1] / elapsed
+                result["drops"] = (deltas[2] + deltas[3]) / elapsed
+                result["errors"] = (deltas[4] + deltas[5]) / elapsed
+            self._previous[name] = (now, counters)
+            figures[name] = result
+        self.figures = figures
+        # signal of the first monitored cellular interface, only the signal levels are kept
+        radios = (radio_res or {}).get("Cisco-IOS-XE-cellwan-oper:cellwan-radio", [])
+        self.radio = next((record for record in radios if record.get("cellular-interface") in self.interfaces),
+            radios[0] if radios else None)
+        return figures
+
+    def widget_values(self, widget_ids, radio_widget_id):
+        """
+        Format the figures of the last poll for the panel rows
+
+        Parameters:
+            widget_ids (list): widget of each monitored interface, in the order of the interfaces
+            radio_widget_id (str): widget of the LTE signal
+
+        Returns:
+            dict: widget id -> value
+        """
+
+        values = {widget_id: format_link(name, self.figures.get(name)) for name, widget_id in zip(self.interfaces, widget_ids)}
+        values[radio_widget_id] = format_radio(self.radio)
+        return values
@@ -0,0 +1,307 @@
+import logging
+import math
+import mmap
+import os
+import threading
+import time
+from array import array
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# downsampling tiers: (name, bucket length [s], number of buckets), 0 s means raw samples
+DEFAULT_TIERS = (
+    ("raw", 0, 720), # 1 hour of 5 s samples
+    ("1m", 60, 1440), # 1 day
+    ("15m", 900, 2976) # 31 days
+)
+DEFAULT_TREND_WINDOW = 3600 # seconds
+DEFAULT_PEAK_WINDOW = 86400 # seconds
+TREND_THRESHOLD = 2.0 # minimum change of the average considered as rising/falling
+
+_MAGIC = 0x52494e47 # "RING"
+_HEADER = 8 # doubles: magic, capacity, step, head, count, reserved
+_FIELDS = 5 # doubles per record: time, min, max, sum, count
+
+class RingBuffer:
+    """
+    Fixed-size buffer of aggregated samples (time, min, max, sum, count) stored in a flat array of doubles.
+    When it's full, the oldest record is overwritten. If a path is given, the array is memory-mapped
+    to the file, so the records survive restarts.
+    """
+
+    def __init__(self, capacity, step = 0, path = None):
+        """
+        Initialize the RingBuffer object
+
+        Parameters:
+            capacity (int): number of records
+            step (float): bucket length [s] of the records, stored in the file header
+            path (str): file to map the buffer to, None means memory only
+        """
+
+        self.capacity = capacity
+        self.step = step
+        self.path = path
+        self._mmap = None
+        size = _HEADER + capacity * _FIELDS
+        if path is None:
+            self._data = array("d", bytes(8 * size))
+        else:
+            self._data = self._open(path, size)
+        if self._data[0] != _MAGIC or self._data[1] != capacity or self._data[2] != step:
+            if path is not None and self._data[0]:
+                logger.warning("History file {} has a different format, starting a new history".format(path))
+            for index in range(size):
+                self._data[index] = 0.0
+            self._data[0], self._data[1], self._data[2] = _MAGIC, capacity, step
+
+    def _open(self, path, size):
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size != 8 * size:
+                os.ftruncate(fd, 8 * size)
+            self._mmap = mmap.mmap(fd, 8 * size)
+        finally:
+            os.close(fd)
+        return memoryview(self._mmap).cast("d")
+
+    def __len__(self):
+        return int(self._data[4])
+
+    def _offset(self, position):
+        """
+        Array offset of the record, position 0 is the oldest record
+        """
+
+        head = int(self._data[3])
+        return _HEADER + ((head - len(self) + position) % self.capacity) * _FIELDS
+
+    def append(self, record):
+        """
+        Add a record, the oldest record is overwritten if the buffer is full.
+
+        Parameters:
+            record (tuple): (time, min, max, sum, count)
+        """
+
+        head = int(self._data[3])
+        offset = _HEADER + head * _FIELDS
+        self._data[offset:offset + _FIELDS] = array("d", record)
+        self._data[3] = (head + 1) % self.capacity
+        self._data[4] = min(self.capacity, len(self) + 1)
+
+    def last(self):
+        """
+        Get the newest record
+
+        Returns:
+            tuple: (time, min, max, sum, count), None if the buffer is empty
+        """
+
+        if not len(self):
+            return None
+        offset = self._offset(len(self) - 1)
+        return tuple(self._data[offset:offset + _FIELDS])
+
+    def replace_last(self, record):
+        offset = self._offset(len(self) - 1)
+        self._data[offset:offset + _FIELDS] = array("d", record)
+
+    def first_time(self):
+        """
+        Get the time of the oldest record, None if the buffer is empty
+        """
+
+        if not len(self):
+            return None
+        return self._data[self._offset(0)]
+
+    def records(self, since = None, until = None):
+        """
+        Iterate over the records from the oldest one
+
+        Parameters:
+            since (float): skip the records older than this time
+            until (float): skip the records of this time and newer
+
+        Returns:
+            generator: (time, min, max, sum, count) tuples
+        """
+
+        for position in range(len(self)):
+            offset = self._offset(position)
+            if since is not None and self._data[offset] < since:
+                continue
+            if until is not None and self._data[offset] >= until:
+                continue
+            yield tuple(self._data[offset:offset + _FIELDS])
+
+    def flush(self):
+        if self._mmap is not None:
+            self._mmap.flush()
+
+    def close(self):
+        if self._mmap is not None:
+            self._data.release()
+            self._mmap.close()
+            self._mmap = None
+
+class MetricHistory:
+    """
+    History of one metric (for example CPU utilization) in downsampling tiers. Each sample is stored
+    in the raw tier and aggregated (min, max, sum, count) into the current bucket of the other tiers.
+    The memory use is fixed by the tier sizes.
+    """
+
+    def __init__(self, name, tiers = DEFAULT_TIERS, directory = None):
+        """
+        Initialize the MetricHistory object
+
+        Parameters:
+            name (str): metric name, used in the file names
+            tiers (tuple): (name, bucket length [s], number of buckets) tuples, see DEFAULT_TIERS
+            directory (str): directory of the memory-mapped history files, None means memory only
+        """
+
+        self.name = name
+        self._lock = threading.Lock()
+        self._tiers = []
+        if directory is not None:
+            os.makedirs(directory, exist_ok = True)
+        for tier_name, step, capacity in tiers:
+            path = os.path.join(directory, "{}_{}.ring".format(name, tier_name)) if directory is not None else None
+            self._tiers.append((tier_name, step, RingBuffer(capacity, step, path)))
+
+    def add(self, value, timestamp = None):
+        """
+        Record a sample
+
+        Parameters:
+            value (float): sample value
+            timestamp (float): sample time (Unix time), default is now
+        """
+
+        if value is None:
+            return
+        if timestamp is None:
+            timestamp = time.time()
+        with self._lock:
+            for tier_name, step, buffer in self._tiers:
+                if not step:
+                    buffer.append((timestamp, value, value, value, 1))
+                    continue
+                start = timestamp - timestamp % step
+                last = buffer.last()
+                if last is not None and last[0] == start:
+                    buffer.replace_last((start, min(last[1], value), max(last[2], value), last[3] + value, last[4] + 1))
+                else:
+                    buffer.append((start, value, value, value, 1))
+
+    def _tier(self, since):
+        """
+        Get the finest tier which covers the time since the given time, or the one with the longest history
+        """
+
+        best = None
+        for tier_name, step, buffer in self._tiers:
+            first = buffer.first_time()
+            if first is None:
+                continue
+            if first <= since:
+                return buffer
+            if best is None or first < best.first_time():
+                best = buffer
+        return best
+
+    def summary(self, window, now = None):
+        """
+        Aggregate the samples in the time window
+
+        Parameters:
+            window (float): length of the window [s] ending now
+            now (float): end of the window (Unix time), default is now
+
+        Returns:
+            dict: "min", "max", "avg", "count" and "peak_time" (time of the bucket with the maximum),
+                None if there are no samples
+        """
+
+        if now is None:
+            now = time.time()
+        since = now - window
+        with self._lock:
+            buffer = self._tier(since)
+            if buffer is None:
+                return None
+            result = {"min": math.inf, "max": -math.inf, "sum": 0.0, "count": 0, "peak_time": None}
+            # buckets which overlap the window start are included, the ones starting at its end are not
+            for start, low, high, total, count in buffer.records(since - buffer.step, now):
+                result["min"] = min(result["min"], low)
+                if high > result["max"]:
+                    result["max"], result["peak_time"] = high, start
+                result["sum"] += total
+                result["count"] += int(count)
+        if not result["count"]:
+            return None
+        result["avg"] = result.pop("sum") / result["count"]
+        return result
+
+    def trend(self, window, now = None):
+        """
+        Change of the average between the older and the newer half of the window
+
+        Returns:
+            float: difference of the averages, None if one of the halves has no samples
+        """
+
+        if now is None:
+            now = time.time()
+        newer = self.summary(window / 2, now)
+        older = self.summary(window / 2, now - window / 2)
+        if newer is None or older is None:
+            return None
+        return newer["avg"] - older["avg"]
+
+    def flush(self):
+        with self._lock:
+            for tier_name, step, buffer in self._tiers:
+                buffer.flush()
+
+    def close(self):
+        with self._lock:
+            for tier_name, step, buffer in self._tiers:
+                buffer.close()
+
+def format_window(seconds):
+    if seconds >= 86400 and seconds % 86400 == 0:
+        return "{}d".format(seconds // 86400)
+    if seconds >= 3600 and seconds % 3600 == 0:
+        return "{}h".format(seconds // 3600)
+    return "{}m".format(seconds // 60)
+
+def format_trend(history, window = DEFAULT_TREND_WINDOW, unit = "%"):
+    """
+    Format average, minimum and trend of the metric to a string, for example "1h avg: 12%, min: 3%, rising (+5%)"
+    """
+
+    summary = history.summary(window)
+    if summary is None:
+        return "no data"
+    change = history.trend(window)
+    if change is None or abs(change) < TREND_THRESHOLD:
+        direction = "steady"
+    else:
+        direction = "{} ({:+.0f}{})".format("rising" if change > 0 else "falling", change, unit)
+    return "{} avg: {:.0f}{}, min: {:.0f}{}, {}".format(format_window(window), summary["avg"], unit,
+        summary["min"], unit, direction)
+
+def format_peak(history, window = DEFAULT_PEAK_WINDOW, unit = "%"):
+    """
+    Format the peak value of the metric and its time to a string, for example "45% at 14:02"
+    """
+
+    summary = history.summary(window)
+    if summary is None:
+        return "-"
+    return "{:.0f}{} at {}".format(summary["max"], unit, datetime.fromtimestamp(summary["peak_time"]).strftime("%H:%M"))
@@ -0,0 +1,276 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_METRICS_HOST = "127.0.0.1"
+DEFAULT_METRICS_PORT = 9100
+# histogram buckets [s] suitable for both codec RPC and Restconf latencies
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _format_labels(names, values, extra = None):
+    pairs = ["{}=\"{}\"".format(name, _escape(value)) for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append("{}=\"{}\"".format(*extra))
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+class _Metric:
+    """
+    Base class of the metrics. Values are kept per label values tuple.
+    """
+
+    type_name = "untyped"
+
+    def __init__(self, name, help_text, labels = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {} # label values tuple -> value
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def _samples(self):
+        with self._lock:
+            return [(self.name, key, None, value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = ["# HELP {} {}".format(self.name, self.help_text), "# TYPE {} {}".format(self.name, self.type_name)]
+        for name, key, extra, value in self._samples():
+            lines.append("{}{} {}".format(name, _format_labels(self.labels, key, extra), _format_value(value)))
+        return lines
+
+class Counter(_Metric):
+    """
+    Monotonically increasing counter
+    """
+
+    type_name = "counter"
+
+    def inc(self, value = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+class Gauge(_Metric):
+    """
+    Current value. The value is either set by set() or read by a function at the collection time.
+    """
+
+    type_name = "gauge"
+
+    def __init__(self, name, help_text, labels = (), function = None):
+        super().__init__(name, help_text, labels)
+        self._function = function
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function):
+        """
+        Read the value by a function at the collection time.
+
+        Parameters:
+            function: returns a number, or a dict: label values tuple -> number if the gauge has labels
+        """
+
+        self._function = function
+
+    def _samples(self):
+        if self._function is None:
+            return super()._samples()
+        try:
+            values = self._function()
+        except Exception as e:
+            logger.debug("Gauge {} function exception: {}".format(self.name, e))
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [(self.name, key, None, value) for key, value in values.items()]
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values (latencies) in cumulative buckets
+    """
+
+    type_name = "histogram"
+
+    def __init__(self, name, help_text, labels = (), buckets = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            record = self._values.get(key)
+            if record is None:
+                record = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    record["counts"][index] += 1
+                    break
+            record["sum"] += value
+            record["count"] += 1
+
+    def _samples(self):
+        samples = []
+        with self._lock:
+            for key, record in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets, record["counts"]):
+                    cumulative += count
+                    samples.append((self.name + "_bucket", key, ("le", _format_value(bound)), cumulative))
+                samples.append((self.name + "_sum", key, None, round(record["sum"], 6)))
+                samples.append((self.name + "_count", key, None, record["count"]))
+        return samples
+
+class MetricsRegistry:
+    """
+    Collection of the metrics rendered in the Prometheus text format
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {} # name -> metric
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help_text, labels = ()):
+        return self._register(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels = (), function = None):
+        return self._register(Gauge(name, help_text, labels, function))
+
+    def histogram(self, name, help_text, labels = (), buckets = DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def render(self):
+        """
+        Render all metrics
+
+        Returns:
+            str: metrics in the Prometheus text exposition format
+        """
+
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+# codec communication
+RPC_REQUESTS = REGISTRY.counter("codec_rpc_requests_total", "Codec RPC requests by method and result (ok, error, timeout, evicted)",
+    ("method", "result"))
+RPC_LATENCY = REGISTRY.histogram("codec_rpc_duration_seconds", "Codec RPC round trip time", ("method",))
+RPC_DROPPED = REGISTRY.counter("codec_rpc_dropped_total",
+    "Codec messages nobody waits for (events of unknown subscriptions, late responses) by kind (event, response)", ("kind",))
+OUTBOUND_WAIT = REGISTRY.histogram("codec_outbound_wait_seconds", "Time the message spent in the outbound queue")
+WIDGET_FRESHNESS = REGISTRY.histogram("widget_update_freshness_seconds",
+    "Time from the router sample to the codec's acknowledgement of the widget update", ("widget",))
+CODEC_CONNECTIONS = REGISTRY.counter("codec_connections_total", "Codec websocket connections by result (open, failed, closed)",
+    ("result",))
+PANEL_READY = REGISTRY.histogram("codec_panel_ready_seconds",
+    "Time from the websocket connection to the usable panel (panel saved or resumed)", ("panel",))
+FIRST_PAINT = REGISTRY.gauge("codec_first_paint_seconds",
+    "Time from the application start to the first widget values acknowledged by the codec", ("source",))
+# router communication
+RESTCONF_REQUESTS = REGISTRY.counter("restconf_requests_total", "Restconf requests by path and HTTP status (cache, error)",
+    ("path", "status"))
+RESTCONF_LATENCY = REGISTRY.histogram("restconf_request_duration_seconds", "Restconf request duration", ("path",))
+QUERY_PLAN_DURATION = REGISTRY.histogram("restconf_query_plan_seconds",
+    "Concurrent query plan duration: wall time and summed time of the branches", ("plan", "kind"))
+QUERY_PLAN_BRANCHES = REGISTRY.counter("restconf_query_plan_branches_total",
+    "Query plan branches by result (ok, error, late)", ("plan", "result"))
+WAN_SWITCH_DURATION = REGISTRY.histogram("wan_switch_seconds",
+    "WAN path switchover: configuration change (switch) and time until the default route uses the new path (convergence)",
+    ("path", "phase"))
+WAN_SWITCHES = REGISTRY.counter("wan_switches_total", "WAN path switchovers by result (ok, rejected, timeout, error)",
+    ("path", "result"))
+# health, the functions are set by the application
+QUEUE_DEPTH = REGISTRY.gauge("codec_queue_depth", "Number of items in the internal queues", ("queue",))
+OLDEST_PENDING = REGISTRY.gauge("codec_rpc_oldest_pending_seconds", "Age of the oldest in-flight codec RPC request")
+THREADS = REGISTRY.gauge("process_threads", "Number of the active threads", function = threading.active_count)
+START_TIME = REGISTRY.gauge("process_start_time_seconds", "Start time of the process since the Unix epoch")
+START_TIME.set(round(time.time(), 3))
+
+def restconf_path(module_name, xpath):
+    """
+    Restconf path label. Query parameters are left out to keep the number of label values small.
+    """
+
+    return "{}:{}".format(module_name, xpath.split("?")[0])
+
+class MetricsServer:
+    """
+    HTTP server exposing the registry on /metrics, runs in a background thread.
+    """
+
+    def __init__(self, registry = REGISTRY, host = DEFAULT_METRICS_HOST, port = DEFAULT_METRICS_PORT):
+        """
+        Initialize the MetricsServer object
+
+        Parameters:
+            registry (MetricsRegistry): metrics to expose
+            host (str): listening address, use "0.0.0.0" to make the metrics available outside the container
+            port (int): listening port
+        """
+
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server = None
+
+    def start(self):
+        """
+        Start the server thread.
+        """
+
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = self.registry
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug("Metrics request: " + format, *args)
+
+        self._server = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target = self._server.serve_forever, name = "metrics", daemon = True).start()
+        logger.info("Metrics server listening on {}:{}".format(self.host, self.port))
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,314 @@
+# multi-codec version of codec_async.py - several codecs and routers served from one asyncio loop.
+# Start with: python multi_codec.py, see CODECS and ROUTERS in config.py
+
+import asyncio
+import logging
+import os
+import signal
+import time
+import config
+from config import CODEC_CONFIG, ROUTER_CONFIG, TESTING
+import metrics
+from codec_rpc import DEFAULT_RPC_TIMEOUT
+from codec_ui import LINK_WIDGETS, LINK_RADIO_WIDGET
+from widget_cache import PanelRegistry
+from router_info import get_default_gateway_linux
+from router_info import MEMORY_QUERY, CPU_QUERY
+from route_view import DEFAULT_PAGE_SIZE
+from link_monitor import LinkMonitor, link_plan, DEFAULT_INTERFACES, DEFAULT_INTERVAL, DEFAULT_HIDDEN_INTERVAL
+from wan_switch import wan_switch_config
+from query_plan import DEFAULT_DEADLINE
+from metric_history import MetricHistory
+from poll_scheduler import PollScheduler, DEFAULT_JITTER, DEFAULT_LATENCY_THRESHOLD, DEFAULT_CPU_THRESHOLD, POLL_RATE, POLL_BACKOFF
+from codec_async import AsyncCodecRPC, AsyncUIHandlers, setup_router_panel, show_router_panel, panel_color_cycle
+from codec_async import restconf_client, keep_connection, start_profiling, LIMITS, FOOTPRINT
+from footprint import FOOTPRINT_MONITOR
+from profiling import PROFILER
+import panel_status
+
+logger = logging.getLogger(__name__)
+
+UI_CONFIG = getattr(config, "UI", {})
+POLLING = getattr(config, "POLLING", {})
+HISTORY = getattr(config, "HISTORY", {})
+LINK_MONITOR = getattr(config, "LINK_MONITOR", {})
+WAN_SWITCH = getattr(config, "WAN_SWITCH", {})
+
+TENANTS = metrics.REGISTRY.gauge("codec_tenants", "Configured codecs by connection state (connected, disconnected)", ("state",))
+
+class RouterHub:
+    """
+    One router polled once for all its codecs. The poll results are kept as widget values
+    and sent to every connected codec subscribed to the router. The router is polled faster
+    while the Router Info page is open on at least one of the codecs.
+    """
+
+    def __init__(self, name, router_ip, router_config):
+        """
+        Initialize the RouterHub object
+
+        Parameters:
+            name (str): router name, see ROUTERS in config.py
+            router_ip (str): router IP address
+            router_config (dict): credentials and client parameters, see ROUTER_CONFIG in config.py
+        """
+
+        self.name = name
+        self.restconf = restconf_client(router_ip, router_config)
+        self.scheduler = PollScheduler(jitter = POLLING.get("jitter", DEFAULT_JITTER),
+            latency_threshold = POLLING.get("latency_threshold", DEFAULT_LATENCY_THRESHOLD),
+            cpu_threshold = POLLING.get("cpu_threshold", DEFAULT_CPU_THRESHOLD))
+        directory = HISTORY.get("directory")
+        if directory is not None:
+            directory = os.path.join(directory, name)
+        self.cpu_history = MetricHistory("cpu", directory = directory)
+        self.memory_history = MetricHistory("memory", directory = directory)
+        # the router items override LINK_MONITOR, for example other WAN interfaces
+        link = dict(LINK_MONITOR, **router_config.get("link_monitor", {}))
+        self.link_monitor = LinkMonitor(link.get("interfaces", DEFAULT_INTERFACES)[:len(LINK_WIDGETS)])
+        self.link_plan = link_plan(link, deadline = router_config.get("query_deadline", DEFAULT_DEADLINE))
+        # one switchover at a time for all codecs of the router, the router items override WAN_SWITCH
+        self.wan_switch = wan_switch_config(dict(WAN_SWITCH, **router_config.get("wan_switch", {})))
+        self.values = {} # widget id -> value of the last poll results
+        self.tenants = set() # connected CodecTenant objects
+        self._visible = set() # names of the codecs with the Router Info page open
+        memory = POLLING.get("memory", {})
+        cpu = POLLING.get("cpu", {})
+        self.scheduler.add("memory", self.poll_memory, memory.get("visible", 10), memory.get("hidden", 60))
+        self.scheduler.add("cpu", self.poll_cpu, cpu.get("visible", 10), cpu.get("hidden"))
+        self.scheduler.add("link", self.poll_link, link.get("visible", DEFAULT_INTERVAL), link.get("hidden", DEFAULT_HIDDEN_INTERVAL))
+
+    def attach(self, tenant):
+        """
+        Subscribe a connected codec to the poll results, it gets the last known values immediately.
+        """
+
+        self.tenants.add(tenant)
+        if self.values:
+            tenant.show(self.values)
+
+    def detach(self, tenant):
+        self.tenants.discard(tenant)
+        self.page_visible(tenant, False)
+
+    def page_visible(self, tenant, visible):
+        if visible:
+            self._visible.add(tenant.name)
+        else:
+            self._visible.discard(tenant.name)
+        self.scheduler.set_visible(bool(self._visible))
+
+    async def poll_memory(self):
+        if not self.tenants:
+            return
+        mem_stat = await self.restconf.get(*MEMORY_QUERY)
+        self.values.update(panel_status.memory_values(mem_stat.get("Cisco-IOS-XE-memory-oper:memory-statistic") if mem_stat else None,
+            self.memory_history))
+        self.publish()
+
+    async def poll_cpu(self):
+        if not self.tenants:
+            return
+        cpu_stat = await self.restconf.get(*CPU_QUERY)
+        cpu_info = cpu_stat.get("Cisco-IOS-XE-process-cpu-oper:cpu-utilization") if cpu_stat else None
+        if cpu_info:
+            self.scheduler.report_load(cpu_info["five-seconds"])
+        self.values.update(panel_status.cpu_values(cpu_info, self.cpu_history))
+        self.publish()
+
+    async def poll_link(self):
+        if not self.tenants:
+            return
+        link = await self.link_plan.run_async(self.restconf)
+        self.link_monitor.update(link.get("interfaces"), link.get("radio"))
+        self.values.update(self.link_monitor.widget_values(LINK_WIDGETS, LINK_RADIO_WIDGET))
+        self.publish()
+
+    def publish(self):
+        """
+        Update the trends and send the values to all connected codecs. The values are formatted once,
+        each codec's widget cache sends only the changed ones.
+        """
+
+        self.values = panel_status.status_values(self.values, self.cpu_history, self.memory_history, HISTORY)
+        for tenant in list(self.tenants):
+            tenant.show(self.values)
+
+    async def run(self):
+        """
+        Poll the router until cancelled
+        """
+
+        logger.info("Starting router {} polling, ip: {}".format(self.name, self.restconf.router_ip))
+        try:
+            await self.scheduler.run_async()
+        finally:
+            self.cpu_history.flush()
+            self.memory_history.flush()
+
+    def close(self):
+        self.restconf.close()
+        self.cpu_history.close()
+        self.memory_history.close()
+
+class CodecTenant:
+    """
+    One codec: its connection, panel and UI handlers. The router queries of the UI buttons
+    use the client of the codec's router. A failure of one codec doesn't affect the others.
+    """
+
+    def __init__(self, name, codec_config, hub):
+        """
+        Initialize the CodecTenant object
+
+        Parameters:
+            name (str): codec name
+            codec_config (dict): codec address, credentials and parameters, see CODEC_CONFIG in config.py
+            hub (RouterHub): router of the codec
+        """
+
+        self.name = name
+        self.config = codec_config
+        self.hub = hub
+        self.codec_rpc = None
+        self.saved_panels = PanelRegistry()
+        self.ui_handlers = AsyncUIHandlers(hub.restconf, self.page_event, hub.wan_switch,
+            page_size = UI_CONFIG.get("route_page_size", DEFAULT_PAGE_SIZE), max_pending = LIMITS["ui_pending"])
+
+    def page_event(self, event):
+        visible = panel_status.page_visible(event)
+        if visible is not None:
+            self.hub.page_visible(self, visible)
+
+    def show(self, values):
+        """
+        Send the router status widget values to the codec
+        """
+
+        codec_rpc = self.codec_rpc
+        if codec_rpc is None:
+            return
+        try:
+            panel_status.set_values(codec_rpc, values, flush = True)
+        except Exception as e:
+            logger.error("[{}] Widget update exception: {}".format(self.name, e))
+
+    async def session(self, ws, opened_at, outage):
+        """
+        Communication with the codec over one websocket connection, see codec_async.codec_session()
+        """
+
+        codec_rpc = AsyncCodecRPC(ws, rpc_timeout = self.config.get("rpc_timeout", DEFAULT_RPC_TIMEOUT),
+            max_pending = LIMITS["max_pending_rpc"], max_rate = self.config.get("max_rate"),
+            max_queue = LIMITS["max_outbound_queue"], max_feedback = LIMITS["max_feedback"])
+        runner = asyncio.ensure_future(codec_rpc.run())
+        tasks = []
+        try:
+            saved = await setup_router_panel(codec_rpc, self.saved_panels)
+            if saved:
+                tasks.append(asyncio.ensure_future(show_router_panel(codec_rpc)))
+            await codec_rpc.feedback_subscribe_all([
+                (["Event", "UserInterface", "Extensions"], self.ui_handlers.ui_event),
+                (["Event", "UserInterface", "Message", "TextInput", "Response"], self.ui_handlers.text_input_event)
+            ])
+            ready = time.monotonic() - opened_at
+            metrics.PANEL_READY.observe(ready, panel = "saved" if saved else "resumed")
+            logger.info("[{}] Panel usable {:.3f} s after connect".format(self.name, ready))
+            self.codec_rpc = codec_rpc
+            self.hub.attach(self)
+            tasks.append(asyncio.ensure_future(panel_color_cycle(codec_rpc, self.hub.scheduler, self.ui_handlers)))
+            await runner
+        finally:
+            self.hub.detach(self)
+            self.codec_rpc = None
+            for task in tasks + [runner]:
+                task.cancel()
+            await asyncio.gather(*tasks, runner, return_exceptions = True)
+
+    async def run(self, stop):
+        """
+        Keep the connection to the codec until stop is set
+        """
+
+        try:
+            await keep_connection(self.config, self.session, stop, name = self.name)
+        except Exception as e:
+            logger.error("[{}] Codec stopped: {}".format(self.name, e))
+
+def load_config():
+    """
+    Read the codecs and routers from config.py. Without CODECS, the single codec of CODEC_CONFIG is used,
+    without ROUTERS, the single router of ROUTER_CONFIG (default gateway or TESTING["router_ip"]).
+
+    Returns:
+        tuple: (codecs, routers), codecs: list of (name, codec config, router name),
+            routers: dict router name -> (router IP, router config)
+    """
+
+    routers = {}
+    for name, router in getattr(config, "ROUTERS", {}).items():
+        routers[name] = (router["ip"], dict(ROUTER_CONFIG, **router))
+    if not routers:
+        router_ip = TESTING["router_ip"] if TESTING["active"] else get_default_gateway_linux()
+        routers["default"] = (router_ip, ROUTER_CONFIG)
+    default_router = next(iter(routers))
+    codecs = []
+    for index, codec in enumerate(getattr(config, "CODECS", [])):
+        name = codec.get("name", codec.get("ip", str(index)))
+        router = codec.get("router", default_router)
+        if router not in routers:
+            raise ValueError("Codec {}: unknown router {}".format(name, router))
+        codecs.append((name, dict(CODEC_CONFIG, **codec), router))
+    if not codecs:
+        codecs.append((CODEC_CONFIG["ip"], CODEC_CONFIG, default_router))
+    return codecs, routers
+
+async def main():
+    """
+    Serve all codecs from one asyncio loop until SIGINT/SIGTERM. Each router is polled only once
+    (and only while at least one of its codecs is connected), the results are sent to all its codecs.
+    """
+
+    codecs, routers = load_config()
+    if FOOTPRINT_MONITOR.configure(FOOTPRINT):
+        logger.info("Low-footprint mode, limits: {}".format(LIMITS))
+    metrics_config = getattr(config, "METRICS", {"active": False})
+    if metrics_config.get("active"):
+        metrics.MetricsServer(host = metrics_config.get("host", metrics.DEFAULT_METRICS_HOST),
+            port = metrics_config.get("port", metrics.DEFAULT_METRICS_PORT)).start()
+    hubs = {name: RouterHub(name, router_ip, router_config) for name, (router_ip, router_config) in routers.items()}
+    tenants = [CodecTenant(name, codec_config, hubs[router]) for name, codec_config, router in codecs]
+    logger.info("Serving {} codecs, {} routers".format(len(tenants), len(hubs)))
+
+    # the metrics of all codecs and routers
+    connected = lambda: sum(1 for tenant in tenants if tenant.codec_rpc is not None)
+    TENANTS.set_function(lambda: {("connected",): connected(), ("disconnected",): len(tenants) - connected()})
+    metrics.QUEUE_DEPTH.set_function(lambda: {
+        ("outbound",): sum(tenant.codec_rpc.outbound_stats()["depth"] for tenant in tenants if tenant.codec_rpc),
+        ("rpc_pending",): sum(tenant.codec_rpc.rpc_metrics()["in_flight"] for tenant in tenants if tenant.codec_rpc),
+        ("ui_handlers",): sum(tenant.ui_handlers.pending() for tenant in tenants)
+    })
+    POLL_RATE.set_function(lambda: {("{}/{}".format(hub.name, task),): rate
+        for hub in hubs.values() for task, rate in hub.scheduler.rates().items()})
+    POLL_BACKOFF.set_function(lambda: max(hub.scheduler.backoff for hub in hubs.values()))
+    PROFILER.track("rpc_pending", lambda: sum(len(tenant.codec_rpc._msg_register) for tenant in tenants if tenant.codec_rpc))
+    PROFILER.track("feedback_callbacks",
+        lambda: sum(len(tenant.codec_rpc._feedback_register) for tenant in tenants if tenant.codec_rpc))
+
+    stop = asyncio.Event()
+    loop = asyncio.get_event_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    start_profiling(loop)
+
+    pollers = [asyncio.ensure_future(hub.run()) for hub in hubs.values()]
+    await asyncio.gather(*(tenant.run(stop) for tenant in tenants))
+    for poller in pollers:
+        poller.cancel()
+    await asyncio.gather(*pollers, return_exceptions = True)
+    PROFILER.stop()
+    for hub in hubs.values():
+        hub.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,238 @@
+import logging
+from datetime import datetime
+from codec_ui import ROUTER_INFO_PAGE, STATUS_WIDGETS, WAN_PATH_WIDGET, WAN_RESULT_WIDGET, WAN_HISTORY_WIDGET
+from codec_rpc import PRIORITY_INTERACTIVE, PRIORITY_PERIODIC
+from router_info import format_memory_usage, format_cpu_usage, memory_usage_percent
+from metric_history import DEFAULT_TREND_WINDOW, DEFAULT_PEAK_WINDOW, format_trend, format_peak, format_window
+from wan_switch import path_label
+from footprint import FOOTPRINT_MONITOR, TREND_PAUSED
+
+# Router Info page content shared by the threaded (codec_ws.py) and the asyncio (codec_async.py, multi_codec.py)
+# front ends. The front ends query the router and call these functions with the results.
+
+logger = logging.getLogger(__name__)
+
+TREND_WIDGETS = ("rtr_cpu_trend", "rtr_mem_trend", "rtr_peaks")
+
+def set_values(codec_rpc, values, flush = False, priority = PRIORITY_PERIODIC):
+    """
+    Set widget values on the codec, only the changed ones are sent, see WidgetStateCache
+
+    Parameters:
+        codec_rpc: CodecRPCRegister or AsyncCodecRPC object of the connection
+        values (dict): widget id -> value
+        flush (bool): send the changes now
+        priority (int): priority of the messages
+
+    Returns:
+        list: RPCFuture of the sent updates if flushed, otherwise empty
+    """
+
+    for widget_id, value in values.items():
+        codec_rpc.widgets.set_value(widget_id, value)
+    return codec_rpc.widgets.flush(priority) if flush else []
+
+def page_visible(event):
+    """
+    Visibility of the Router Info page from a panel page open/close event. The router is polled faster
+    while the page is open.
+
+    Parameters:
+        event (dict): Event part of Event/UserInterface/Extensions
+
+    Returns:
+        bool: True if the page was opened, False if it was closed or another page was opened,
+            None if the event doesn't change the visibility
+    """
+
+    # {'PageOpened': {'PageId': 'page_rtr_info', 'id': 1}, 'id': 1}
+    if "PageOpened" in event:
+        return event["PageOpened"].get("PageId") == ROUTER_INFO_PAGE
+    if "PageClosed" in event and event["PageClosed"].get("PageId") == ROUTER_INFO_PAGE:
+        return False
+    return None
+
+def memory_values(mem_stat, history):
+    """
+    Add the memory usage to the history and format it for the panel
+
+    Parameters:
+        mem_stat (dict): memory-statistic record, None if not available
+        history (MetricHistory): memory usage history
+
+    Returns:
+        dict: widget id -> value, empty if the record is not available
+    """
+
+    if not mem_stat:
+        return {}
+    history.add(memory_usage_percent(mem_stat))
+    return {"rtr_mem_usage": format_memory_usage(mem_stat)}
+
+def cpu_values(cpu_info, history):
+    """
+    Add the CPU usage to the history and format it for the panel
+
+    Parameters:
+        cpu_info (dict): cpu-utilization record, None if not available
+        history (MetricHistory): CPU usage history
+
+    Returns:
+        dict: widget id -> value, empty if the record is not available
+    """
+
+    if not cpu_info:
+        return {}
+    history.add(cpu_info["five-seconds"])
+    return {"rtr_cpu_usage": format_cpu_usage(cpu_info)}
+
+def trend_values(cpu_history, memory_history, options):
+    """
+    Format the trend and peak rows of the Router Info page. The rows are paused near the memory budget,
+    see footprint.py.
+
+    Parameters:
+        cpu_history (MetricHistory): CPU usage history
+        memory_history (MetricHistory): memory usage history
+        options (dict): HISTORY in config.py
+
+    Returns:
+        dict: widget id -> value
+    """
+
+    if FOOTPRINT_MONITOR.shedding:
+        return dict.fromkeys(TREND_WIDGETS, TREND_PAUSED)
+    trend_window = options.get("trend_window", DEFAULT_TREND_WINDOW)
+    peak_window = options.get("peak_window", DEFAULT_PEAK_WINDOW)
+    return {
+        "rtr_cpu_trend": format_trend(cpu_history, trend_window),
+        "rtr_mem_trend": format_trend(memory_history, trend_window),
+        "rtr_peaks": "{}: {} / {}".format(format_window(peak_window),
+            format_peak(cpu_history, peak_window), format_peak(memory_history, peak_window))
+    }
+
+def status_values(values, cpu_history, memory_history, options):
+    """
+    Complete the new router status values with the trend and peak rows and the Last Update time
+
+    Parameters:
+        values (dict): widget id -> value, see memory_values() and cpu_values()
+        cpu_history (MetricHistory): CPU usage history
+        memory_history (MetricHistory): memory usage history
+        options (dict): HISTORY in config.py
+
+    Returns:
+        dict: widget id -> value
+    """
+
+    result = dict(values)
+    result.update(trend_values(cpu_history, memory_history, options))
+    result["rtr_update"] = datetime.now().isoformat()[:-7]
+    return result
+
+def show_status(codec_rpc, values, cpu_history, memory_history, options, first_paint = None):
+    """
+    Send the new router status values with the trends and the Last Update time to the codec, see status_values()
+
+    Parameters:
+        codec_rpc: CodecRPCRegister or AsyncCodecRPC object of the connection
+        values (dict): widget id -> value
+        cpu_history (MetricHistory): CPU usage history
+        memory_history (MetricHistory): memory usage history
+        options (dict): HISTORY in config.py
+        first_paint (FirstPaint): reported when the codec acknowledges the first values
+    """
+
+    futures = set_values(codec_rpc, status_values(values, cpu_history, memory_history, options), flush = True)
+    if first_paint is not None:
+        first_paint.track(futures, "router")
+
+def snapshot_values(state):
+    """
+    Last known router status from the state snapshot. The values are marked as stale in the Last Update row.
+
+    Parameters:
+        state (dict): snapshot, see StateSnapshot.load()
+
+    Returns:
+        dict: widget id -> value
+    """
+
+    widgets = state.get("widgets", {})
+    values = {widget_id: widgets[widget_id] for widget_id in STATUS_WIDGETS if widget_id in widgets}
+    last_update = widgets.get("rtr_update", "")
+    if not last_update.endswith("(stale)"):
+        # the snapshot may have been saved before the values were refreshed
+        last_update = "{} (stale)".format(last_update).strip()
+    values["rtr_update"] = last_update
+    if state.get("router"):
+        values["show_result_1"] = state["router"]
+    return values
+
+def show_snapshot(codec_rpc, state, first_paint = None):
+    """
+    Show the last known router status from the state snapshot, so the panel is not empty until
+    the first router queries finish, see snapshot_values()
+
+    Parameters:
+        codec_rpc: CodecRPCRegister or AsyncCodecRPC object of the connection
+        state (dict): snapshot, see StateSnapshot.load()
+        first_paint (FirstPaint): reported when the codec acknowledges the values
+    """
+
+    futures = set_values(codec_rpc, snapshot_values(state), flush = True, priority = PRIORITY_INTERACTIVE)
+    if first_paint is not None:
+        first_paint.track(futures, "snapshot")
+
+def save_snapshot(snapshot, codec_rpc, router_identity, panels, force = False):
+    """
+    Write the state snapshot: router status widgets, router identity and panel hashes. Rate-limited,
+    see SNAPSHOT in config.py.
+
+    Parameters:
+        snapshot (StateSnapshot): snapshot file
+        codec_rpc: CodecRPCRegister or AsyncCodecRPC object of the connection, None while disconnected
+        router_identity (str): router hostname, model and version
+        panels (PanelRegistry): panels saved to the codec
+        force (bool): write now regardless of the interval
+    """
+
+    widgets = codec_rpc.widgets.values(STATUS_WIDGETS) if codec_rpc is not None else None
+    snapshot.save(widgets or None, router_identity, panels.export(), force = force)
+
+def show_wan_switching(codec_rpc, switch, path):
+    """
+    Start of the WAN path switchover: keep the selection of the user and show the progress
+
+    Parameters:
+        codec_rpc: CodecRPCRegister or AsyncCodecRPC object of the connection
+        switch (WanSwitch): WAN path switchover of the router
+        path (str): selected path
+
+    Returns:
+        bool: False if the path is unknown, the switchover should not start
+    """
+
+    if path not in switch.paths:
+        logger.info("Unknown WAN path: {}".format(path))
+        return False
+    codec_rpc.widgets.user_value(WAN_PATH_WIDGET, path)
+    codec_rpc.widgets.set_value(WAN_RESULT_WIDGET, "switching to {}...".format(path_label(switch.paths, path)),
+        flush = True, priority = PRIORITY_INTERACTIVE)
+    return True
+
+def show_wan_result(codec_rpc, switch, result):
+    """
+    Show the result of the WAN path switchover and the history of the convergence times
+
+    Parameters:
+        codec_rpc: CodecRPCRegister or AsyncCodecRPC object of the connection
+        switch (WanSwitch): WAN path switchover of the router
+        result (dict): see WanSwitch.switch()
+    """
+
+    values = switch.widget_values(result, WAN_RESULT_WIDGET, WAN_HISTORY_WIDGET)
+    if switch.active is not None:
+        # the selection follows the path actually used by the router
+        values[WAN_PATH_WIDGET] = switch.active
+    set_values(codec_rpc, values, flush = True, priority = PRIORITY_INTERACTIVE)
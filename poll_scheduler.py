@@ -0,0 +1,364 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+from metrics import REGISTRY
+from profiling import PROFILER
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JITTER = 0.1 # +-10 % of the interval
+DEFAULT_LATENCY_THRESHOLD = 2.0 # seconds
+DEFAULT_CPU_THRESHOLD = 70 # percent
+MAX_BACKOFF = 8
+RATE_WINDOW = 300 # seconds
+
+POLLS = REGISTRY.counter("router_polls_total", "Router polls by task and result (run, error, skipped_hidden, skipped_backoff)",
+    ("task", "result"))
+POLL_RATE = REGISTRY.gauge("router_poll_rate_per_minute", "Effective router poll rate", ("task",))
+POLL_BACKOFF = REGISTRY.gauge("router_poll_backoff", "Current poll interval multiplier")
+
+class PollTask:
+    """
+    Periodic router query with its own interval while the panel is visible and hidden
+    """
+
+    def __init__(self, name, function, visible_interval, hidden_interval = None):
+        """
+        Initialize the PollTask object
+
+        Parameters:
+            name (str): task name
+            function: function (or coroutine function for the asyncio scheduler) called without parameters
+            visible_interval (float): poll interval [s] while the panel is visible
+            hidden_interval (float): poll interval [s] while the panel is hidden, None means no polling
+        """
+
+        self.name = name
+        self.function = function
+        self.visible_interval = visible_interval
+        self.hidden_interval = hidden_interval
+        self.next_tick = 0.0
+        self.last_run = None
+        self.runs = deque() # run times in the RATE_WINDOW
+        self.stats = {
+            "runs": 0,
+            "errors": 0,
+            "skipped_hidden": 0,
+            "skipped_backoff": 0,
+            "latency_last": 0.0,
+            "latency_max": 0.0
+        }
+
+class PollScheduler:
+    """
+    Scheduler of the router polling. Each task is ticked at its "visible" interval (with a random jitter),
+    each tick either runs the task or is skipped:
+    - panel hidden: the task runs at its "hidden" interval or not at all
+    - router busy: if the query latency or the router CPU exceed the thresholds, the intervals are multiplied
+      by a backoff factor (doubled up to MAX_BACKOFF, halved when the router recovers)
+    When the panel becomes visible, all tasks run immediately. The panel is considered hidden at the start.
+    """
+
+    def __init__(self, jitter = DEFAULT_JITTER, latency_threshold = DEFAULT_LATENCY_THRESHOLD,
+        cpu_threshold = DEFAULT_CPU_THRESHOLD, max_backoff = MAX_BACKOFF):
+        """
+        Initialize the PollScheduler object
+
+        Parameters:
+            jitter (float): random variation of the intervals, fraction of the interval
+            latency_threshold (float): query latency [s] considered as a busy router
+            cpu_threshold (float): router CPU utilization [%] considered as a busy router
+            max_backoff (float): maximum interval multiplier
+        """
+
+        self.jitter = jitter
+        self.latency_threshold = latency_threshold
+        self.cpu_threshold = cpu_threshold
+        self.max_backoff = max_backoff
+        self.backoff = 1
+        self.visible = False # until the panel page is opened
+        self._cpu = None
+        self._cpu_reported = None # (time, PollTask which reported the CPU utilization)
+        self._running_task = None
+        self._lock = threading.Lock()
+        self._tasks = {} # name -> PollTask
+        self._wakeup = threading.Event()
+        self._notify = self._wakeup.set
+        self._running = False
+        self._started = time.monotonic()
+        self._last_report = self._started
+        POLL_RATE.set_function(lambda: {(name,): rate for name, rate in self.rates().items()})
+        POLL_BACKOFF.set_function(lambda: self.backoff)
+
+    def add(self, name, function, visible_interval, hidden_interval = None):
+        """
+        Add a task, a task with the same name is replaced (its counters are kept).
+        """
+
+        task = PollTask(name, function, visible_interval, hidden_interval)
+        with self._lock:
+            old = self._tasks.get(name)
+            if old is not None:
+                task.stats, task.runs, task.last_run = old.stats, old.runs, old.last_run
+            self._tasks[name] = task
+        self._notify()
+
+    def remove(self, name):
+        """
+        Remove a task, for example when its data come from the router telemetry.
+        """
+
+        with self._lock:
+            self._tasks.pop(name, None)
+        self._notify()
+
+    def set_visible(self, visible):
+        """
+        Panel visibility changed. If it became visible, all tasks are run immediately.
+        """
+
+        with self._lock:
+            if visible == self.visible:
+                return
+            self.visible = visible
+            if visible:
+                for task in self._tasks.values():
+                    task.next_tick = 0.0
+                    task.last_run = None
+        logger.info("Router panel {}, polling {}".format("visible" if visible else "hidden",
+            "resumed" if visible else "slowed down"))
+        self._notify()
+
+    def report_load(self, cpu):
+        """
+        Report router CPU utilization [%], it's used by the backoff on the next task completions, see current_load().
+        """
+
+        self._cpu = cpu
+        self._cpu_reported = (time.monotonic(), self._running_task)
+
+    def current_load(self, now = None):
+        """
+        Get the reported router CPU utilization unless it's stale - older than the poll interval
+        of the task which reported it. For example the CPU task doesn't run while the panel is hidden,
+        the backoff then depends only on the query latency.
+
+        Returns:
+            float: CPU utilization [%], None if not known
+        """
+
+        if self._cpu is None:
+            return None
+        if now is None:
+            now = time.monotonic()
+        reported, task = self._cpu_reported
+        if task is not None:
+            interval = task.visible_interval if self.visible else task.hidden_interval
+            # the tick tolerance and jitter are within one visible interval
+            if interval is None or now - reported > interval * self.backoff + task.visible_interval:
+                return None
+        return self._cpu
+
+    def _jittered(self, interval):
+        return interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def next_task(self):
+        """
+        Get the task with the earliest tick
+
+        Returns:
+            tuple: (PollTask or None, delay [s] until its tick)
+        """
+
+        with self._lock:
+            if not self._tasks:
+                return None, 1.0
+            task = min(self._tasks.values(), key = lambda task: task.next_tick)
+        return task, max(0.0, task.next_tick - time.monotonic())
+
+    def tick(self, task, now = None):
+        """
+        Decide if the task runs on this tick and schedule the next tick
+
+        Returns:
+            bool: True if the task should run now
+        """
+
+        if now is None:
+            now = time.monotonic()
+        task.next_tick = now + self._jittered(task.visible_interval)
+        interval = task.visible_interval if self.visible else task.hidden_interval
+        result = "run"
+        if interval is None:
+            result = "skipped_hidden"
+        elif task.last_run is not None:
+            # half of the tick interval tolerance, the ticks are jittered
+            since_last = now - task.last_run + task.visible_interval / 2
+            if since_last < interval and not self.visible:
+                result = "skipped_hidden"
+            elif since_last < interval * self.backoff:
+                result = "skipped_backoff"
+        if result != "run":
+            task.stats[result] += 1
+            POLLS.inc(task = task.name, result = result)
+            return False
+        task.last_run = now
+        task.runs.append(now)
+        return True
+
+    def record(self, task, duration, error = False):
+        """
+        Record the task completion and adjust the backoff factor
+        """
+
+        task.stats["runs"] += 1
+        task.stats["errors"] += int(error)
+        task.stats["latency_last"] = duration
+        task.stats["latency_max"] = max(task.stats["latency_max"], duration)
+        POLLS.inc(task = task.name, result = "error" if error else "run")
+        cpu = self.current_load()
+        busy = duration > self.latency_threshold or (cpu is not None and cpu > self.cpu_threshold)
+        backoff = min(self.max_backoff, self.backoff * 2) if busy else max(1, self.backoff // 2)
+        if backoff != self.backoff:
+            logger.info("Router {}, poll backoff: {}".format("busy" if busy else "recovered", backoff))
+            self.backoff = backoff
+        now = time.monotonic()
+        if now - self._last_report >= RATE_WINDOW:
+            self._last_report = now
+            logger.info("Poll statistics: {}".format(self.stats()))
+
+    def start(self):
+        """
+        Run the tasks in a background thread. The thread is started only once, the tasks added later
+        (for example after a reconnect) are run by the same thread.
+
+        Returns:
+            bool: False if the scheduler is already running
+        """
+
+        with self._lock:
+            if self._running:
+                return False
+            self._running = True
+        threading.Thread(target = self._run_loop, name = "router_poll", daemon = True).start()
+        return True
+
+    def run(self):
+        """
+        Run the tasks in the current thread until stop() is called.
+        """
+
+        self._running = True
+        self._run_loop()
+
+    def _run_loop(self):
+        logger.info("Poll scheduler started")
+        while self._running:
+            task, delay = self.next_task()
+            if delay > 0:
+                # wakes up when the panel visibility changes or a task is added
+                self._wakeup.wait(delay)
+                self._wakeup.clear()
+                continue
+            if not self.tick(task):
+                continue
+            start = time.monotonic()
+            error = False
+            self._running_task = task
+            try:
+                with PROFILER.section("poll/" + task.name):
+                    task.function()
+            except Exception as e:
+                error = True
+                logger.error("Poll task {} exception: {}".format(task.name, e))
+            finally:
+                self._running_task = None
+            self.record(task, time.monotonic() - start, error)
+        logger.info("Poll scheduler stopped")
+
+    async def run_async(self):
+        """
+        Run the tasks (coroutine functions) in the asyncio loop until cancelled.
+        """
+
+        import asyncio
+
+        wakeup = asyncio.Event()
+        loop = asyncio.get_event_loop()
+        self._notify = lambda: loop.call_soon_threadsafe(wakeup.set)
+        self._running = True
+        logger.info("Poll scheduler started")
+        try:
+            while True:
+                task, delay = self.next_task()
+                if delay > 0:
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    wakeup.clear()
+                    continue
+                if not self.tick(task):
+                    continue
+                start = time.monotonic()
+                error = False
+                self._running_task = task
+                try:
+                    with PROFILER.section("poll/" + task.name, profile = False):
+                        await task.function()
+                except Exception as e:
+                    error = True
+                    logger.error("Poll task {} exception: {}".format(task.name, e))
+                finally:
+                    self._running_task = None
+                self.record(task, time.monotonic() - start, error)
+        finally:
+            self._running = False
+            self._notify = self._wakeup.set
+
+    @property
+    def running(self):
+        return self._running
+
+    def stop(self):
+        self._running = False
+        self._wakeup.set()
+
+    def rates(self):
+        """
+        Get the effective poll rates
+
+        Returns:
+            dict: task name -> runs per minute in the last RATE_WINDOW seconds (at least one minute)
+        """
+
+        now = time.monotonic()
+        window = max(60, min(RATE_WINDOW, now - self._started))
+        result = {}
+        with self._lock:
+            for task in self._tasks.values():
+                while task.runs and task.runs[0] < now - RATE_WINDOW:
+                    task.runs.popleft()
+                result[task.name] = round(60 * len(task.runs) / window, 2)
+        return result
+
+    def stats(self):
+        """
+        Get the scheduler statistics
+
+        Returns:
+            dict: "visible", "backoff" and per task: runs, errors, skipped polls, latencies and effective rate
+        """
+
+        rates = self.rates()
+        result = {"visible": self.visible, "backoff": self.backoff, "tasks": {}}
+        with self._lock:
+            for task in self._tasks.values():
+                stats = dict(task.stats)
+                stats["latency_last"] = round(stats["latency_last"], 3)
+                stats["latency_max"] = round(stats["latency_max"], 3)
+                stats["rate_per_minute"] = rates.get(task.name, 0.0)
+                result["tasks"][task.name] = stats
+        return result
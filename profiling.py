@@ -0,0 +1,369 @@
+import io
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILE_DIRECTORY = "profiles"
+DEFAULT_KEEP = 10 # number of profiling results kept in the directory
+DEFAULT_MAX_DURATION = 120 # seconds, the profiling is stopped automatically
+DEFAULT_SAMPLE_EVERY = 1 # profile every n-th call of a section, the other calls are only timed
+DEFAULT_TRACE_FRAMES = 10 # tracemalloc traceback depth
+TOP_LINES = 40 # number of functions and memory allocation sites in the reports
+
+class _NoSection:
+    """
+    Section used while the profiling is off, it does nothing
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+_NO_SECTION = _NoSection()
+
+class _Section:
+    """
+    Named section of code (hot path) timed and profiled while the profiling is on, see Profiler.section()
+    """
+
+    def __init__(self, profiler, name, profile):
+        self._profiler = profiler
+        self._name = name
+        self._profile = profile
+        self._enabled = None
+
+    def __enter__(self):
+        self._enabled = self._profiler._enter(self._name, self._profile)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        duration = time.perf_counter() - self._start
+        self._profiler._exit(self._name, duration, self._enabled)
+        return False
+
+class Profiler:
+    """
+    Runtime profiling switched on and off by a signal or by the configuration. While it's on:
+    - the named sections (RPC message handling, poll tasks, UI handlers) are timed and profiled
+      by cProfile, each thread has its own profile, the profiles are merged on stop
+    - tracemalloc traces the memory allocations, the snapshots from the start and the stop are compared
+    - the sizes of the tracked tables (pending requests, feedback callbacks) are recorded
+    On stop, the results are written to a new subdirectory of the profile directory, only the last
+    "keep" results are kept. The overhead is limited by the maximum duration and by profiling only
+    every n-th call of a section. When the profiling is off, a section costs one attribute check.
+    """
+
+    def __init__(self, directory = DEFAULT_PROFILE_DIRECTORY, keep = DEFAULT_KEEP, max_duration = DEFAULT_MAX_DURATION,
+        sample_every = DEFAULT_SAMPLE_EVERY, memory = True, trace_frames = DEFAULT_TRACE_FRAMES):
+        """
+        Initialize the Profiler object
+
+        Parameters:
+            directory (str): directory of the profiling results
+            keep (int): number of results kept in the directory, the oldest ones are removed
+            max_duration (float): the profiling is stopped after this time [s], None means no limit
+            sample_every (int): profile every n-th call of a section
+            memory (bool): trace the memory allocations (tracemalloc)
+            trace_frames (int): tracemalloc traceback depth
+        """
+
+        self.directory = directory
+        self.keep = keep
+        self.max_duration = max_duration
+        self.sample_every = sample_every
+        self.memory = memory
+        self.trace_frames = trace_frames
+        self.active = False
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._tables = {} # name -> function returning the table size
+        self._reset()
+
+    def _reset(self):
+        self._profiles = [] # cProfile.Profile per thread
+        self._sections = {} # name -> {"calls", "profiled", "total", "max"}
+        self._open = 0 # sections being profiled
+        self._started = None
+        self._thread_wide = None
+        self._timer = None
+        self._tables_start = {}
+        self._memory_start = None
+        self._tracing = False
+
+    def configure(self, options):
+        """
+        Set the parameters from the configuration, see PROFILING in config.py
+
+        Returns:
+            bool: True if the profiling should start now ("active")
+        """
+
+        self.directory = options.get("directory", self.directory)
+        self.keep = options.get("keep", self.keep)
+        self.max_duration = options.get("max_duration", self.max_duration)
+        self.sample_every = max(1, options.get("sample_every", self.sample_every))
+        self.memory = options.get("memory", self.memory)
+        self.trace_frames = options.get("trace_frames", self.trace_frames)
+        return bool(options.get("active"))
+
+    def track(self, name, function):
+        """
+        Record the size of a table (for example pending RPC requests) at the start and the stop of the profiling.
+        A table with the same name is replaced.
+
+        Parameters:
+            name (str): table name
+            function: function without parameters returning the table size
+        """
+
+        self._tables[name] = function
+
+    def section(self, name, profile = True):
+        """
+        Context manager of a hot path attributed by name in the results. Use profile = False
+        for the sections which await in an asyncio loop, they are only timed.
+
+        Parameters:
+            name (str): section name, for example "rpc/message" or "poll/memory"
+            profile (bool): profile the section by cProfile
+        """
+
+        if not self.active:
+            return _NO_SECTION
+        return _Section(self, name, profile)
+
+    def _enter(self, name, profile):
+        with self._lock:
+            if not self.active:
+                return None
+            stats = self._sections.get(name)
+            if stats is None:
+                stats = self._sections[name] = {"calls": 0, "profiled": 0, "total": 0.0, "max": 0.0}
+            stats["calls"] += 1
+            if not profile or threading.get_ident() == self._thread_wide or getattr(self._local, "profile", None) is not None:
+                # not profiled, the whole thread is profiled or an outer section is profiled
+                return None
+            if (stats["calls"] - 1) % self.sample_every:
+                return None
+            stats["profiled"] += 1
+            self._open += 1
+            profile = getattr(self._local, "thread_profile", None)
+            if profile is None or profile not in self._profiles:
+                import cProfile
+                profile = self._local.thread_profile = cProfile.Profile()
+                self._profiles.append(profile)
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiler is active in this thread
+            with self._lock:
+                self._open -= 1
+            return None
+        self._local.profile = profile
+        return profile
+
+    def _exit(self, name, duration, profile):
+        if profile is not None:
+            profile.disable()
+            self._local.profile = None
+        with self._lock:
+            stats = self._sections.get(name)
+            if stats is not None:
+                stats["total"] += duration
+                stats["max"] = max(stats["max"], duration)
+            if profile is not None:
+                self._open -= 1
+
+    def _table_sizes(self):
+        sizes = {}
+        for name, function in self._tables.items():
+            try:
+                sizes[name] = function()
+            except Exception as e:
+                sizes[name] = "error: {}".format(e)
+        return sizes
+
+    def start(self, thread_wide = False, call_later = None):
+        """
+        Start the profiling
+
+        Parameters:
+            thread_wide (bool): profile everything in the calling thread (the asyncio loop thread),
+                stop() must be called from the same thread
+            call_later: function(delay, callback) which schedules the automatic stop, for example
+                loop.call_later of the asyncio loop, default is a timer thread
+
+        Returns:
+            bool: False if the profiling is already running
+        """
+
+        # the profilers are imported on the first start, they are not needed unless profiling
+        import cProfile
+        import tracemalloc
+
+        with self._lock:
+            if self.active:
+                return False
+            self._reset()
+            self._started = time.monotonic()
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.trace_frames)
+                self._tracing = True
+            self._memory_start = tracemalloc.take_snapshot()
+        self._tables_start = self._table_sizes()
+        if thread_wide:
+            profile = cProfile.Profile()
+            profile.enable()
+            self._profiles.append(profile)
+            self._thread_wide = threading.get_ident()
+        self.active = True
+        if self.max_duration:
+            if call_later is not None:
+                self._timer = call_later(self.max_duration, self.stop)
+            else:
+                self._timer = threading.Timer(self.max_duration, self.stop)
+                self._timer.daemon = True
+                self._timer.start()
+        logger.info("Profiling started{}".format(", stops in {} s".format(self.max_duration) if self.max_duration else ""))
+        return True
+
+    def stop(self):
+        """
+        Stop the profiling and write the results
+
+        Returns:
+            str: result directory, None if the profiling is not running or the results were not written
+        """
+
+        import tracemalloc
+
+        with self._lock:
+            if not self.active:
+                return None
+            self.active = False
+        if self._timer is not None:
+            self._timer.cancel()
+        if self._thread_wide is not None:
+            self._profiles[0].disable()
+        # wait for the sections which are being profiled in the other threads
+        deadline = time.monotonic() + 1.0
+        while self._open and time.monotonic() < deadline:
+            time.sleep(0.01)
+        duration = time.monotonic() - self._started
+        memory_stop = tracemalloc.take_snapshot() if self._memory_start is not None else None
+        if self._tracing:
+            tracemalloc.stop()
+        try:
+            path = self._write(duration, memory_stop)
+        except OSError as e:
+            logger.error("Profiling results not written: {}".format(e))
+            return None
+        finally:
+            self._memory_start = None
+        logger.info("Profiling stopped after {:.1f} s, results: {}".format(duration, path))
+        return path
+
+    def toggle(self, **kwargs):
+        """
+        Start the profiling if it's not running, otherwise stop it. Called on SIGUSR1, but not from the signal
+        handler itself: the handler may interrupt a section holding the lock, use a thread or the asyncio loop.
+        """
+
+        if self.active:
+            self.stop()
+        else:
+            self.start(**kwargs)
+
+    def _write(self, duration, memory_stop):
+        import pstats
+
+        path = os.path.join(self.directory, datetime.now().strftime("%Y%m%d-%H%M%S"))
+        if os.path.exists(path):
+            path += "-{}".format(os.getpid())
+        os.makedirs(path, exist_ok = True)
+        summary = {
+            "duration": round(duration, 3),
+            "sample_every": self.sample_every,
+            "sections": {name: {
+                "calls": stats["calls"],
+                "profiled": stats["profiled"],
+                "total_s": round(stats["total"], 6),
+                "avg_ms": round(1000 * stats["total"] / stats["calls"], 3) if stats["calls"] else 0.0,
+                "max_ms": round(1000 * stats["max"], 3)
+            } for name, stats in sorted(self._sections.items(), key = lambda item: -item[1]["total"])},
+            "tables": {"start": self._tables_start, "stop": self._table_sizes()}
+        }
+        with open(os.path.join(path, "sections.json"), "w") as summary_file:
+            json.dump(summary, summary_file, indent = 2)
+        stats = None
+        for profile in self._profiles:
+            profile_stats = pstats.Stats(profile)
+            if not profile_stats.stats:
+                continue
+            if stats is None:
+                stats = profile_stats
+            else:
+                stats.add(profile_stats)
+        if stats is not None:
+            stats.dump_stats(os.path.join(path, "cpu.prof"))
+            report = io.StringIO()
+            stats.stream = report
+            stats.sort_stats("cumulative").print_stats(TOP_LINES)
+            with open(os.path.join(path, "cpu.txt"), "w") as report_file:
+                report_file.write(report.getvalue())
+        if memory_stop is not None:
+            with open(os.path.join(path, "memory.txt"), "w") as report_file:
+                self._write_memory(report_file, memory_stop)
+        self._rotate()
+        return path
+
+    def _write_memory(self, report_file, memory_stop):
+        import tracemalloc
+
+        filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, __file__)
+        ]
+        start = self._memory_start.filter_traces(filters)
+        stop = memory_stop.filter_traces(filters)
+        traced = sum(stat.size for stat in stop.statistics("filename"))
+        report_file.write("Traced memory: {:.1f} KiB\n".format(traced / 1024))
+        report_file.write("Tables (start -> stop):\n")
+        stop_sizes = self._table_sizes()
+        for name, size in self._tables_start.items():
+            report_file.write("  {}: {} -> {}\n".format(name, size, stop_sizes.get(name)))
+        report_file.write("\nGrowth by file:\n")
+        for stat in stop.compare_to(start, "filename")[:TOP_LINES]:
+            report_file.write("  {}\n".format(stat))
+        report_file.write("\nGrowth by line:\n")
+        for stat in stop.compare_to(start, "lineno")[:TOP_LINES]:
+            report_file.write("  {}\n".format(stat))
+        report_file.write("\nLargest growth tracebacks:\n")
+        for stat in stop.compare_to(start, "traceback")[:5]:
+            report_file.write("  {} blocks, {:+.1f} KiB\n".format(stat.count_diff, stat.size_diff / 1024))
+            for line in stat.traceback.format():
+                report_file.write("    {}\n".format(line))
+
+    def _rotate(self):
+        """
+        Remove the oldest results, keep the last "keep" ones
+        """
+
+        results = sorted(entry for entry in os.listdir(self.directory)
+            if os.path.isdir(os.path.join(self.directory, entry)))
+        for entry in results[:max(0, len(results) - self.keep)]:
+            shutil.rmtree(os.path.join(self.directory, entry), ignore_errors = True)
+
+# shared profiler of the application
+PROFILER = Profiler()
@@ -0,0 +1,205 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from metrics import QUERY_PLAN_DURATION, QUERY_PLAN_BRANCHES
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DEADLINE = 5.0 # seconds
+MAX_WORKERS = 4
+
+_executor = None
+_executor_lock = threading.Lock()
+_max_workers = MAX_WORKERS
+
+def set_max_workers(max_workers):
+    """
+    Set the size of the shared thread pool, takes effect only before the first synchronous plan runs
+    """
+
+    global _max_workers
+    _max_workers = max_workers
+
+def _get_executor():
+    """
+    Shared thread pool of the synchronous plans, created on the first use
+    """
+
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers = _max_workers, thread_name_prefix = "query_plan")
+        return _executor
+
+class PlanResult:
+    """
+    Results of a QueryPlan run. The branches which failed or didn't finish before the deadline
+    have no result, the caller renders whatever arrived.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.results = {} # branch name -> decoded response
+        self.errors = {} # branch name -> error message
+        self.late = [] # branches not finished before the deadline
+        self.durations = {} # branch name -> duration [s] of the finished branches
+        self.wall_time = 0.0
+
+    def get(self, branch):
+        return self.results.get(branch)
+
+    @property
+    def complete(self):
+        return not self.errors and not self.late
+
+    @property
+    def summed_time(self):
+        """
+        Time [s] the branches would take if they ran one after another (the late ones are counted up to the deadline)
+        """
+
+        return sum(self.durations.values()) + len(self.late) * self.wall_time
+
+    def stats(self):
+        """
+        Get the run statistics
+
+        Returns:
+            dict: wall time, summed time of the branches, speedup and the failed and late branches
+        """
+
+        return {
+            "wall_time": round(self.wall_time, 3),
+            "summed_time": round(self.summed_time, 3),
+            "speedup": round(self.summed_time / self.wall_time, 2) if self.wall_time else 1.0,
+            "errors": dict(self.errors),
+            "late": list(self.late)
+        }
+
+class QueryPlan:
+    """
+    Independent Restconf GET requests (branches) run concurrently under one overall deadline.
+    The wall time of the plan is the time of the slowest branch instead of the sum of all of them.
+    A branch which fails or misses the deadline doesn't fail the plan, its result is just missing.
+    """
+
+    def __init__(self, name, queries, deadline = DEFAULT_DEADLINE):
+        """
+        Initialize the QueryPlan object
+
+        Parameters:
+            name (str): plan name, used in the logs and metrics
+            queries (dict): branch name -> (module name, xPath) query, see router_info.py
+            deadline (float): maximum wall time [s] of the plan
+        """
+
+        self.name = name
+        self.queries = dict(queries)
+        self.deadline = deadline
+
+    def run(self, client, deadline = None):
+        """
+        Run the queries in the shared thread pool
+
+        Parameters:
+            client (RestconfClient): router client
+            deadline (float): override of the plan deadline [s]
+
+        Returns:
+            PlanResult: results of the branches finished before the deadline
+        """
+
+        result = PlanResult(self.name)
+        start = time.monotonic()
+        durations = {}
+
+        def branch(name, query):
+            branch_start = time.monotonic()
+            try:
+                return client.get(*query)
+            finally:
+                durations[name] = time.monotonic() - branch_start
+
+        executor = _get_executor()
+        futures = {executor.submit(branch, name, query): name for name, query in self.queries.items()}
+        done, not_done = wait(futures, timeout = self.deadline if deadline is None else deadline)
+        for future in done:
+            name = futures[future]
+            result.durations[name] = durations[name]
+            try:
+                data = future.result()
+            except Exception as e:
+                result.errors[name] = str(e)
+                continue
+            if data is None:
+                # error response of the router, see RestconfClient.get()
+                result.errors[name] = "no data"
+            else:
+                result.results[name] = data
+        for future in not_done:
+            # the request itself can't be interrupted, its result is dropped
+            future.cancel()
+            result.late.append(futures[future])
+        return self._finished(result, start)
+
+    async def run_async(self, client, deadline = None):
+        """
+        Run the queries as asyncio tasks
+
+        Parameters:
+            client (AsyncRestconfClient): router client
+            deadline (float): override of the plan deadline [s]
+
+        Returns:
+            PlanResult: results of the branches finished before the deadline
+        """
+
+        import asyncio
+
+        result = PlanResult(self.name)
+        start = time.monotonic()
+        durations = {}
+
+        async def branch(name, query):
+            branch_start = time.monotonic()
+            try:
+                return await client.get(*query)
+            finally:
+                durations[name] = time.monotonic() - branch_start
+
+        tasks = {asyncio.ensure_future(branch(name, query)): name for name, query in self.queries.items()}
+        done, pending = await asyncio.wait(tasks, timeout = self.deadline if deadline is None else deadline)
+        for task in done:
+            name = tasks[task]
+            result.durations[name] = durations[name]
+            try:
+                data = task.result()
+            except Exception as e:
+                result.errors[name] = str(e)
+                continue
+            if data is None:
+                # error response of the router, see RestconfClient.get()
+                result.errors[name] = "no data"
+            else:
+                result.results[name] = data
+        for task in pending:
+            task.cancel()
+            result.late.append(tasks[task])
+        if pending:
+            await asyncio.gather(*pending, return_exceptions = True)
+        return self._finished(result, start)
+
+    def _finished(self, result, start):
+        result.wall_time = time.monotonic() - start
+        QUERY_PLAN_DURATION.observe(result.wall_time, plan = self.name, kind = "wall")
+        QUERY_PLAN_DURATION.observe(result.summed_time, plan = self.name, kind = "summed")
+        for name in self.queries:
+            QUERY_PLAN_BRANCHES.inc(plan = self.name,
+                result = "late" if name in result.late else "error" if name in result.errors else "ok")
+        stats = result.stats()
+        if result.complete:
+            logger.debug("Query plan %s: %s", self.name, stats)
+        else:
+            logger.warning("Query plan {} partial: {}".format(self.name, stats))
+        return result
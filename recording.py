@@ -0,0 +1,113 @@
+import gzip
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RECORDING_PATH = "recording.jsonl.gz"
+FLUSH_INTERVAL = 1.0 # seconds, maximum time the records stay in the file buffer
+
+class Recorder:
+    """
+    Capture of the codec and router traffic for a later replay (see bench/replay.py). Every websocket
+    message (in both directions), connection open/close and Restconf request with its response is
+    appended to a file as one compact JSON line with the time since the recording start.
+    A path ending with .gz is gzip-compressed. When the recorder is not started, record() returns
+    immediately.
+
+    Record types ("k"):
+    - "open", "close": codec websocket connection
+    - "in", "out": websocket message received from / sent to the codec ("m": message text)
+    - "rest": Restconf GET ("p": URL path, "s": HTTP status, "d": duration [s], "b": response body,
+      "e": ETag header)
+    """
+
+    def __init__(self):
+        self.active = False
+        self.path = None
+        self._file = None
+        self._lock = threading.Lock()
+        self._start = None
+        self._last_flush = 0.0
+        self.records = 0
+
+    def start(self, path):
+        """
+        Start the recording, the records are appended to the file
+
+        Parameters:
+            path (str): recording file, .gz means gzip compression
+        """
+
+        with self._lock:
+            if self.active:
+                return
+            self.path = path
+            self._file = gzip.open(path, "at", encoding = "utf-8") if path.endswith(".gz") else open(path, "a", encoding = "utf-8")
+            self._start = time.monotonic()
+            self.active = True
+        self.record("start", w = time.time())
+        logger.info("Recording traffic to {}".format(path))
+
+    def record(self, kind, **data):
+        """
+        Append a record
+
+        Parameters:
+            kind (str): record type, see the class description
+            data: record items
+        """
+
+        if not self.active:
+            return
+        now = time.monotonic()
+        data["t"] = round(now - self._start, 6)
+        data["k"] = kind
+        line = json.dumps(data, separators = (",", ":")) + "\n"
+        with self._lock:
+            if self._file is None:
+                return
+            try:
+                self._file.write(line)
+                self.records += 1
+                if now - self._last_flush >= FLUSH_INTERVAL:
+                    self._file.flush()
+                    self._last_flush = now
+            except (OSError, ValueError) as e:
+                logger.error("Recording stopped: {}".format(e))
+                self.active = False
+
+    def stop(self):
+        with self._lock:
+            self.active = False
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                logger.info("Recording stopped, {} records in {}".format(self.records, self.path))
+
+def read_recording(path):
+    """
+    Read a recording. A truncated last record (the application was killed) is skipped.
+
+    Parameters:
+        path (str): recording file, see Recorder
+
+    Returns:
+        generator: records (dict) in the recorded order
+    """
+
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding = "utf-8") as recording:
+        try:
+            for line in recording:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    logger.warning("Invalid record skipped: {:.80}".format(line))
+        except EOFError:
+            logger.warning("Recording {} is truncated".format(path))
+
+# shared recorder of the application, started by the RECORDING configuration
+RECORDER = Recorder()
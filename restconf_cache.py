@@ -0,0 +1,162 @@
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_CACHE_ENTRIES = 32
+DEFAULT_CACHE_BYTES = 2 * 1024 * 1024
+
+class CacheEntry:
+    """
+    Cached Restconf response
+    """
+
+    __slots__ = ("data", "etag", "last_modified", "expires", "size")
+
+    def __init__(self, data, etag, last_modified, expires, size):
+        self.data = data
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires = expires
+        self.size = size
+
+class ResponseCache:
+    """
+    LRU cache of decoded Restconf responses. Each query has its own TTL (queries without TTL are not cached).
+    Expired entries with ETag or Last-Modified are revalidated by a conditional request
+    (If-None-Match / If-Modified-Since) instead of being downloaded again.
+    """
+
+    def __init__(self, ttls = None, max_entries = DEFAULT_CACHE_ENTRIES, max_bytes = DEFAULT_CACHE_BYTES):
+        """
+        Initialize the ResponseCache object
+
+        Parameters:
+            ttls (dict): (module name, xPath) -> TTL in seconds
+            max_entries (int): maximum number of cached responses
+            max_bytes (int): maximum total size of the cached responses (size of the response body)
+        """
+
+        self.ttls = dict(ttls or {})
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # url -> CacheEntry
+        self._size = 0
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "revalidations": 0,
+            "evictions": 0
+        }
+
+    def ttl(self, module_name, xpath):
+        """
+        Get TTL of the query
+
+        Returns:
+            float: TTL in seconds, 0 if the query is not cached
+        """
+
+        return self.ttls.get((module_name, xpath), 0)
+
+    def lookup(self, url):
+        """
+        Find a cached response
+
+        Parameters:
+            url (str): request URL
+
+        Returns:
+            tuple: (fresh data or None, CacheEntry for revalidation or None)
+        """
+
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                return None, None
+            self._entries.move_to_end(url)
+            if entry.expires > time.monotonic():
+                self._stats["hits"] += 1
+                return entry.data, entry
+            if entry.etag is None and entry.last_modified is None:
+                self._remove(url)
+                return None, None
+            return None, entry
+
+    @staticmethod
+    def conditional_headers(entry):
+        """
+        Get headers of a conditional request for the stale entry
+
+        Returns:
+            dict: If-None-Match and/or If-Modified-Since headers
+        """
+
+        headers = {}
+        if entry is not None:
+            if entry.etag is not None:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified is not None:
+                headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def revalidated(self, url, entry, ttl):
+        """
+        Router confirmed that the entry didn't change (304 Not Modified).
+
+        Returns:
+            data of the entry
+        """
+
+        with self._lock:
+            self._stats["revalidations"] += 1
+            entry.expires = time.monotonic() + ttl
+        return entry.data
+
+    def store(self, url, data, etag, last_modified, ttl, size):
+        """
+        Store a response
+
+        Parameters:
+            url (str): request URL
+            data: decoded response
+            etag (str): ETag header of the response
+            last_modified (str): Last-Modified header of the response
+            ttl (float): TTL in seconds
+            size (int): size of the response body
+        """
+
+        with self._lock:
+            self._stats["misses"] += 1
+            if size > self.max_bytes:
+                return
+            if url in self._entries:
+                self._remove(url)
+            self._entries[url] = CacheEntry(data, etag, last_modified, time.monotonic() + ttl, size)
+            self._size += size
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def _remove(self, url):
+        entry = self._entries.pop(url)
+        self._size -= entry.size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        """
+        Get the cache counters.
+
+        Returns:
+            dict: hits, misses, revalidations, evictions, number of entries and their total size
+        """
+
+        with self._lock:
+            result = dict(self._stats)
+            result["entries"] = len(self._entries)
+            result["bytes"] = self._size
+        return result
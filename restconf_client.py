@@ -0,0 +1,310 @@
+import logging
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from restconf_cache import ResponseCache
+from metrics import RESTCONF_REQUESTS, RESTCONF_LATENCY, restconf_path
+from recording import RECORDER
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = (5, 15) # connect, read [s]
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF_FACTOR = 0.5
+RETRY_STATUS_CODES = [500, 502, 503, 504]
+
+class CountingHTTPAdapter(HTTPAdapter):
+    """
+    requests transport adapter which counts the new (TLS) connections and the requests
+    sent over the already established connections.
+    """
+
+    def __init__(self, stats, **kwargs):
+        """
+        Initialize the adapter
+
+        Parameters:
+            stats (RestconfStats): counters updated by the connection pools
+            kwargs: HTTPAdapter parameters (max_retries, pool_maxsize, ...)
+        """
+
+        self._stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        stats = self._stats
+
+        class _HTTPConnection(HTTPConnection):
+            def connect(self):
+                stats.add("handshakes")
+                return super().connect()
+
+        class _HTTPSConnection(HTTPSConnection):
+            def connect(self):
+                stats.add("handshakes")
+                return super().connect()
+
+        class _HTTPConnectionPool(HTTPConnectionPool):
+            ConnectionCls = _HTTPConnection
+            def _get_conn(self, *args, **kwargs):
+                stats.add("connection_gets")
+                return super()._get_conn(*args, **kwargs)
+
+        class _HTTPSConnectionPool(HTTPSConnectionPool):
+            ConnectionCls = _HTTPSConnection
+            def _get_conn(self, *args, **kwargs):
+                stats.add("connection_gets")
+                return super()._get_conn(*args, **kwargs)
+
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _HTTPConnectionPool,
+            "https": _HTTPSConnectionPool
+        }
+
+class RestconfStats:
+    """
+    Thread-safe counters of the Restconf client.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {
+            "requests": 0,
+            "errors": 0,
+            "handshakes": 0,
+            "connection_gets": 0
+        }
+
+    def add(self, name, value = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def snapshot(self):
+        """
+        Get a copy of the counters.
+
+        Returns:
+            dict: counter values, "reuses" is a number of requests which didn't need a new connection
+        """
+
+        with self._lock:
+            result = dict(self._counters)
+        result["reuses"] = max(0, result["connection_gets"] - result["handshakes"])
+        return result
+
+class RestconfClient:
+    """
+    Restconf client with a persistent HTTP session. The TCP/TLS connection to the router's web server
+    is kept alive and reused by the subsequent queries, failed requests are retried with a backoff.
+    """
+
+    def __init__(self, router_ip, username, password, timeout = DEFAULT_TIMEOUT, retries = DEFAULT_RETRIES,
+        backoff_factor = DEFAULT_BACKOFF_FACTOR, pool_maxsize = 2, verify = False, cache = None):
+        """
+        Initialize the RestconfClient object
+
+        Parameters:
+            router_ip (str): router IP address
+            username (str): router username
+            password (str): router password
+            timeout (float or tuple): request timeout or (connect timeout, read timeout) in seconds
+            retries (int): number of retries of a failed request (connection error or 5xx response)
+            backoff_factor (float): delay between retries is backoff_factor * (2 ** (retry number - 1))
+            pool_maxsize (int): number of connections kept open to the router
+            verify (bool or str): TLS certificate verification, see requests documentation
+            cache (ResponseCache): cache of the slowly changing responses, None means no caching
+        """
+
+        self.router_ip = router_ip
+        self.timeout = timeout
+        self.cache = cache
+        self.verify = verify
+        self._stats = RestconfStats()
+        retry = Retry(total = retries, connect = retries, read = retries, status = retries,
+            backoff_factor = backoff_factor, status_forcelist = RETRY_STATUS_CODES, raise_on_status = False)
+        adapter = CountingHTTPAdapter(self._stats, max_retries = retry, pool_connections = 1, pool_maxsize = pool_maxsize)
+        self._session = requests.Session()
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        self._session.auth = (username, password)
+        self._session.verify = verify
+        self._session.headers.update({
+            "Accept": "application/yang-data+json",
+            "Connection": "keep-alive"
+        })
+
+    def url(self, module_name, xpath):
+        """
+        Create Restconf data URL
+
+        Parameters:
+            module_name (str): restconf module name
+            xpath (str): xPath or other restconf parameters for the module query
+        """
+
+        return "https://{}{}".format(self.router_ip, self.path(module_name, xpath))
+
+    def path(self, module_name, xpath):
+        return "/restconf/data/{}:{}".format(module_name, xpath)
+
+    def get(self, module_name, xpath):
+        """
+        Run a restconf GET request.
+
+        Parameters:
+            module_name (str): restconf module name
+            xpath (str): xPath or other restconf parameters for the module query
+
+        Returns:
+            dict: decoded JSON response, None if the request failed
+        """
+
+        router_url = self.url(module_name, xpath)
+        path = restconf_path(module_name, xpath)
+        ttl = self.cache.ttl(module_name, xpath) if self.cache is not None else 0
+        entry = None
+        if ttl:
+            data, entry = self.cache.lookup(router_url)
+            if data is not None:
+                logger.debug("Restconf cache hit: %s", router_url)
+                RESTCONF_REQUESTS.inc(path = path, status = "cache")
+                return data
+        logger.info("Restconf URL: {}".format(router_url))
+        self._stats.add("requests")
+        start = time.monotonic()
+        try:
+            # verify is passed explicitly, the session setting would be overridden by REQUESTS_CA_BUNDLE
+            rf_res = self._session.get(router_url, timeout = self.timeout, verify = self.verify,
+                headers = ResponseCache.conditional_headers(entry))
+        except requests.exceptions.RequestException:
+            self._stats.add("errors")
+            RESTCONF_REQUESTS.inc(path = path, status = "error")
+            RECORDER.record("rest", p = self.path(module_name, xpath), s = "error", d = round(time.monotonic() - start, 6))
+            raise
+        finally:
+            RESTCONF_LATENCY.observe(time.monotonic() - start, path = path)
+        logger.info("Response code: {}".format(rf_res.status_code))
+        RESTCONF_REQUESTS.inc(path = path, status = rf_res.status_code)
+        if RECORDER.active:
+            # .text detects the encoding of the whole body (no charset in the content type), only when recording
+            RECORDER.record("rest", p = self.path(module_name, xpath), s = rf_res.status_code,
+                d = round(rf_res.elapsed.total_seconds(), 6), b = rf_res.text, e = rf_res.headers.get("ETag"))
+
+        if rf_res.status_code == 304 and entry is not None:
+            return self.cache.revalidated(router_url, entry, ttl)
+        if rf_res.ok:
+            data = rf_res.json()
+            if ttl:
+                self.cache.store(router_url, data, rf_res.headers.get("ETag"), rf_res.headers.get("Last-Modified"),
+                    ttl, len(rf_res.content))
+            return data
+        self._stats.add("errors")
+
+    def stream(self, module_name, xpath, chunk_size = 16384):
+        """
+        Run a restconf GET request and iterate over the response body without loading it to memory.
+        Responses are not cached.
+
+        Parameters:
+            module_name (str): restconf module name
+            xpath (str): xPath or other restconf parameters for the module query
+            chunk_size (int): size of the body parts
+
+        Returns:
+            generator: response body parts (bytes)
+
+        Raises:
+            requests.exceptions.HTTPError: response status is not OK
+        """
+
+        router_url = self.url(module_name, xpath)
+        path = restconf_path(module_name, xpath)
+        logger.info("Restconf stream URL: {}".format(router_url))
+        self._stats.add("requests")
+        start = time.monotonic()
+        status = "error"
+        recorded = [] if RECORDER.active else None
+        try:
+            with self._session.get(router_url, timeout = self.timeout, verify = self.verify, stream = True) as rf_res:
+                logger.info("Response code: {}".format(rf_res.status_code))
+                status = rf_res.status_code
+                rf_res.raise_for_status()
+                for chunk in rf_res.iter_content(chunk_size):
+                    if recorded is not None:
+                        recorded.append(chunk)
+                    yield chunk
+        except requests.exceptions.RequestException:
+            self._stats.add("errors")
+            raise
+        finally:
+            if recorded is not None and RECORDER.active:
+                # the whole body is recorded when the stream ends
+                RECORDER.record("rest", p = self.path(module_name, xpath), s = status, d = round(time.monotonic() - start, 6),
+                    b = b"".join(recorded).decode("utf-8", "replace"))
+            # time to the end of the body (or until the consumer stopped reading)
+            RESTCONF_REQUESTS.inc(path = path, status = status)
+            RESTCONF_LATENCY.observe(time.monotonic() - start, path = path)
+
+    def patch(self, module_name, xpath, data):
+        """
+        Run a restconf PATCH request (merge of the configuration). The request is not retried,
+        the response cache is cleared when the change is accepted.
+
+        Parameters:
+            module_name (str): restconf module name
+            xpath (str): xPath of the modified node
+            data (dict): new content of the node, JSON-encoded
+
+        Returns:
+            bool: True if the router accepted the change
+        """
+
+        router_url = self.url(module_name, xpath)
+        path = restconf_path(module_name, xpath)
+        logger.info("Restconf PATCH URL: {}".format(router_url))
+        self._stats.add("requests")
+        start = time.monotonic()
+        try:
+            rf_res = self._session.patch(router_url, json = data, timeout = self.timeout, verify = self.verify,
+                headers = {"Content-Type": "application/yang-data+json"})
+        except requests.exceptions.RequestException:
+            self._stats.add("errors")
+            RESTCONF_REQUESTS.inc(path = path, status = "error")
+            raise
+        finally:
+            RESTCONF_LATENCY.observe(time.monotonic() - start, path = path)
+        logger.info("Response code: {}".format(rf_res.status_code))
+        RESTCONF_REQUESTS.inc(path = path, status = rf_res.status_code)
+        if rf_res.ok:
+            if self.cache is not None:
+                self.cache.clear()
+            return True
+        self._stats.add("errors")
+        logger.error("Restconf PATCH failed: {} {}".format(rf_res.status_code, rf_res.text[:200]))
+        return False
+
+    def stats(self):
+        """
+        Get the client counters.
+
+        Returns:
+            dict: requests, errors, handshakes (new connections), reuses (requests over a kept-alive connection)
+                and response cache counters
+        """
+
+        result = self._stats.snapshot()
+        if self.cache is not None:
+            result["cache"] = self.cache.stats()
+        return result
+
+    def close(self):
+        """
+        Close the session and its pooled connections.
+        """
+
+        self._session.close()
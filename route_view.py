@@ -0,0 +1,265 @@
+import codecs
+import ipaddress
+import json
+import re
+
+DEFAULT_PAGE_SIZE = 10
+ROUTE_FILTERS = ["all", "default", "connected", "static"]
+
+class JSONArrayStream:
+    """
+    Incremental parser of a JSON document which yields the items of the first array with the given name
+    as soon as they are complete. Only the unparsed tail of the document is kept in memory.
+    """
+
+    def __init__(self, list_name):
+        """
+        Initialize the JSONArrayStream object
+
+        Parameters:
+            list_name (str): name of the array, for example "ietf-routing:route"
+        """
+
+        self._start = re.compile(r'"{}"\s*:\s*\['.format(re.escape(list_name)))
+        self._decoder = json.JSONDecoder()
+        # a multi-byte character can be split between chunks
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._in_array = False
+        self.done = False
+
+    def feed(self, chunk):
+        """
+        Parse next part of the document
+
+        Parameters:
+            chunk (bytes or str): next part of the document
+
+        Returns:
+            list: completed array items
+        """
+
+        if self.done:
+            return []
+        if isinstance(chunk, bytes):
+            chunk = self._text.decode(chunk)
+        self._buffer += chunk
+        if not self._in_array:
+            match = self._start.search(self._buffer)
+            if match is None:
+                # keep the end of the buffer in case the array name is split between chunks
+                self._buffer = self._buffer[-256:]
+                return []
+            self._buffer = self._buffer[match.end():]
+            self._in_array = True
+        items = []
+        pos = 0
+        length = len(self._buffer)
+        while True:
+            while pos < length and self._buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= length:
+                break
+            if self._buffer[pos] == "]":
+                self.done = True
+                break
+            try:
+                item, pos = self._decoder.raw_decode(self._buffer, pos)
+            except ValueError:
+                # incomplete item, wait for more data
+                break
+            items.append(item)
+        self._buffer = "" if self.done else self._buffer[pos:]
+        return items
+
+def iter_json_array(chunks, list_name):
+    """
+    Iterate over the items of the JSON array in a chunked document, see JSONArrayStream
+
+    Parameters:
+        chunks: iterable of the document parts
+        list_name (str): name of the array
+    """
+
+    parser = JSONArrayStream(list_name)
+    for chunk in chunks:
+        for item in parser.feed(chunk):
+            yield item
+        if parser.done:
+            break
+
+def rib_route(route):
+    """
+    Normalize ietf-routing operational RIB route record
+
+    Returns:
+        dict: {"prefix", "protocol", "next_hops"}
+    """
+
+    next_hop = route.get("next-hop", {})
+    hops = []
+    if "next-hop-address" in next_hop:
+        hops.append(next_hop["next-hop-address"])
+    if "outgoing-interface" in next_hop:
+        hops.append(next_hop["outgoing-interface"])
+    for hop in next_hop.get("next-hop-list", {}).get("next-hop", []):
+        hops.append(hop.get("address") or hop.get("outgoing-interface", ""))
+    protocol = route.get("source-protocol", "").split(":")[-1]
+    if protocol == "direct":
+        protocol = "connected"
+    return {
+        "prefix": route.get("destination-prefix", ""),
+        "protocol": protocol,
+        "next_hops": hops
+    }
+
+def native_route(route):
+    """
+    Normalize Cisco-IOS-XE-native static route record (ip-route-interface-forwarding-list)
+
+    Returns:
+        dict: {"prefix", "protocol", "next_hops"}
+    """
+
+    try:
+        prefix = str(ipaddress.ip_network("{}/{}".format(route["prefix"], route["mask"]), strict = False))
+    except ValueError:
+        prefix = "{}/{}".format(route.get("prefix"), route.get("mask"))
+    return {
+        "prefix": prefix,
+        "protocol": "static",
+        "next_hops": [fwd["fwd"] for fwd in route.get("fwd-list", [])]
+    }
+
+def format_route(route):
+    """
+    Format normalized route to a string
+
+    Returns:
+        str: "prefix [protocol] -> next hops"
+    """
+
+    return "{} [{}] -> {}".format(route["prefix"], route["protocol"], ",".join(route["next_hops"]))
+
+class RouteFilter:
+    """
+    Route filter by type (all, default, connected, static) and optional prefix
+    """
+
+    def __init__(self, kind = "all", prefix = None):
+        """
+        Initialize the RouteFilter object
+
+        Parameters:
+            kind (str): one of ROUTE_FILTERS
+            prefix (str): IP prefix or address, routes overlapping with it match
+        """
+
+        self.kind = kind if kind in ROUTE_FILTERS else "all"
+        self.prefix = None
+        if prefix:
+            try:
+                self.prefix = ipaddress.ip_network(prefix.strip(), strict = False)
+            except ValueError:
+                self.prefix = None
+
+    def match(self, route):
+        if self.kind == "default" and route["prefix"] not in ("0.0.0.0/0", "::/0"):
+            return False
+        if self.kind in ("connected", "static") and route["protocol"] != self.kind:
+            return False
+        if self.prefix is not None:
+            try:
+                network = ipaddress.ip_network(route["prefix"], strict = False)
+                return network.version == self.prefix.version and network.overlaps(self.prefix)
+            except ValueError:
+                return False
+        return True
+
+    def __str__(self):
+        return self.kind if self.prefix is None else "{} {}".format(self.kind, self.prefix)
+
+class RouteView:
+    """
+    Paged view of the routing table. The routes are consumed as a stream and only the routes
+    of the current page are kept, so the memory use doesn't depend on the routing table size.
+    """
+
+    def __init__(self, page_size = DEFAULT_PAGE_SIZE):
+        """
+        Initialize the RouteView object
+
+        Parameters:
+            page_size (int): number of routes on a page
+        """
+
+        self.page_size = page_size
+        self.page = 0
+        self.pages = 1
+        self.route_filter = RouteFilter()
+        self.begin()
+
+    def set_filter(self, kind = None, prefix = None):
+        """
+        Change the filter and go to the first page. Parameters which are None are not changed.
+        """
+
+        self.route_filter = RouteFilter(kind if kind is not None else self.route_filter.kind,
+            prefix if prefix is not None else (str(self.route_filter.prefix) if self.route_filter.prefix else None))
+        self.page = 0
+
+    def next_page(self):
+        self.page = min(self.page + 1, self.pages - 1)
+
+    def prev_page(self):
+        self.page = max(0, self.page - 1)
+
+    def render(self, routes):
+        """
+        Render the current page
+
+        Parameters:
+            routes: iterable of normalized routes (see rib_route(), native_route())
+
+        Returns:
+            tuple: (page text, page status text)
+        """
+
+        self.begin()
+        for route in routes:
+            self.add(route)
+        return self.result()
+
+    def begin(self):
+        """
+        Start rendering of the current page, the routes are then passed one by one to add().
+        Useful if the routes come from an asynchronous source.
+        """
+
+        self._first = self.page * self.page_size
+        self._lines = []
+        self._total = 0
+
+    def add(self, route):
+        if not self.route_filter.match(route):
+            return
+        if self._first <= self._total < self._first + self.page_size:
+            self._lines.append(format_route(route))
+        self._total += 1
+
+    def result(self):
+        """
+        Finish rendering started by begin()
+
+        Returns:
+            tuple: (page text, page status text)
+        """
+
+        self.pages = max(1, (self._total + self.page_size - 1) // self.page_size)
+        if self.page >= self.pages:
+            # the table shrank, show the last page next time
+            self.page = self.pages - 1
+        status = "{}: page {}/{}, {} routes".format(self.route_filter, min(self._first // self.page_size + 1, self.pages),
+            self.pages, self._total)
+        lines, self._lines = self._lines, []
+        return "\n".join(lines) if lines else "no routes", status
@@ -0,0 +1,107 @@
+import socket, struct
+
+# Restconf queries (module name, xPath) used for the router information
+MEMORY_QUERY = ("Cisco-IOS-XE-memory-oper", "memory-statistics/memory-statistic")
+CPU_QUERY = ("Cisco-IOS-XE-process-cpu-oper", "cpu-usage/cpu-utilization?fields=five-seconds;one-minute;five-minutes")
+ROUTES_QUERY = ("Cisco-IOS-XE-native", "native/ip/route")
+RIB_QUERY = ("ietf-routing", "routing-state/routing-instance=default/ribs/rib=ipv4-default/routes/route?fields=destination-prefix;source-protocol;next-hop")
+VERSION_QUERY = ("Cisco-IOS-XE-native", "native?fields=version;hostname")
+INVENTORY_QUERY = ("Cisco-IOS-XE-device-hardware-oper", "device-hardware-data/device-hardware/device-inventory?fields=hw-type;part-number")
+# link quality, only the counters and signal levels are requested, see link_monitor.py
+LINK_INTERFACES_QUERY = ("Cisco-IOS-XE-interfaces-oper",
+    "interfaces/interface?fields=name;oper-status;statistics(in-octets;out-octets;in-discards;out-discards;in-errors;out-errors)")
+LINK_RADIO_QUERY = ("Cisco-IOS-XE-cellwan-oper", "cellwan-oper-data/cellwan-radio?fields=cellular-interface;rssi;rsrp;rsrq;snr")
+# only the default route of the RIB, polled during the WAN path switchover, see wan_switch.py
+DEFAULT_ROUTE_QUERY = ("ietf-routing",
+    "routing-state/routing-instance=default/ribs/rib=ipv4-default/routes/route=0.0.0.0%2F0?fields=destination-prefix;source-protocol;next-hop")
+
+# default response cache TTLs [s] of the slowly changing data, other queries are not cached
+QUERY_TTL = {
+    VERSION_QUERY: 3600,
+    INVENTORY_QUERY: 3600,
+    ROUTES_QUERY: 60
+}
+
+def get_default_gateway_linux():
+    """Read the default gateway directly from /proc.
+    source: https://stackoverflow.com/questions/2761829/python-get-default-gateway-for-a-local-interface-ip-address-in-linux
+
+    Returns:
+        str: IP address of the default gateway
+    """
+
+    with open("/proc/net/route") as fh:
+        for line in fh:
+            fields = line.strip().split()
+            if fields[1] != '00000000' or not int(fields[3], 16) & 2:
+                # If not default route or not RTF_GATEWAY, skip it
+                continue
+
+            return socket.inet_ntoa(struct.pack("<L", int(fields[2], 16)))
+
+def format_memory_usage(mem_stat):
+    """
+    Format IOS-XE processor memory usage to a string.
+
+    Parameters:
+        mem_stat (list): list of memory-statistic records
+
+    Returns:
+        string: formatted result
+    """
+
+    for mem in mem_stat:
+        if mem["name"].lower() == "processor":
+            usage = "used: {}, free: {}".format(mem["used-memory"], mem["free-memory"])
+            return usage
+
+def memory_usage_percent(mem_stat):
+    """
+    Get IOS-XE processor memory utilization.
+
+    Parameters:
+        mem_stat (list): list of memory-statistic records
+
+    Returns:
+        float: used memory in percent of the total, None if the processor pool is not found
+    """
+
+    for mem in mem_stat:
+        if mem["name"].lower() == "processor" and int(mem["total-memory"]):
+            return 100 * int(mem["used-memory"]) / int(mem["total-memory"])
+
+def format_cpu_usage(cpu_info):
+    """
+    Format IOS-XE CPU usage to a string.
+
+    Parameters:
+        cpu_info (dict): cpu-utilization record
+
+    Returns:
+        string: formatted result
+    """
+
+    if cpu_info:
+        usage = "5s: {:2d}%, 1m: {:2d}%, 5m: {:2d}%".format(cpu_info["five-seconds"], cpu_info["one-minute"], cpu_info["five-minutes"])
+        return usage
+
+def format_router_version(ios_info_res, hw_info_res):
+    """
+    Format router hostname, IOS version and hardware model to a string.
+
+    Parameters:
+        ios_info_res (dict): response to VERSION_QUERY, None if not available
+        hw_info_res (dict): response to INVENTORY_QUERY, None if not available
+
+    Returns:
+        string: formatted result, the missing items are "unknown"
+    """
+
+    ios_info = (ios_info_res or {}).get("Cisco-IOS-XE-native:native", {})
+    hw_info = (hw_info_res or {}).get("Cisco-IOS-XE-device-hardware-oper:device-inventory", [])
+    model = "unknown"
+    for module in hw_info:
+        if module["hw-type"] == "hw-type-chassis":
+            model = module["part-number"]
+    result = "{}, hw: {}, sw: {}".format(ios_info.get("hostname", "unknown"), model, ios_info.get("version", "unknown"))
+    return result
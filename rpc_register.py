@@ -0,0 +1,223 @@
+import logging
+import json_codec
+from codec_rpc import PendingRequests, RPCError, RPCTimeoutError, DEFAULT_RPC_TIMEOUT, MAX_PENDING_RPC
+from codec_rpc import MAX_FEEDBACK_REGISTRATIONS, PRIORITY_NORMAL
+from metrics import RPC_DROPPED
+from profiling import PROFILER
+from recording import RECORDER
+
+logger = logging.getLogger(__name__)
+
+class RPCRegister:
+    """
+    Requests and feedback subscriptions of one codec connection: message ids, response callbacks,
+    outbound queueing and the dispatch of the received messages. The transport is implemented
+    by the subclasses - the websocket threads in codec_ws.CodecRPCRegister, the asyncio tasks
+    in codec_async.AsyncCodecRPC. The subclass sets the outbound queue (_outbound).
+    """
+
+    def __init__(self, rpc_timeout = DEFAULT_RPC_TIMEOUT, max_pending = MAX_PENDING_RPC,
+        max_feedback = MAX_FEEDBACK_REGISTRATIONS):
+        """
+        Initialize the RPCRegister object
+
+        Parameters:
+            rpc_timeout (float): default timeout of the RPC requests in seconds
+            max_pending (int): maximum number of in-flight RPC requests
+            max_feedback (int): maximum number of feedback subscriptions
+        """
+
+        self.rpc_timeout = rpc_timeout
+        self._msg_register = PendingRequests(max_pending)
+        self.max_feedback = max_feedback
+        self._feedback_register = {} # feedback id -> FeedbackRegistration
+        self._outbound = None # OutboundQueue or AsyncOutboundQueue
+        self.closed = False # set by drain_requests(), the new requests fail right away
+
+    def send_rpc_message(self, method, params, callback = None, timeout = None, priority = PRIORITY_NORMAL):
+        """
+        Queue message for the codec
+
+        Parameters:
+            method (str): operation and object xPath (for example: "xCommand/UserInterface/Extensions/Widget/SetValue")
+            params (dict): parameters
+            callback (function): callback function to be called after the response is received,
+                the function is called in the form: callback(codec_rpc, message_id, message_result).
+                If the codec returns an error or doesn't respond before the timeout, message_result
+                is RPCError or RPCTimeoutError exception.
+            timeout (float): response timeout in seconds, default is rpc_timeout
+            priority (int): PRIORITY_INTERACTIVE for responses to user actions, PRIORITY_NORMAL
+                or PRIORITY_PERIODIC for periodic updates (dropped if the outbound queue is full)
+
+        Returns:
+            RPCFuture: future resolved with the response result
+        """
+
+        data, future = self._create_rpc_request(method, params, callback, timeout)
+        return self._queue_message(data, future, priority)
+
+    def _create_rpc_request(self, method, params, callback, timeout = None):
+        """
+        Register a request and serialize its message right away, the register keeps only the method
+        and the callback. Expired requests are removed from the register and their callbacks
+        receive RPCTimeoutError.
+
+        Returns:
+            tuple: (JSON message, RPCFuture)
+        """
+
+        self.expire_requests()
+        future, evicted = self._msg_register.add(method, callback, timeout if timeout is not None else self.rpc_timeout)
+        for msg_reg in evicted:
+            logger.warning("RPC register full, evicting message {}".format(msg_reg.future.msg_id))
+            self._complete_request(msg_reg, RPCTimeoutError("Request evicted", msg_reg.future.msg_id))
+        return json_codec.encode_request(future.msg_id, method, params), future
+
+    def _queue_message(self, data, future, priority):
+        """
+        Put the serialized message to the outbound queue. If the queue is full or the connection is closed,
+        the request is completed with RPCError.
+        """
+
+        if self.closed:
+            self._send_failed(future.msg_id, RPCError("Connection closed", future.msg_id))
+        elif not self._outbound.put(data, priority, future.msg_id):
+            logger.warning("Outbound queue full, dropping {}".format(future.method))
+            self._send_failed(future.msg_id, RPCError("Outbound queue full", future.msg_id))
+        return future
+
+    def _send_failed(self, msg_id, error):
+        """
+        Callback of the outbound queue. Complete the request which couldn't be sent.
+        """
+
+        msg_reg = self._msg_register.pop(msg_id)
+        if msg_reg is not None:
+            if not isinstance(error, RPCError):
+                error = RPCError("Send failed: {}".format(error), msg_id)
+            self._msg_register.count_result(msg_reg, error = True)
+            self._complete_request(msg_reg, error)
+
+    def expire_requests(self):
+        """
+        Remove the requests which didn't get a response before their deadline. The callbacks are called
+        with RPCTimeoutError.
+        """
+
+        for msg_reg in self._msg_register.expire():
+            msg_id = msg_reg.future.msg_id
+            logger.warning("RPC message {} {} timed out".format(msg_id, msg_reg.future.method))
+            self._complete_request(msg_reg, RPCTimeoutError("No response", msg_id))
+
+    def drain_requests(self):
+        """
+        Complete the in-flight requests with RPCError, so nobody waits for a response from a closed connection.
+        The requests sent later fail right away.
+        """
+
+        self.closed = True
+        for msg_reg in self._msg_register.drain():
+            self._complete_request(msg_reg, RPCError("Connection closed", msg_reg.future.msg_id))
+
+    def _run_callback(self, callback, *args):
+        """
+        Call the response or feedback callback in the form: callback(codec_rpc, *args).
+        """
+
+        try:
+            callback(self, *args)
+        except Exception as e:
+            logger.error("RPC callback exception: {}".format(e))
+
+    def _complete_request(self, msg_reg, result):
+        """
+        Resolve the request future and call its callback.
+
+        Parameters:
+            msg_reg (PendingRequest): request record from the register
+            result: response result or RPCError
+        """
+
+        future = msg_reg.future
+        if not future.done():
+            if isinstance(result, RPCError):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+        if msg_reg.callback is not None:
+            self._run_callback(msg_reg.callback, future.msg_id, result)
+
+    def handle_message(self, message):
+        """
+        Handle the received RPC message. Based on the RPC message id, the callback function is called.
+        There are two possible callbacks:
+        1. asynchronous event associated with feedback registration, the callback is called in the form of
+            callback(codec_rpc, message_parameters)
+        2. response to the previous RPC request, the callback is called in the form of
+            callback(codec_rpc, message_id, parameters). In this case the callback is removed from
+            the pool of callback functions - each message id is handled only once.
+
+        Parameters:
+            message (str): JSON representation of the RPC message
+
+        Returns:
+            str: json_codec.EVENT or json_codec.RESPONSE
+        """
+
+        RECORDER.record("in", m = message)
+        with PROFILER.section("rpc/message"):
+            # messages nobody waits for are dropped before decoding
+            kind, ids = json_codec.peek(message)
+            if kind == json_codec.EVENT:
+                if ids and not any(feedback_id in self._feedback_register for feedback_id in ids):
+                    RPC_DROPPED.inc(kind = kind)
+                    logger.debug("Event of unknown subscription %s dropped", ids)
+                    return kind
+            elif ids and not any(msg_id in self._msg_register for msg_id in ids):
+                RPC_DROPPED.inc(kind = kind)
+                logger.error("Message id {} already handled or expired".format(ids[0]))
+                return kind
+            message = json_codec.loads(message)
+            # hot path, log lazily so the messages are formatted only if debug logging is on
+            logger.debug("RPC message: %s", message)
+            if message.get("method") == "xFeedback/Event":
+                feedback_reg = self._feedback_register.get(message["params"].get("Id"))
+                if feedback_reg is None:
+                    RPC_DROPPED.inc(kind = json_codec.EVENT)
+                else:
+                    self._run_callback(feedback_reg.callback, message["params"])
+                return json_codec.EVENT
+            msg_id = str(message.get("id"))
+            msg_reg = self._msg_register.pop(msg_id)
+            if msg_reg is None:
+                logger.error("Message id {} already handled or expired".format(msg_id))
+                return json_codec.RESPONSE
+            logger.debug("Handling response %s, %d requests in flight", msg_id, len(self._msg_register))
+            if "error" in message:
+                self._msg_register.count_result(msg_reg, error = True)
+                result = RPCError("Codec error: {}".format(message["error"]), msg_id, message["error"])
+            else:
+                self._msg_register.count_result(msg_reg)
+                result = message.get("result")
+            self._complete_request(msg_reg, result)
+            return json_codec.RESPONSE
+
+    def rpc_metrics(self):
+        """
+        Get the RPC request metrics.
+
+        Returns:
+            dict: request counters, number of in-flight requests and the age of the oldest one
+        """
+
+        return self._msg_register.metrics()
+
+    def outbound_stats(self):
+        """
+        Get the outbound queue statistics.
+
+        Returns:
+            dict: queue depth, message counters and time spent in the queue
+        """
+
+        return self._outbound.stats()
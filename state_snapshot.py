@@ -0,0 +1,142 @@
+import json
+import logging
+import os
+import threading
+import time
+from metrics import FIRST_PAINT
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SNAPSHOT_INTERVAL = 60 # seconds, minimum time between the snapshot writes
+SNAPSHOT_VERSION = 1
+
+class StateSnapshot:
+    """
+    Last known state of the application in a small JSON file: widget values, router identity
+    and panel content hashes. It's loaded on startup, so the panel can show the (stale) values
+    before the first router queries finish. The file is replaced atomically, the writes are rate-limited.
+    """
+
+    def __init__(self, path, interval = DEFAULT_SNAPSHOT_INTERVAL):
+        """
+        Initialize the StateSnapshot object
+
+        Parameters:
+            path (str): snapshot file, None disables the snapshot
+            interval (float): minimum time [s] between the writes, see save()
+        """
+
+        self.path = path
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._last_save = None
+        self._last_state = None
+
+    def load(self):
+        """
+        Read the snapshot file
+
+        Returns:
+            dict: "saved_at" (Unix time), "widgets" (widget id -> value), "router" (router identity),
+                "panels" (panel id -> content hash). Empty dict if there is no usable snapshot.
+        """
+
+        if self.path is None:
+            return {}
+        try:
+            with open(self.path) as snapshot_file:
+                state = json.load(snapshot_file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning("Snapshot {} not loaded: {}".format(self.path, e))
+            return {}
+        if state.get("version") != SNAPSHOT_VERSION:
+            logger.info("Snapshot {} has a different version, ignored".format(self.path))
+            return {}
+        self._last_state = state
+        logger.info("Snapshot loaded, saved at {}".format(time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(state.get("saved_at", 0)))))
+        return state
+
+    def save(self, widgets = None, router = None, panels = None, force = False):
+        """
+        Write the snapshot. The items which are None are kept from the previous snapshot.
+        Nothing is written if the previous write was less than "interval" ago (unless forced)
+        or the state didn't change.
+
+        Parameters:
+            widgets (dict): widget id -> value
+            router (str): router identity, see get_router_version()
+            panels (dict): panel id -> content hash, see PanelRegistry.export()
+            force (bool): ignore the interval
+
+        Returns:
+            bool: True if the snapshot was written
+        """
+
+        if self.path is None:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            if not force and self._last_save is not None and now - self._last_save < self.interval:
+                return False
+            previous = self._last_state or {}
+            state = {
+                "version": SNAPSHOT_VERSION,
+                "widgets": widgets if widgets is not None else previous.get("widgets", {}),
+                "router": router if router is not None else previous.get("router"),
+                "panels": panels if panels is not None else previous.get("panels", {})
+            }
+            if {key: value for key, value in previous.items() if key != "saved_at"} == state:
+                return False
+            state["saved_at"] = time.time()
+            temp_path = self.path + ".tmp"
+            try:
+                with open(temp_path, "w") as snapshot_file:
+                    json.dump(state, snapshot_file)
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                logger.error("Snapshot {} not saved: {}".format(self.path, e))
+                return False
+            self._last_save = now
+            self._last_state = state
+        logger.debug("Snapshot saved")
+        return True
+
+class FirstPaint:
+    """
+    Measure the time from the application start to the first widget values shown on the codec's panel.
+    """
+
+    def __init__(self, started):
+        """
+        Initialize the FirstPaint object
+
+        Parameters:
+            started (float): time.monotonic() of the application start
+        """
+
+        self.started = started
+        self.elapsed = None
+        self._lock = threading.Lock()
+
+    def track(self, futures, source):
+        """
+        Report the first paint when the codec acknowledges the widget updates. Only the first call
+        which has some updates is tracked.
+
+        Parameters:
+            futures (list): RPCFuture of the widget updates, see WidgetStateCache.flush()
+            source (str): origin of the values ("snapshot", "router")
+        """
+
+        with self._lock:
+            if self.elapsed is not None or not futures:
+                return
+            self.elapsed = 0.0
+        futures[-1].add_done_callback(lambda future: self._painted(source))
+
+    def _painted(self, source):
+        self.elapsed = time.monotonic() - self.started
+        FIRST_PAINT.set(round(self.elapsed, 3), source = source)
+        logger.info("First paint {:.3f} s after start, values from {}".format(self.elapsed, source))
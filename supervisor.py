@@ -0,0 +1,162 @@
+import logging
+import queue
+import threading
+import time
+import websocket
+from codec_rpc import ReconnectBackoff, STABLE_CONNECTION
+from metrics import CODEC_CONNECTIONS
+from recording import RECORDER
+
+logger = logging.getLogger(__name__)
+
+class Connection:
+    """
+    One websocket connection handled by the session function of ConnectionSupervisor
+    """
+
+    def __init__(self, ws, number, outage = None):
+        """
+        Initialize the Connection object
+
+        Parameters:
+            ws: websocket object (websocket.WebSocketApp)
+            number (int): connection number, 1 for the first connection
+            outage (float): time [s] since the previous connection was closed, None for the first connection
+        """
+
+        self.ws = ws
+        self.number = number
+        self.outage = outage
+        self.opened_at = time.monotonic()
+        self.closed = threading.Event()
+        self.rpc = None # RPC register of the session (CodecRPCRegister), closed when the connection is closed
+
+class ConnectionSupervisor:
+    """
+    Keep the websocket connection to the codec. The connection is re-established with an exponential
+    backoff. For each connection, the session function is called as session(connection) in a single
+    worker thread which is reused for all connections, so the threads do not pile up when the link flaps.
+    The session should return soon after connection.closed is set. The session can set connection.rpc,
+    it's closed together with the connection: no message is written to a closed socket and the requests
+    waiting for a response fail right away, so the next session doesn't wait for the RPC timeouts.
+    """
+
+    def __init__(self, url, session, header = None, backoff = None, stable_time = STABLE_CONNECTION, run_options = None):
+        """
+        Initialize the ConnectionSupervisor object
+
+        Parameters:
+            url (str): websocket URL of the codec
+            session: function called with a Connection object after each connect
+            header (dict): HTTP headers of the websocket handshake (authorization)
+            backoff (ReconnectBackoff): reconnect delays
+            stable_time (float): connection lifetime [s] after which the backoff is reset
+            run_options (dict): parameters of WebSocketApp.run_forever(), for example sslopt
+        """
+
+        self.url = url
+        self.session = session
+        self.header = header
+        self.backoff = backoff or ReconnectBackoff()
+        self.stable_time = stable_time
+        self.run_options = run_options or {}
+        self._stop = threading.Event()
+        self._connections = queue.Queue()
+        self._app = None
+        self._current = None
+        self._closed_at = None
+        self.stats = {
+            "connects": 0,
+            "failed": 0,
+            "closed": 0
+        }
+
+    def run(self):
+        """
+        Connect and keep the connection until stop() is called. Blocks the calling thread.
+        """
+
+        threading.Thread(target = self._session_worker, name = "codec_session", daemon = True).start()
+        threading.Thread(target = self._stop_worker, name = "codec_stop", daemon = True).start()
+        while not self._stop.is_set():
+            self._app = websocket.WebSocketApp(self.url, header = self.header, on_open = self._on_open,
+                on_error = self._on_error, on_close = self._on_close)
+            try:
+                self._app.run_forever(**self.run_options)
+            except Exception as e:
+                logger.error("Websocket exception: {}".format(e))
+            connection, self._current = self._current, None
+            if connection is None:
+                self.stats["failed"] += 1
+                CODEC_CONNECTIONS.inc(result = "failed")
+            else:
+                self._closed(connection)
+                if time.monotonic() - connection.opened_at >= self.stable_time:
+                    self.backoff.reset()
+            if self._stop.is_set():
+                break
+            delay = self.backoff.next_delay()
+            logger.info("Reconnecting in {:.1f} s".format(delay))
+            self._stop.wait(delay)
+        self._connections.put(None)
+
+    def stop(self):
+        """
+        Close the connection and stop reconnecting. It only sets the stop event, so it can be called
+        from a signal handler (which runs in the websocket receive thread), see _stop_worker().
+        """
+
+        self._stop.set()
+
+    def _stop_worker(self):
+        self._stop.wait()
+        connection = self._current
+        if connection is not None:
+            # the session and its outbound writer stop before the websocket is closed
+            self._closed(connection)
+        if self._app is not None:
+            self._app.keep_running = False
+            self._app.close()
+
+    def _on_open(self, ws):
+        self.stats["connects"] += 1
+        CODEC_CONNECTIONS.inc(result = "open")
+        outage = time.monotonic() - self._closed_at if self._closed_at is not None else None
+        self._current = Connection(ws, self.stats["connects"], outage)
+        RECORDER.record("open", n = self._current.number)
+        logger.info("Opened connection #{}{}".format(self._current.number,
+            ", outage {:.1f} s".format(outage) if outage is not None else ""))
+        self._connections.put(self._current)
+
+    def _on_error(self, ws, error):
+        logger.error("Websocket error: {}".format(error))
+
+    def _on_close(self, ws, close_status_code, close_msg):
+        if self._current is not None:
+            self._closed(self._current)
+
+    def _closed(self, connection):
+        if connection.closed.is_set():
+            return
+        connection.closed.set()
+        if connection.rpc is not None:
+            connection.rpc.close()
+        self._closed_at = time.monotonic()
+        RECORDER.record("close", n = connection.number)
+        self.stats["closed"] += 1
+        CODEC_CONNECTIONS.inc(result = "closed")
+        logger.info("### closed ### connection #{} after {:.1f} s".format(connection.number,
+            self._closed_at - connection.opened_at))
+
+    def _session_worker(self):
+        while True:
+            connection = self._connections.get()
+            if connection is None:
+                return
+            if connection.closed.is_set():
+                # closed before the previous session finished
+                continue
+            try:
+                self.session(connection)
+            except Exception as e:
+                logger.error("Codec session exception: {}".format(e))
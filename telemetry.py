@@ -0,0 +1,433 @@
+import logging
+import _thread
+import time
+import random
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+YANG_PUSH_NS = "urn:ietf:params:xml:ns:yang:ietf-yang-push"
+EVENT_NOTIFICATIONS_NS = "urn:ietf:params:xml:ns:yang:ietf-event-notifications"
+NOTIFICATION_NS = "urn:ietf:params:xml:ns:netconf:notification:1.0"
+
+RETRY_DELAY = 5 # seconds, first retry of a failed subscription, doubled up to MAX_RETRY_DELAY
+MAX_RETRY_DELAY = 300 # seconds
+
+# telemetry subscriptions, "xpath" is a YANG-push filter, "container" is the top container
+# of the update and "list" is the element decoded as a list (as in Restconf JSON response)
+SUBSCRIPTIONS = {
+    "memory": {
+        "xpath": "/memory-ios-xe-oper:memory-statistics/memory-statistic",
+        "namespace": "http://cisco.com/ns/yang/Cisco-IOS-XE-memory-oper",
+        "container": "memory-statistics",
+        "list": "memory-statistic"
+    },
+    "cpu": {
+        "xpath": "/process-cpu-ios-xe-oper:cpu-usage/cpu-utilization",
+        "namespace": "http://cisco.com/ns/yang/Cisco-IOS-XE-process-cpu-oper",
+        "container": "cpu-usage",
+        "list": None
+    }
+}
+
+ESTABLISH_SUBSCRIPTION_RPC = """
+<establish-subscription xmlns="{event_ns}" xmlns:yp="{push_ns}">
+  <stream>yp:yang-push</stream>
+  <yp:xpath-filter>{xpath}</yp:xpath-filter>
+  {trigger}
+</establish-subscription>
+"""
+
+def _local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+def _element_value(element):
+    """
+    Convert XML element to a value in the same form as the Restconf JSON would have.
+    """
+
+    children = list(element)
+    if not children:
+        text = (element.text or "").strip()
+        try:
+            return int(text)
+        except ValueError:
+            return text
+    result = {}
+    for child in children:
+        name = _local_name(child.tag)
+        value = _element_value(child)
+        if name in result:
+            if not isinstance(result[name], list):
+                result[name] = [result[name]]
+            result[name].append(value)
+        else:
+            result[name] = value
+    return result
+
+def decode_push_update(notification_xml, subscriptions = SUBSCRIPTIONS):
+    """
+    Decode YANG-push update notification.
+
+    Parameters:
+        notification_xml (str): XML of the NETCONF notification
+        subscriptions (dict): subscription definitions, see SUBSCRIPTIONS
+
+    Returns:
+        list: list of (metric name, data) tuples. The data are structured the same way as
+            the Restconf response, for example {"memory-statistic": [{"name": "Processor", ...}]}
+    """
+
+    root = ET.fromstring(notification_xml)
+    result = []
+    for update in root.iter():
+        if _local_name(update.tag) not in ("push-update", "push-change-update"):
+            continue
+        for contents in update.iter():
+            if _local_name(contents.tag) != "datastore-contents-xml":
+                continue
+            for container in contents:
+                for name, sub in subscriptions.items():
+                    if _local_name(container.tag) != sub["container"]:
+                        continue
+                    data = _element_value(container)
+                    if sub["list"] and not isinstance(data.get(sub["list"]), list):
+                        data[sub["list"]] = [data[sub["list"]]] if sub["list"] in data else []
+                    result.append((name, data))
+    return result
+
+def synthetic_sample():
+    """
+    Generate a synthetic memory and CPU sample for LocalTelemetryPublisher.
+
+    Returns:
+        dict: metric name -> XML contents of the update container
+    """
+
+    cpu = random.randint(1, 30)
+    used = random.randint(200000000, 250000000)
+    return {
+        "memory": "<memory-statistic><name>Processor</name><total-memory>400000000</total-memory>"
+            "<used-memory>{}</used-memory><free-memory>{}</free-memory></memory-statistic>".format(used, 400000000 - used),
+        "cpu": "<cpu-utilization><five-seconds>{}</five-seconds><one-minute>{}</one-minute>"
+            "<five-minutes>{}</five-minutes></cpu-utilization>".format(cpu, max(1, cpu - 2), max(1, cpu - 4))
+    }
+
+class TelemetryReceiver:
+    """
+    Decode telemetry updates and pass them to a callback.
+    """
+
+    def __init__(self, on_update, subscriptions = SUBSCRIPTIONS):
+        """
+        Initialize the TelemetryReceiver object
+
+        Parameters:
+            on_update: callback function, called in the form: on_update(metric_name, data)
+            subscriptions (dict): subscription definitions, see SUBSCRIPTIONS
+        """
+
+        self._on_update = on_update
+        self.subscriptions = subscriptions
+        self.updates = 0
+        self.last_update = None
+
+    def handle_notification(self, notification_xml):
+        """
+        Handle a received notification. Called by the telemetry source.
+
+        Parameters:
+            notification_xml (str): XML of the NETCONF notification
+        """
+
+        try:
+            updates = decode_push_update(notification_xml, self.subscriptions)
+        except ET.ParseError as e:
+            logger.error("Telemetry decode exception: {}".format(e))
+            return
+        for name, data in updates:
+            self.updates += 1
+            self.last_update = time.time()
+            try:
+                self._on_update(name, data)
+            except Exception as e:
+                logger.error("Telemetry callback exception: {}".format(e))
+
+def decode_subscription_reply(reply_xml):
+    """
+    Decode the reply to establish-subscription.
+
+    Parameters:
+        reply_xml (str): XML of the rpc-reply
+
+    Returns:
+        str: subscription id
+
+    Raises:
+        ConnectionError: the subscription was rejected
+    """
+
+    root = ET.fromstring(reply_xml)
+    result = subscription_id = None
+    for element in root.iter():
+        if _local_name(element.tag) == "subscription-result":
+            result = (element.text or "").strip()
+        elif _local_name(element.tag) == "subscription-id":
+            subscription_id = (element.text or "").strip()
+    # the result is a QName, for example "notif-bis:ok"
+    if result is None or result.rsplit(":", 1)[-1] != "ok":
+        raise ConnectionError("Subscription rejected: {}".format(result))
+    return subscription_id
+
+class NcclientSession:
+    """
+    NETCONF session to the router, uses ncclient. The interface (establish(), take_notification(), connected, close())
+    is shared with LocalTelemetryPublisher, see NetconfYangPush.
+    """
+
+    def __init__(self, router_ip, port, username, password):
+        from ncclient import manager
+
+        self._manager = manager.connect(host = router_ip, port = port, username = username, password = password,
+            hostkey_verify = False, allow_agent = False, look_for_keys = False)
+
+    def establish(self, rpc_xml):
+        """
+        Send establish-subscription RPC.
+
+        Returns:
+            str: XML of the rpc-reply
+        """
+
+        from ncclient.xml_ import to_ele
+
+        return self._manager.dispatch(to_ele(rpc_xml)).xml
+
+    def take_notification(self, timeout):
+        """
+        Wait for a notification.
+
+        Returns:
+            str: XML of the notification, None if no notification arrived within the timeout [s]
+        """
+
+        notification = self._manager.take_notification(block = True, timeout = timeout)
+        return notification.notification_xml if notification is not None else None
+
+    @property
+    def connected(self):
+        return self._manager.connected
+
+    def close(self):
+        self._manager.close_session()
+
+class NetconfYangPush:
+    """
+    YANG-push subscription over NETCONF (IOS-XE "netconf-yang"). Requires ncclient,
+    or a local stand-in session (LocalTelemetryPublisher) for testing without a router.
+    """
+
+    def __init__(self, router_ip, username, password, port = 830, period = 1000, on_change = False, connect = NcclientSession):
+        """
+        Initialize the NetconfYangPush object
+
+        Parameters:
+            router_ip (str): router IP address
+            username (str): router username
+            password (str): router password
+            port (int): NETCONF port
+            period (int): update period in centiseconds (periodic subscription)
+            on_change (bool): use on-change subscription instead of periodic one
+            connect: function which opens the NETCONF session, called in the form:
+                connect(router_ip, port, username, password), default is an ncclient session
+        """
+
+        self.router_ip = router_ip
+        self.port = port
+        self.period = period
+        self.on_change = on_change
+        self.subscription_ids = {} # metric name -> subscription id
+        self._username = username
+        self._password = password
+        self._connect = connect
+        self._session = None
+        self._running = False
+
+    def subscription_rpc(self, xpath):
+        """
+        Create establish-subscription RPC
+
+        Parameters:
+            xpath (str): YANG-push xpath filter
+
+        Returns:
+            str: XML of the RPC
+        """
+
+        if self.on_change:
+            trigger = "<yp:dampening-period>0</yp:dampening-period>"
+        else:
+            trigger = "<yp:period>{}</yp:period>".format(self.period)
+        return ESTABLISH_SUBSCRIPTION_RPC.format(event_ns = EVENT_NOTIFICATIONS_NS, push_ns = YANG_PUSH_NS,
+            xpath = xpath, trigger = trigger)
+
+    def start(self, receiver, on_error = None):
+        """
+        Connect to the router, establish the subscriptions and start a thread which passes
+        the notifications to the receiver.
+
+        Parameters:
+            receiver (TelemetryReceiver): receiver of the updates
+            on_error: callback function called if the session is lost, called in the form: on_error(exception)
+
+        Raises:
+            ConnectionError: a subscription was rejected, the session is closed
+        """
+
+        self._session = self._connect(self.router_ip, self.port, self._username, self._password)
+        try:
+            for name, sub in receiver.subscriptions.items():
+                self.subscription_ids[name] = decode_subscription_reply(self._session.establish(self.subscription_rpc(sub["xpath"])))
+                logger.info("Telemetry subscription {}: id {}".format(name, self.subscription_ids[name]))
+        except Exception:
+            self.stop()
+            raise
+        self._running = True
+        _thread.start_new_thread(self._notification_loop, (receiver, on_error))
+
+    def _notification_loop(self, receiver, on_error):
+        while self._running:
+            try:
+                notification = self._session.take_notification(5)
+                if notification is not None:
+                    receiver.handle_notification(notification)
+                elif not self._session.connected:
+                    raise ConnectionError("NETCONF session closed")
+            except Exception as e:
+                if not self._running:
+                    return
+                logger.error("Telemetry session exception: {}".format(e))
+                self.stop()
+                if on_error is not None:
+                    on_error(e)
+
+    def stop(self):
+        """
+        Stop the notification thread and close the NETCONF session. Subscriptions are removed
+        by the router when the session is closed.
+        """
+
+        self._running = False
+        session, self._session = self._session, None
+        if session is not None:
+            try:
+                session.close()
+            except Exception:
+                pass
+
+class LocalTelemetryPublisher:
+    """
+    Local stand-in for the router's NETCONF session, used by NetconfYangPush instead of ncclient for testing
+    without a router. The establish-subscription RPCs are decoded (xpath filter, period) and replied as by
+    IOS-XE, the notifications are generated from a sample function and pass the same decoding as the router's.
+    """
+
+    def __init__(self, sample = synthetic_sample, subscriptions = SUBSCRIPTIONS, on_change_period = 1.0):
+        """
+        Initialize the LocalTelemetryPublisher object
+
+        Parameters:
+            sample: function returning dict of metric name -> XML contents of the update container,
+                for example {"cpu": "<cpu-utilization><five-seconds>3</five-seconds>...</cpu-utilization>"}
+            subscriptions (dict): subscription definitions, see SUBSCRIPTIONS
+            on_change_period (float): update period [s] of the on-change subscriptions
+        """
+
+        self._sample = sample
+        self.subscriptions = subscriptions
+        self.on_change_period = on_change_period
+        self.connected = True
+        self._established = {} # subscription id -> {"name", "period", "next"}
+        self._pending = []
+        self._next_id = 2147483648
+
+    def establish(self, rpc_xml):
+        """
+        Decode establish-subscription RPC and reply to it.
+
+        Returns:
+            str: XML of the rpc-reply
+        """
+
+        xpath = period = None
+        for element in ET.fromstring(rpc_xml).iter():
+            if _local_name(element.tag) == "xpath-filter":
+                xpath = (element.text or "").strip()
+            elif _local_name(element.tag) == "period":
+                period = int(element.text) / 100
+        name = next((name for name, sub in self.subscriptions.items() if sub["xpath"] == xpath), None)
+        if name is None:
+            return self.reply("notif-bis:error-no-such-option")
+        subscription_id = str(self._next_id)
+        self._next_id += 1
+        self._established[subscription_id] = {"name": name, "period": period or self.on_change_period, "next": time.monotonic()}
+        return self.reply("notif-bis:ok", subscription_id)
+
+    @staticmethod
+    def reply(result, subscription_id = None):
+        return ("<rpc-reply xmlns=\"urn:ietf:params:xml:ns:netconf:base:1.0\" message-id=\"urn:uuid:0\">"
+            "<subscription-result xmlns=\"{0}\" xmlns:notif-bis=\"{0}\">{1}</subscription-result>{2}</rpc-reply>").format(
+            EVENT_NOTIFICATIONS_NS, result, "<subscription-id xmlns=\"{}\">{}</subscription-id>".format(
+            EVENT_NOTIFICATIONS_NS, subscription_id) if subscription_id else "")
+
+    def notification(self, subscription_id, name, contents):
+        """
+        Create push-update notification XML
+
+        Parameters:
+            subscription_id (str): id of the subscription
+            name (str): metric name, see SUBSCRIPTIONS
+            contents (str): XML contents of the update container
+
+        Returns:
+            str: XML of the notification
+        """
+
+        sub = self.subscriptions[name]
+        return ("<notification xmlns=\"{}\"><eventTime>{}</eventTime>"
+            "<push-update xmlns=\"{}\"><subscription-id>{}</subscription-id><datastore-contents-xml>"
+            "<{} xmlns=\"{}\">{}</{}></datastore-contents-xml></push-update></notification>").format(
+            NOTIFICATION_NS, datetime.now(timezone.utc).isoformat(), YANG_PUSH_NS, subscription_id,
+            sub["container"], sub["namespace"], contents, sub["container"])
+
+    def take_notification(self, timeout):
+        """
+        Wait for the next notification of the established subscriptions.
+
+        Returns:
+            str: XML of the notification, None if no notification is due within the timeout [s]
+        """
+
+        if not self._pending:
+            if not self.connected or not self._established:
+                time.sleep(timeout)
+                return None
+            due = min(sub["next"] for sub in self._established.values())
+            delay = due - time.monotonic()
+            if delay > timeout:
+                time.sleep(timeout)
+                return None
+            time.sleep(max(0.0, delay))
+            sample = self._sample()
+            for subscription_id, sub in self._established.items():
+                if sub["next"] <= due:
+                    if sub["name"] in sample:
+                        self._pending.append(self.notification(subscription_id, sub["name"], sample[sub["name"]]))
+                    sub["next"] = due + sub["period"]
+        return self._pending.pop(0) if self._pending else None
+
+    def close(self):
+        self.connected = False
+        self._established = {}
+        self._pending = []
@@ -0,0 +1,18 @@
+import unittest
+from metric_history import MetricHistory
+
+class MetricHistoryTest(unittest.TestCase):
+
+    def test_trend_of_step_change(self):
+        history = MetricHistory("cpu")
+        now = 1000000.0
+        # 1 hour of 5 s samples, 10% in the older half and 30% in the newer one
+        for index in range(720):
+            timestamp = now - 3600 + index * 5
+            history.add(10 if timestamp < now - 1800 else 30, timestamp)
+        self.assertEqual(history.summary(1800, now - 1800)["avg"], 10.0)
+        self.assertEqual(history.summary(1800, now)["avg"], 30.0)
+        self.assertEqual(history.trend(3600, now), 20.0)
+
+if __name__ == "__main__":
+    unittest.main()
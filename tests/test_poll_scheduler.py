@@ -0,0 +1,36 @@
+import time
+import unittest
+from poll_scheduler import PollScheduler
+
+class PollSchedulerTest(unittest.TestCase):
+
+    def test_stale_load_releases_backoff(self):
+        scheduler = PollScheduler()
+        scheduler.set_visible(True)
+        scheduler.add("cpu", lambda: None, 10)
+        scheduler.add("memory", lambda: None, 10, 60)
+        cpu_task, memory_task = scheduler._tasks["cpu"], scheduler._tasks["memory"]
+        scheduler._running_task = cpu_task
+        scheduler.report_load(95)
+        scheduler._running_task = None
+        scheduler.record(cpu_task, 0.1)
+        self.assertGreater(scheduler.backoff, 1)
+
+        # the CPU task doesn't run while the page is hidden, its last sample must not keep the backoff
+        scheduler.set_visible(False)
+        self.assertIsNone(scheduler.current_load())
+        for _ in range(10):
+            scheduler.record(memory_task, 0.1)
+        self.assertEqual(scheduler.backoff, 1)
+
+    def test_old_load_is_ignored(self):
+        scheduler = PollScheduler()
+        scheduler.set_visible(True)
+        scheduler.add("cpu", lambda: None, 10)
+        cpu_task = scheduler._tasks["cpu"]
+        scheduler._running_task = cpu_task
+        scheduler.report_load(95)
+        scheduler._running_task = None
+        now = time.monotonic()
+        self.assertEqual(scheduler.current_load(now), 95)
+        self.assertIsNone(scheduler.current_load(now + 10 * scheduler.backoff + 11))
@@ -0,0 +1,15 @@
+import unittest
+from route_view import JSONArrayStream
+
+class JSONArrayStreamTest(unittest.TestCase):
+
+    def test_multibyte_character_split_between_chunks(self):
+        document = '{"ietf-routing:route": [{"destination-prefix": "10.0.0.0/8", "description": "Zürich"}]}'.encode()
+        split = document.index("ü".encode()) + 1
+        parser = JSONArrayStream("ietf-routing:route")
+        items = parser.feed(document[:split]) + parser.feed(document[split:])
+        self.assertEqual(items, [{"destination-prefix": "10.0.0.0/8", "description": "Zürich"}])
+        self.assertTrue(parser.done)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import threading
+import time
+import unittest
+from codec_rpc import OutboundQueue, RPCError
+from rpc_register import RPCRegister
+from supervisor import Connection, ConnectionSupervisor
+
+class SilentRegister(RPCRegister):
+    """
+    Register of a codec which never responds
+    """
+
+    def __init__(self):
+        super().__init__(rpc_timeout = 30)
+        self._outbound = OutboundQueue(lambda data: None, on_error = self._send_failed)
+        self._outbound.start()
+
+    def close(self):
+        self._outbound.stop()
+        self.drain_requests()
+
+class ConnectionSupervisorTest(unittest.TestCase):
+
+    def test_session_returns_after_close(self):
+        supervisor = ConnectionSupervisor("ws://codec/ws", lambda connection: None)
+        connection = Connection(None, 1)
+        connection.rpc = SilentRegister()
+        errors = []
+
+        def session():
+            # for example the panel resync or the feedback subscriptions
+            for _ in range(2):
+                try:
+                    connection.rpc.send_rpc_message("xGet", {"Path": ["Status"]}).wait()
+                except RPCError as e:
+                    errors.append(e)
+
+        thread = threading.Thread(target = session)
+        start = time.monotonic()
+        thread.start()
+        time.sleep(0.2)
+        supervisor._closed(connection)
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(len(errors), 2)
@@ -0,0 +1,31 @@
+import asyncio
+import unittest
+from ui_dispatch import AsyncUIDispatcher
+
+class AsyncUIDispatcherTest(unittest.TestCase):
+
+    def test_coalesce_and_drop(self):
+        values = []
+
+        async def handler(codec_rpc, action):
+            values.append(action["Value"])
+            await asyncio.sleep(0.05)
+
+        async def run():
+            dispatcher = AsyncUIDispatcher()
+            dispatcher.register("rt_filter", "released", handler, coalesce = True)
+            dispatcher.register("sh_ver", "clicked", handler)
+            for value in ("a", "b", "c"):
+                dispatcher.dispatch(None, {"WidgetId": "rt_filter", "Type": "released", "Value": value})
+                dispatcher.dispatch(None, {"WidgetId": "sh_ver", "Type": "clicked", "Value": value})
+            while dispatcher.pending():
+                await asyncio.sleep(0.01)
+            return dispatcher.stats()
+
+        stats = asyncio.get_event_loop().run_until_complete(run())
+        # the latest coalesced action runs after the first one, the repeated clicks are dropped
+        self.assertEqual(values, ["a", "a", "c"])
+        self.assertEqual(stats["rt_filter/released"]["calls"], 2)
+        self.assertEqual(stats["rt_filter/released"]["coalesced"], 2)
+        self.assertEqual(stats["sh_ver/clicked"]["calls"], 1)
+        self.assertEqual(stats["sh_ver/clicked"]["dropped"], 2)
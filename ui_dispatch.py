@@ -0,0 +1,222 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from profiling import PROFILER
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_UI_WORKERS = 2
+MAX_UI_PENDING = 8
+
+class UIDispatcher:
+    """
+    Run the UI event handlers on a bounded worker pool instead of the websocket receive thread.
+    Handlers are registered for a WidgetId and action type. While a handler is running for a widget,
+    repeated actions on the same widget are dropped (or coalesced into one re-run).
+    """
+
+    def __init__(self, max_workers = DEFAULT_UI_WORKERS, max_pending = MAX_UI_PENDING):
+        """
+        Initialize the UIDispatcher object
+
+        Parameters:
+            max_workers (int): number of worker threads, 0 - no worker pool (AsyncUIDispatcher)
+            max_pending (int): maximum number of queued or running handlers, other actions are dropped
+        """
+
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers = max_workers, thread_name_prefix = "ui") if max_workers else None
+        self._lock = threading.Lock()
+        self._handlers = {} # (widget_id, action type) -> {"handler", "coalesce"}
+        self._in_flight = {} # (widget_id, action type) -> latest coalesced action or None
+        self._stats = {}
+        self.dropped = 0
+
+    def register(self, widget_id, action_type, handler, coalesce = False):
+        """
+        Register a handler
+
+        Parameters:
+            widget_id (str): widget id
+            action_type (str): action type, for example "clicked", "pressed", "changed"
+            handler: function called in the form: handler(codec_rpc, action), a coroutine function in AsyncUIDispatcher
+            coalesce (bool): if the handler is running, run it once more with the latest action
+                after it finishes, otherwise the action is dropped
+        """
+
+        self._handlers[(widget_id, action_type)] = {
+            "handler": handler,
+            "coalesce": coalesce
+        }
+        self._stats[(widget_id, action_type)] = self._new_stats()
+
+    @staticmethod
+    def _new_stats():
+        return {
+            "calls": 0,
+            "errors": 0,
+            "dropped": 0,
+            "coalesced": 0,
+            "latency_total": 0.0,
+            "latency_max": 0.0,
+            "latency_last": 0.0
+        }
+
+    def dispatch(self, codec_rpc, action):
+        """
+        Submit the handler for the widget action.
+
+        Parameters:
+            codec_rpc: CodecRPCRegister or AsyncCodecRPC object for communication with the codec
+            action (dict): Widget Action part of the UI event, contains "WidgetId", "Type" and "Value"
+
+        Returns:
+            bool: True if the handler was submitted
+        """
+
+        key = (action.get("WidgetId"), action.get("Type"))
+        reg = self._handlers.get(key)
+        if reg is None:
+            return False
+        with self._lock:
+            if key in self._in_flight:
+                if reg["coalesce"]:
+                    self._in_flight[key] = action
+                    self._stats[key]["coalesced"] += 1
+                else:
+                    self._stats[key]["dropped"] += 1
+                logger.info("Handler for {} {} is running, action {}".format(key[0], key[1],
+                    "coalesced" if reg["coalesce"] else "dropped"))
+                return False
+            if len(self._in_flight) >= self.max_pending:
+                self.dropped += 1
+                logger.warning("UI dispatcher busy, action {} {} dropped".format(key[0], key[1]))
+                return False
+            self._in_flight[key] = None
+        self._start(key, reg["handler"], codec_rpc, action)
+        return True
+
+    def submit(self, name, function, *args):
+        """
+        Run a background job (for example the panel pop-up after a Panel/Save) on the worker pool
+        instead of a new thread. The job counts to max_pending, it's not submitted again while it's running.
+
+        Parameters:
+            name (str): job name, shown in the statistics as "name/job"
+            function: function called in the form: function(*args)
+
+        Returns:
+            bool: True if the job was submitted
+        """
+
+        key = (name, "job")
+        with self._lock:
+            if key in self._in_flight or len(self._in_flight) >= self.max_pending:
+                self.dropped += 1
+                logger.warning("UI dispatcher busy, job {} dropped".format(name))
+                return False
+            self._in_flight[key] = None
+            self._stats.setdefault(key, self._new_stats())
+        self._start(key, lambda codec_rpc, action: function(*args), None, None)
+        return True
+
+    def _start(self, key, handler, codec_rpc, action):
+        self._executor.submit(self._run, key, handler, codec_rpc, action)
+
+    def _run(self, key, handler, codec_rpc, action):
+        while True:
+            start = time.monotonic()
+            error = False
+            try:
+                with PROFILER.section("ui/{}/{}".format(*key)):
+                    handler(codec_rpc, action)
+            except Exception as e:
+                error = True
+                logger.error("UI handler {} {} exception: {}".format(key[0], key[1], e))
+            action = self._finished(key, time.monotonic() - start, error)
+            if action is None:
+                return
+            logger.debug("Running coalesced action %s %s", key[0], key[1])
+
+    def _finished(self, key, latency, error):
+        """
+        Record the handler run.
+
+        Returns:
+            dict: latest action coalesced while the handler was running, None if the handler is done
+        """
+
+        with self._lock:
+            stats = self._stats[key]
+            stats["calls"] += 1
+            stats["errors"] += int(error)
+            stats["latency_total"] += latency
+            stats["latency_max"] = max(stats["latency_max"], latency)
+            stats["latency_last"] = latency
+            action = self._in_flight.get(key)
+            if action is None:
+                self._in_flight.pop(key, None)
+                return None
+            self._in_flight[key] = None
+            return action
+
+    def pending(self):
+        """
+        Get the number of queued or running handlers.
+        """
+
+        with self._lock:
+            return len(self._in_flight)
+
+    def stats(self):
+        """
+        Get per-handler statistics.
+
+        Returns:
+            dict: "widget_id/action" -> calls, errors, dropped and coalesced actions, average, maximum
+                and last handler latency in seconds
+        """
+
+        result = {}
+        with self._lock:
+            for key, stats in self._stats.items():
+                res = dict(stats)
+                latency_total = res.pop("latency_total")
+                res["latency_avg"] = round(latency_total / res["calls"], 4) if res["calls"] else 0.0
+                res["latency_max"] = round(res["latency_max"], 4)
+                res["latency_last"] = round(res["latency_last"], 4)
+                result["{}/{}".format(*key)] = res
+        return result
+
+    def shutdown(self, wait = False):
+        if self._executor is not None:
+            self._executor.shutdown(wait = wait)
+
+class AsyncUIDispatcher(UIDispatcher):
+    """
+    UIDispatcher of the asyncio front ends (codec_async.py, multi_codec.py). The handlers are coroutine
+    functions run as tasks in the event loop, the dropping, coalescing and statistics are the same.
+    """
+
+    def __init__(self, max_pending = MAX_UI_PENDING):
+        super().__init__(max_workers = 0, max_pending = max_pending)
+
+    def _start(self, key, handler, codec_rpc, action):
+        asyncio.ensure_future(self._run_async(key, handler, codec_rpc, action))
+
+    async def _run_async(self, key, handler, codec_rpc, action):
+        while True:
+            start = time.monotonic()
+            error = False
+            try:
+                with PROFILER.section("ui/{}/{}".format(*key), profile = False):
+                    await handler(codec_rpc, action)
+            except Exception as e:
+                error = True
+                logger.error("UI handler {} {} exception: {}".format(key[0], key[1], e))
+            action = self._finished(key, time.monotonic() - start, error)
+            if action is None:
+                return
+            logger.debug("Running coalesced action %s %s", key[0], key[1])
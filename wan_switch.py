@@ -0,0 +1,345 @@
+import json
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from route_view import rib_route
+from router_info import ROUTES_QUERY, DEFAULT_ROUTE_QUERY
+from metrics import WAN_SWITCH_DURATION, WAN_SWITCHES
+
+logger = logging.getLogger(__name__)
+
+# uplinks of the IR1101, each one has a static default route "ip route 0.0.0.0 0.0.0.0 <fwd> <distance>",
+# see WAN_SWITCH in config.py. The keys are the values of the "wan_path" GroupButton.
+DEFAULT_PATHS = {
+    "ethernet": {"fwd": "GigabitEthernet0/0/0", "label": "Ethernet"},
+    "lte": {"fwd": "Cellular0/1/0", "label": "LTE"}
+}
+PREFERRED_DISTANCE = 1 # administrative distance of the default route of the selected path
+BACKUP_DISTANCE = 10 # floating default routes of the other paths, used if the selected one goes down
+DEFAULT_PROBE_INTERVAL = 0.1 # seconds between the RIB polls until the new path is active
+DEFAULT_SWITCH_TIMEOUT = 30 # seconds
+DEFAULT_HISTORY_SIZE = 20
+
+DEFAULT_PREFIX = "0.0.0.0/0"
+
+# switchover results
+OK = "ok"
+REJECTED = "rejected" # the router refused the configuration change
+TIMEOUT = "timeout" # the default route didn't move to the new path in time
+ERROR = "error" # connection error
+BUSY = "busy" # another switchover is running
+
+def route_config(paths, selected, preferred = PREFERRED_DISTANCE, backup = BACKUP_DISTANCE):
+    """
+    PATCH body of the static default routes: the selected path gets the preferred administrative distance,
+    the other paths stay configured as floating routes with the backup distance
+
+    Parameters:
+        paths (dict): path name -> {"fwd"}, see DEFAULT_PATHS
+        selected (str): name of the new path
+        preferred (int): distance of the selected path
+        backup (int): distance of the other paths
+
+    Returns:
+        dict: Cisco-IOS-XE-native route node
+    """
+
+    fwd_list = [{"fwd": path["fwd"], "metric": preferred if name == selected else backup} for name, path in paths.items()]
+    return {"Cisco-IOS-XE-native:route": {"ip-route-interface-forwarding-list": [
+        {"prefix": "0.0.0.0", "mask": "0.0.0.0", "fwd-list": fwd_list}]}}
+
+def active_path(paths, rib_res):
+    """
+    Path used by the default route in the RIB
+
+    Parameters:
+        paths (dict): path name -> {"fwd", "next_hop"}, see DEFAULT_PATHS
+        rib_res (dict): response to DEFAULT_ROUTE_QUERY, None if not available
+
+    Returns:
+        str: path name, None if the default route doesn't use any of the paths
+    """
+
+    for route in (rib_res or {}).get("ietf-routing:route", []):
+        record = rib_route(route)
+        if record["prefix"] != DEFAULT_PREFIX:
+            continue
+        hops = set(record["next_hops"])
+        for name, path in paths.items():
+            if path["fwd"] in hops or path.get("next_hop") in hops:
+                return name
+    return None
+
+def path_label(paths, name):
+    return paths.get(name, {}).get("label", name)
+
+def format_switch(paths, result):
+    """
+    Format the switchover result to a string, for example "LTE active, config 0.21 s, converged 1.84 s"
+
+    Parameters:
+        paths (dict): path name -> {"label"}, see DEFAULT_PATHS
+        result (dict): see WanSwitch.switch()
+
+    Returns:
+        string: formatted result
+    """
+
+    label = path_label(paths, result["path"])
+    if result["result"] == OK:
+        return "{} active, config {:.2f} s, converged {:.2f} s".format(label, result["switch_s"], result["converge_s"])
+    if result["result"] == REJECTED:
+        return "{}: change rejected by the router".format(label)
+    if result["result"] == TIMEOUT:
+        return "{}: not active after {:.0f} s".format(label, result["converge_s"])
+    if result["result"] == BUSY:
+        return "switchover in progress"
+    return "{}: {}".format(label, result.get("error") or "failed")
+
+class SwitchHistory:
+    """
+    Last switchovers: time, path, result, configuration and convergence time. If a path is given,
+    the records are appended to a JSON lines file and the last ones are read on startup.
+    """
+
+    def __init__(self, size = DEFAULT_HISTORY_SIZE, path = None):
+        """
+        Initialize the SwitchHistory object
+
+        Parameters:
+            size (int): number of records kept in memory
+            path (str): history file, None means memory only
+        """
+
+        self.path = path
+        self.records = deque(maxlen = size)
+        self._lock = threading.Lock()
+        if path is not None:
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding = "utf-8") as history_file:
+                for line in history_file:
+                    try:
+                        self.records.append(json.loads(line))
+                    except ValueError:
+                        logger.warning("Invalid switchover record skipped: {:.80}".format(line))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning("Switchover history {} not loaded: {}".format(self.path, e))
+
+    def add(self, record):
+        with self._lock:
+            self.records.append(record)
+            if self.path is None:
+                return
+            try:
+                with open(self.path, "a", encoding = "utf-8") as history_file:
+                    history_file.write(json.dumps(record, separators = (",", ":")) + "\n")
+            except OSError as e:
+                logger.error("Switchover history {} not saved: {}".format(self.path, e))
+
+    def format(self, count = 5):
+        """
+        Format the convergence times of the last successful switchovers, for example "last 1.84 / 2.10 / 1.70 s, max 2.10 s"
+
+        Parameters:
+            count (int): number of the switchovers shown
+
+        Returns:
+            string: formatted result
+        """
+
+        with self._lock:
+            times = [record["converge_s"] for record in self.records if record["result"] == OK]
+            failed = sum(1 for record in self.records if record["result"] in (REJECTED, TIMEOUT, ERROR))
+        if not times:
+            return "no switchover yet" if not failed else "{} failed".format(failed)
+        result = "last {} s, max {:.2f} s".format(" / ".join("{:.2f}".format(value) for value in reversed(times[-count:])),
+            max(times))
+        if failed:
+            result += ", {} failed".format(failed)
+        return result
+
+def wan_switch_config(options):
+    """
+    Create the WanSwitch of the configuration
+
+    Parameters:
+        options (dict): WAN_SWITCH in config.py
+
+    Returns:
+        WanSwitch: switch with its history
+    """
+
+    return WanSwitch(options.get("paths", DEFAULT_PATHS),
+        preferred_distance = options.get("preferred_distance", PREFERRED_DISTANCE),
+        backup_distance = options.get("backup_distance", BACKUP_DISTANCE),
+        probe_interval = options.get("probe_interval", DEFAULT_PROBE_INTERVAL),
+        timeout = options.get("timeout", DEFAULT_SWITCH_TIMEOUT),
+        history = SwitchHistory(options.get("history_size", DEFAULT_HISTORY_SIZE), options.get("history_path")))
+
+class WanSwitch:
+    """
+    One-touch switchover of the WAN path. The administrative distances of the static default routes are changed
+    by a Restconf PATCH, then only the default route of the RIB is polled in a tight loop until it uses
+    the new path. The configuration time (PATCH round trip) and the convergence time (from the PATCH
+    to the first RIB poll showing the new path) are measured. The convergence time is the upper bound
+    of the interruption of the traffic (e.g. a video call) caused by the switch.
+    Only one switchover runs at a time, a concurrent request returns the BUSY result.
+    """
+
+    def __init__(self, paths = DEFAULT_PATHS, preferred_distance = PREFERRED_DISTANCE, backup_distance = BACKUP_DISTANCE,
+        probe_interval = DEFAULT_PROBE_INTERVAL, timeout = DEFAULT_SWITCH_TIMEOUT, history = None):
+        """
+        Initialize the WanSwitch object
+
+        Parameters:
+            paths (dict): path name -> {"fwd", "next_hop", "label"}, see DEFAULT_PATHS
+            preferred_distance (int): distance of the default route of the selected path
+            backup_distance (int): distance of the default routes of the other paths
+            probe_interval (float): delay [s] between the RIB polls
+            timeout (float): maximum convergence time [s]
+            history (SwitchHistory): switchover history, default is a memory-only history
+        """
+
+        self.paths = paths
+        self.preferred_distance = preferred_distance
+        self.backup_distance = backup_distance
+        self.probe_interval = probe_interval
+        self.timeout = timeout
+        self.history = history if history is not None else SwitchHistory()
+        self.active = None # path of the default route seen by the last RIB poll
+        self._busy = threading.Lock()
+
+    def _begin(self, path):
+        if path not in self.paths:
+            raise ValueError("Unknown WAN path {}".format(path))
+        logger.info("Switching WAN path to {}".format(path))
+        return route_config(self.paths, path, self.preferred_distance, self.backup_distance)
+
+    def _finish(self, path, result, start, configured = None, converged = None, probes = 0, error = None):
+        """
+        Record the switchover result
+
+        Returns:
+            dict: {"time", "path", "result", "switch_s", "converge_s", "probes", "error"}
+        """
+
+        end = converged or time.monotonic()
+        record = {
+            "time": datetime.now().isoformat()[:-7],
+            "path": path,
+            "result": result,
+            "switch_s": round(configured - start, 3) if configured is not None else None,
+            "converge_s": round(end - start, 3),
+            "probes": probes
+        }
+        if error:
+            record["error"] = error
+        WAN_SWITCHES.inc(path = path, result = result)
+        if configured is not None:
+            WAN_SWITCH_DURATION.observe(configured - start, path = path, phase = "switch")
+        if result == OK:
+            WAN_SWITCH_DURATION.observe(converged - start, path = path, phase = "convergence")
+        self.history.add(record)
+        logger.info("WAN switchover: {}".format(record))
+        return record
+
+    def switch(self, client, path):
+        """
+        Switch the default route to the path and wait until it's active
+
+        Parameters:
+            client (RestconfClient): router client
+            path (str): path name, key of paths
+
+        Returns:
+            dict: switchover record, see _finish(), {"path", "result": BUSY} if another switchover is running
+        """
+
+        body = self._begin(path)
+        if not self._busy.acquire(blocking = False):
+            return {"path": path, "result": BUSY}
+        start = time.monotonic()
+        configured = None
+        probes = 0
+        try:
+            if not client.patch(*ROUTES_QUERY, body):
+                return self._finish(path, REJECTED, start)
+            configured = time.monotonic()
+            deadline = configured + self.timeout
+            while True:
+                probes += 1
+                self.active = active_path(self.paths, client.get(*DEFAULT_ROUTE_QUERY))
+                now = time.monotonic()
+                if self.active == path:
+                    return self._finish(path, OK, start, configured, now, probes)
+                if now >= deadline:
+                    return self._finish(path, TIMEOUT, start, configured, probes = probes)
+                time.sleep(self.probe_interval)
+        except Exception as e:
+            return self._finish(path, ERROR, start, configured, probes = probes, error = str(e))
+        finally:
+            self._busy.release()
+
+    async def switch_async(self, client, path):
+        """
+        Switch the default route to the path and wait until it's active, see switch()
+
+        Parameters:
+            client (AsyncRestconfClient): router client
+            path (str): path name, key of paths
+
+        Returns:
+            dict: switchover record, see _finish()
+        """
+
+        import asyncio
+
+        body = self._begin(path)
+        if not self._busy.acquire(blocking = False):
+            return {"path": path, "result": BUSY}
+        start = time.monotonic()
+        configured = None
+        probes = 0
+        try:
+            if not await client.patch(*ROUTES_QUERY, body):
+                return self._finish(path, REJECTED, start)
+            configured = time.monotonic()
+            deadline = configured + self.timeout
+            while True:
+                probes += 1
+                self.active = active_path(self.paths, await client.get(*DEFAULT_ROUTE_QUERY))
+                now = time.monotonic()
+                if self.active == path:
+                    return self._finish(path, OK, start, configured, now, probes)
+                if now >= deadline:
+                    return self._finish(path, TIMEOUT, start, configured, probes = probes)
+                await asyncio.sleep(self.probe_interval)
+        except Exception as e:
+            return self._finish(path, ERROR, start, configured, probes = probes, error = str(e))
+        finally:
+            self._busy.release()
+
+    def widget_values(self, result, result_widget_id, history_widget_id):
+        """
+        Format the switchover result and the history for the panel
+
+        Parameters:
+            result (dict): see switch()
+            result_widget_id (str): widget of the last result
+            history_widget_id (str): widget of the convergence time history
+
+        Returns:
+            dict: widget id -> value
+        """
+
+        return {
+            result_widget_id: format_switch(self.paths, result),
+            history_widget_id: self.history.format()
+        }
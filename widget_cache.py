@@ -0,0 +1,270 @@
+import hashlib
+import logging
+import re
+import threading
+import time
+from codec_rpc import RPCError, PRIORITY_NORMAL, PRIORITY_PERIODIC
+from metrics import WIDGET_FRESHNESS
+
+logger = logging.getLogger(__name__)
+
+WIDGET_SET_VALUE = "xCommand/UserInterface/Extensions/Widget/SetValue"
+PANEL_UPDATE = "xCommand/UserInterface/Extensions/Panel/Update"
+
+class WidgetStateCache:
+    """
+    Client-side mirror of the codec's widget values and panel attributes. Only the changed values
+    are sent to the codec. Multiple updates of the same widget before flush() are sent as one message.
+    """
+
+    def __init__(self, codec_rpc):
+        """
+        Initialize the WidgetStateCache object
+
+        Parameters:
+            codec_rpc: CodecRPCRegister object for communication with the codec
+        """
+
+        self._codec_rpc = codec_rpc
+        self._lock = threading.Lock()
+        self._mirror = {} # (method, id, attribute) -> value known to be set on the codec
+        self._staged = {} # (method, id, attribute) -> (value to be sent by flush(), time it was staged)
+        self._stats = {
+            "sent": 0,
+            "saved": 0,
+            "coalesced": 0
+        }
+
+    def set_value(self, widget_id, value, flush = False, priority = PRIORITY_PERIODIC):
+        """
+        Set the widget value.
+
+        Parameters:
+            widget_id (str): widget id
+            value (str): widget value
+            flush (bool): send immediately, otherwise the value is sent by flush()
+            priority (int): outbound queue priority, see CodecRPCRegister.send_rpc_message()
+        """
+
+        self._stage((WIDGET_SET_VALUE, widget_id, "Value"), value)
+        if flush:
+            self.flush(priority)
+
+    def update_panel(self, panel_id, attribute, value, flush = False, priority = PRIORITY_PERIODIC):
+        """
+        Update the panel attribute (for example "Color").
+
+        Parameters:
+            panel_id (str): panel id
+            attribute (str): Panel/Update parameter
+            value (str): parameter value
+            flush (bool): send immediately, otherwise the value is sent by flush()
+            priority (int): outbound queue priority, see CodecRPCRegister.send_rpc_message()
+        """
+
+        self._stage((PANEL_UPDATE, panel_id, attribute), value)
+        if flush:
+            self.flush(priority)
+
+    def _stage(self, key, value):
+        # values are staged as soon as the router sample arrives, the staging time is the sample time
+        with self._lock:
+            if key in self._staged:
+                self._stats["coalesced"] += 1
+            self._staged[key] = (value, time.monotonic())
+
+    def flush(self, priority = PRIORITY_PERIODIC):
+        """
+        Send the staged values which differ from the codec's state.
+
+        Parameters:
+            priority (int): outbound queue priority, see CodecRPCRegister.send_rpc_message()
+
+        Returns:
+            list: RPCFuture of the sent messages
+        """
+
+        with self._lock:
+            staged = self._staged
+            self._staged = {}
+            changed = []
+            for key, (value, staged_at) in staged.items():
+                if key in self._mirror and self._mirror[key] == value:
+                    self._stats["saved"] += 1
+                else:
+                    self._mirror[key] = value
+                    changed.append((key, value, staged_at))
+            self._stats["sent"] += len(changed)
+        futures = []
+        for key, value, staged_at in changed:
+            method, item_id, attribute = key
+            if method == WIDGET_SET_VALUE:
+                params = {"WidgetId": item_id, attribute: value}
+                callback = lambda codec_rpc, msg_id, result, widget_id = item_id, staged_at = staged_at: \
+                    self._sent(codec_rpc, msg_id, result, widget_id, staged_at)
+            else:
+                params = {"PanelId": item_id, attribute: value}
+                callback = self._sent
+            futures.append(self._codec_rpc.send_rpc_message(method, params, callback, priority = priority))
+        return futures
+
+    def _sent(self, codec_rpc, msg_id, result, widget_id = None, staged_at = None):
+        """
+        Callback of the SetValue/Update requests. If the request failed, the codec's state is unknown.
+        Acknowledged widget values are recorded in the widget freshness metric.
+        """
+
+        if isinstance(result, RPCError):
+            logger.warning("Widget update {} failed, clearing the widget cache".format(msg_id))
+            self.invalidate()
+        elif widget_id is not None:
+            WIDGET_FRESHNESS.observe(time.monotonic() - staged_at, widget = widget_id)
+
+    def values(self, widget_ids = None):
+        """
+        Get the widget values known to be set on the codec.
+
+        Parameters:
+            widget_ids (list): return only these widgets, None means all
+
+        Returns:
+            dict: widget id -> value
+        """
+
+        with self._lock:
+            return {item_id: value for (method, item_id, attribute), value in self._mirror.items()
+                if method == WIDGET_SET_VALUE and (widget_ids is None or item_id in widget_ids)}
+
+    def user_value(self, widget_id, value):
+        """
+        Record a value set on the codec by the user (GroupButton selection, slider position, ...),
+        so a later set_value() of the previous value isn't skipped as unchanged.
+
+        Parameters:
+            widget_id (str): widget id
+            value (str): value of the widget action
+        """
+
+        with self._lock:
+            self._mirror[(WIDGET_SET_VALUE, widget_id, "Value")] = value
+
+    def invalidate(self):
+        """
+        Forget the codec's state, all subsequent values will be sent.
+        """
+
+        with self._lock:
+            self._mirror = {}
+
+    def resync(self):
+        """
+        Read the widget values from the codec and use them as the known state. Panel attributes
+        are forgotten. Should be called after (re)connect or after the panel was saved.
+
+        Returns:
+            RPCFuture: future resolved with the widget status, see status_widgets()
+        """
+
+        self.invalidate()
+        return self._codec_rpc.send_rpc_message("xGet", {"Path": ["Status", "UserInterface", "Extensions", "Widget"]},
+            self._resync_response, priority = PRIORITY_NORMAL)
+
+    def _resync_response(self, codec_rpc, msg_id, result):
+        if isinstance(result, RPCError):
+            logger.error("Widget resync failed: {}".format(result))
+            return
+        widgets = status_widgets(result)
+        with self._lock:
+            for widget in widgets:
+                key = (WIDGET_SET_VALUE, widget.get("WidgetId"), "Value")
+                self._mirror.setdefault(key, widget.get("Value", ""))
+        logger.info("Widget cache resynced, {} widgets".format(len(widgets)))
+
+    def stats(self):
+        """
+        Get the cache statistics.
+
+        Returns:
+            dict: "sent" messages, "saved" (suppressed unchanged values) and "coalesced" updates
+        """
+
+        with self._lock:
+            return dict(self._stats)
+
+def status_widgets(result):
+    """
+    Get the widget records from the xGet response of Status/UserInterface/Extensions/Widget
+
+    Returns:
+        list: {"WidgetId", "Value"} records
+    """
+
+    try:
+        return result["Status"]["UserInterface"]["Extensions"]["Widget"]
+    except (KeyError, TypeError):
+        return []
+
+class PanelRegistry:
+    """
+    Content hashes of the panels saved to the codec. The registry outlives the connections,
+    so after a reconnect an unchanged panel is not uploaded again (Panel/Save resets the widgets
+    and takes a while on the codec).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._saved = {} # panel id -> content hash
+
+    @staticmethod
+    def content_hash(panel):
+        return hashlib.sha256(panel.encode()).hexdigest()
+
+    def needs_save(self, panel_id, panel, widgets = None):
+        """
+        Check if the panel has to be saved to the codec.
+
+        Parameters:
+            panel_id (str): panel id
+            panel (str): XML definition of the panel
+            widgets (list): widget records currently on the codec (see status_widgets()), if given,
+                the panel is saved also when any of its widgets is missing (the codec was reset)
+
+        Returns:
+            bool: True if the panel is unknown, changed or missing on the codec
+        """
+
+        with self._lock:
+            if self._saved.get(panel_id) != self.content_hash(panel):
+                return True
+        if widgets is None:
+            return False
+        present = set(widget.get("WidgetId") for widget in widgets)
+        return not set(re.findall(r"<WidgetId>\s*(.*?)\s*</WidgetId>", panel)) <= present
+
+    def saved(self, panel_id, panel):
+        """
+        Record the panel content after a successful Panel/Save.
+        """
+
+        with self._lock:
+            self._saved[panel_id] = self.content_hash(panel)
+
+    def forget(self, panel_id):
+        with self._lock:
+            self._saved.pop(panel_id, None)
+
+    def export(self):
+        """
+        Get the saved panel hashes (panel id -> content hash), for example for a state snapshot.
+        """
+
+        with self._lock:
+            return dict(self._saved)
+
+    def load(self, saved):
+        """
+        Use the panel hashes from a previous run, see export().
+        """
+
+        with self._lock:
+            self._saved.update(saved)